@@ -1,9 +1,8 @@
 import argparse
+from itertools import count
 from pathlib import Path
 from typing import Annotated, Callable, Generator, Iterator
 
-import cv2
-import numpy as np
 import torch
 from encord.objects.common import Shape
 from encord.objects.coordinates import BoundingBoxCoordinates
@@ -14,6 +13,7 @@ from transformers import RTDetrForObjectDetection, RTDetrImageProcessor
 
 from encord_agents.core.data_model import Frame
 from encord_agents.core.utils import batch_iterator
+from encord_agents.core.video import iter_video_with_indices
 from encord_agents.tasks import Depends, Runner
 from encord_agents.tasks.dependencies import dep_asset
 
@@ -72,39 +72,9 @@ def iter_video_with_sampling_rate(
         sampling_rate: The proportion of frames to sample. 1/25 samples 1 frame per 25 frames.
     """
 
-    def _iter(video_path: Path) -> Generator[Frame, None, None]:
-        """
-        Args:
-            video_path: The file path to the video you wish to iterate.
-
-        Raises:
-            Exception: If the video file could not be opened properly.
-
-        Yields:
-            Frames from the video.
-        """
-        cap = cv2.VideoCapture(video_path.as_posix())
-        if not cap.isOpened():
-            raise Exception("Error opening video file.")
-
-        frame_num = 0
-        while True:
-            # Set the frame position before reading
-            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            yield Frame(frame=frame_num, content=rgb_frame.astype(np.uint8))
-
-            # Skip frames according to sampling rate
-            frame_num += int(1 / sampling_rate)
-
-        cap.release()
-
     def yield_from(video_path: Annotated[Path, Depends(dep_asset)]) -> Generator[Iterator[Frame], None, None]:
-        yield _iter(video_path)
+        # Decodes and skips the frames in between rather than seeking for every sampled frame
+        yield iter_video_with_indices(video_path, count(0, max(int(1 / sampling_rate), 1)))
 
     return yield_from
 
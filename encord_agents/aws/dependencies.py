@@ -1,6 +1,7 @@
 from encord_agents.core.dependencies.serverless import (
     DAssetPath,
     DEncordClient,
+    DImageBytes,
     DObjectCrops,
     DObjectsInstances,
     DSingleFrame,
@@ -8,6 +9,7 @@ from encord_agents.core.dependencies.serverless import (
     DVideoIterator,
     dep_asset,
     dep_client,
+    dep_image_bytes,
     dep_object_crops,
     dep_objects,
     dep_single_frame,
@@ -20,6 +22,8 @@ __all__ = [
     "dep_asset",
     "DEncordClient",
     "dep_client",
+    "DImageBytes",
+    "dep_image_bytes",
     "DObjectCrops",
     "dep_object_crops",
     "DObjectsInstances",
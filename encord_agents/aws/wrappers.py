@@ -14,7 +14,7 @@ from encord_agents import FrameData
 from encord_agents.core.constants import EDITOR_TEST_REQUEST_HEADER
 from encord_agents.core.data_model import EditorAgentResponse, LabelRowInitialiseLabelsArgs, LabelRowMetadataIncludeArgs
 from encord_agents.core.dependencies.models import Context
-from encord_agents.core.dependencies.utils import get_dependant, solve_dependencies
+from encord_agents.core.dependencies.utils import compile_dependant, get_dependant, solve_dependencies
 from encord_agents.core.exceptions import EncordEditorAgentException
 from encord_agents.core.utils import get_user_client
 
@@ -44,6 +44,7 @@ def editor_agent(
 
     def context_wrapper_inner(func: AgentFunction) -> Callable[[Dict[str, Any], Any], Dict[str, Any]]:
         dependant = get_dependant(func=func)
+        compile_dependant(dependant)
 
         @wraps(func)
         def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
@@ -0,0 +1,312 @@
+"""
+A local, size-bounded cache of downloaded assets.
+
+Without a cache, every dependency that needs the asset of a storage item downloads it anew,
+also when the same item passes through multiple stages. With a cache, assets are downloaded once and
+reused until the content of the storage item changes or the asset is evicted to make room for others.
+
+The cache is off by default. Enable it in code:
+
+```python
+from encord_agents.core.asset_cache import AssetCache, set_asset_cache
+
+set_asset_cache(AssetCache("/tmp/encord-agents-cache", max_bytes=50 * 1024**3))
+```
+
+or by setting the `ENCORD_AGENTS_ASSET_CACHE_DIR` and, optionally, `ENCORD_AGENTS_ASSET_CACHE_MAX_BYTES`
+environment variables, which also covers processes that you don't start yourself.
+
+Multiple processes can share a cache directory. Entries are published with atomic renames,
+so readers never see partially written files, and downloads of the same asset as well as evictions are
+serialized with file locks where the platform supports them. Without `fcntl`, e.g., on Windows, there are no
+locks, so concurrent agents may download the same asset more than once.
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Generator
+from uuid import uuid4
+
+from encord.storage import StorageItem
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+
+CACHE_DIR_ENV = "ENCORD_AGENTS_ASSET_CACHE_DIR"
+CACHE_MAX_BYTES_ENV = "ENCORD_AGENTS_ASSET_CACHE_MAX_BYTES"
+DEFAULT_MAX_BYTES = 10 * 1024**3
+
+
+@dataclass(frozen=True)
+class CacheStats:
+    """
+    The cache activity of the current process.
+    """
+
+    hits: int
+    misses: int
+    evictions: int
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+@contextmanager
+def _file_lock(path: Path) -> Generator[None, None, None]:
+    # Without fcntl, nothing is locked
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _link_or_copy(source: Path, target: Path) -> None:
+    try:
+        os.link(source, target)
+    except FileNotFoundError:
+        raise
+    except OSError:  # E.g., the file system doesn't support hard links
+        shutil.copyfile(source, target)
+
+
+class AssetCache:
+    """
+    Caches assets on disk, keyed by storage item UUID and content version.
+
+    The content version is the time at which the storage item was last edited together with its file size,
+    so an updated item is downloaded again. When the cache grows beyond `max_bytes`, the least recently used
+    assets are evicted. Assets that are larger than `max_bytes` on their own are not cached.
+
+    Cached assets are handed out as hard links (or copies, where hard links are not supported) in a temporary
+    directory, such that evicting an asset doesn't affect agents that are still using it.
+    Treat the files as read-only; modifying them in place would modify the cached asset.
+
+    Args:
+        directory: The directory to keep the assets in. Created if it doesn't exist.
+        max_bytes: Max total size of the cached assets.
+    """
+
+    def __init__(self, directory: str | Path, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        if max_bytes < 1:
+            raise ValueError("We require that `max_bytes` >= 1")
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.entries_dir = self.directory / "entries"
+        self.temp_dir = self.directory / "tmp"
+        self.locks_dir = self.directory / "locks"
+        for d in (self.entries_dir, self.temp_dir, self.locks_dir):
+            d.mkdir(parents=True, exist_ok=True)
+        self._stats_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def key(storage_item: StorageItem) -> str:
+        """
+        The cache key of the asset of a storage item.
+        """
+        last_edited_at = storage_item.last_edited_at
+        version = f"{last_edited_at.isoformat() if last_edited_at else ''}:{storage_item.file_size}"
+        return hashlib.sha256(f"{storage_item.uuid}:{version}".encode()).hexdigest()
+
+    @property
+    def stats(self) -> CacheStats:
+        with self._stats_lock:
+            return CacheStats(hits=self._hits, misses=self._misses, evictions=self._evictions)
+
+    def _count(self, hits: int = 0, misses: int = 0, evictions: int = 0) -> None:
+        with self._stats_lock:
+            self._hits += hits
+            self._misses += misses
+            self._evictions += evictions
+
+    @contextmanager
+    def lock(self, storage_item: StorageItem) -> Generator[None, None, None]:
+        """
+        Hold a lock for the asset of the storage item across processes and threads.
+
+        Hold it around `get` and `put`, such that concurrent agents download the same asset only once.
+        Every asset has its own lock, so only agents that wait for the same asset wait for its download.
+        On platforms without `fcntl`, e.g., Windows, this doesn't lock anything.
+        """
+        with _file_lock(self._lock_path(self.key(storage_item))):
+            yield
+
+    def _lock_path(self, key: str) -> Path:
+        return self.locks_dir / f"{key}.lock"
+
+    def _find(self, key: str) -> Path | None:
+        return next(self.entries_dir.glob(f"{key}*"), None)
+
+    def get(self, storage_item: StorageItem, destination: Path, name: str) -> Path | None:
+        """
+        Get the cached asset of the storage item.
+
+        Args:
+            storage_item: The storage item that the asset belongs to.
+            destination: The directory to place the asset in. Must be on the same file system as the cache
+                for the asset not to be copied, e.g., a subdirectory of `temp_dir`.
+            name: The file name of the asset, without suffix.
+
+        Returns:
+            The path of the asset in `destination` or None if the asset is not cached.
+        """
+        entry = self._find(self.key(storage_item))
+        if entry is not None:
+            target = destination / f"{name}{entry.suffix}"
+            try:
+                # Marks the entry as recently used
+                os.utime(entry)
+                _link_or_copy(entry, target)
+            except FileNotFoundError:  # Evicted in the meantime
+                pass
+            else:
+                self._count(hits=1)
+                return target
+        self._count(misses=1)
+        return None
+
+    def read(self, storage_item: StorageItem) -> bytearray | None:
+        """
+        Read the cached asset of the storage item into memory.
+
+        Returns:
+            The content of the asset or None if the asset is not cached.
+        """
+        entry = self._find(self.key(storage_item))
+        if entry is not None:
+            try:
+                os.utime(entry)
+                with open(entry, "rb") as f:
+                    buffer = bytearray(os.fstat(f.fileno()).st_size)
+                    f.readinto(buffer)
+            except FileNotFoundError:  # Evicted in the meantime
+                pass
+            else:
+                self._count(hits=1)
+                return buffer
+        self._count(misses=1)
+        return None
+
+    def put(self, storage_item: StorageItem, path: Path) -> None:
+        """
+        Add the asset of the storage item to the cache and evict the least recently used assets if needed.
+
+        Args:
+            storage_item: The storage item that the asset belongs to.
+            path: The downloaded asset. The file itself is left where it is.
+        """
+        if path.stat().st_size > self.max_bytes:
+            return
+        temp = self._temp_path(storage_item, path.suffix)
+        _link_or_copy(path, temp)
+        self._publish(temp)
+
+    def put_bytes(self, storage_item: StorageItem, content: bytes | bytearray, suffix: str) -> None:
+        """
+        Like `put`, but for an asset that was downloaded into memory.
+
+        Args:
+            storage_item: The storage item that the asset belongs to.
+            content: The content of the asset.
+            suffix: The file suffix of the asset, e.g., ".jpg".
+        """
+        if len(content) > self.max_bytes:
+            return
+        temp = self._temp_path(storage_item, suffix)
+        temp.write_bytes(content)
+        self._publish(temp)
+
+    def _temp_path(self, storage_item: StorageItem, suffix: str) -> Path:
+        return self.temp_dir / f"{self.key(storage_item)}-{uuid4().hex}{suffix}"
+
+    def _publish(self, temp: Path) -> None:
+        key = temp.name.split("-", 1)[0]
+        with _file_lock(self.directory / "evict.lock"):
+            os.replace(temp, self.entries_dir / f"{key}{temp.suffix}")
+            self._evict()
+
+    def _evict(self) -> None:
+        entries: list[tuple[float, int, Path]] = []
+        for entry in os.scandir(self.entries_dir):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, Path(entry.path)))
+        total = sum(size for _, size, _ in entries)
+        # The newest entry has the latest modification time, so it is evicted last
+        for _, size, path in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            # At worst, an agent that still holds the lock of the asset races another one to download it again
+            self._lock_path(path.stem).unlink(missing_ok=True)
+            total -= size
+            self._count(evictions=1)
+
+    def size_bytes(self) -> int:
+        """
+        The total size of the cached assets.
+        """
+        return sum(entry.stat().st_size for entry in os.scandir(self.entries_dir))
+
+    def clear(self) -> None:
+        """
+        Remove all cached assets.
+        """
+        with _file_lock(self.directory / "evict.lock"):
+            for d in (self.entries_dir, self.locks_dir):
+                for entry in os.scandir(d):
+                    Path(entry.path).unlink(missing_ok=True)
+
+
+_asset_cache: AssetCache | None = None
+_asset_cache_configured = False
+_asset_cache_lock = threading.Lock()
+
+
+def get_asset_cache() -> AssetCache | None:
+    """
+    Get the asset cache of the process or None if assets are not cached.
+
+    Unless `set_asset_cache` was called, the cache is configured from the `ENCORD_AGENTS_ASSET_CACHE_DIR`
+    and `ENCORD_AGENTS_ASSET_CACHE_MAX_BYTES` environment variables.
+    """
+    global _asset_cache, _asset_cache_configured
+    with _asset_cache_lock:
+        if not _asset_cache_configured:
+            directory = os.environ.get(CACHE_DIR_ENV)
+            if directory:
+                max_bytes = int(os.environ.get(CACHE_MAX_BYTES_ENV, DEFAULT_MAX_BYTES))
+                _asset_cache = AssetCache(directory, max_bytes=max_bytes)
+            _asset_cache_configured = True
+        return _asset_cache
+
+
+def set_asset_cache(cache: AssetCache | None) -> None:
+    """
+    Set the asset cache of the process. With None, assets are not cached.
+    """
+    global _asset_cache, _asset_cache_configured
+    with _asset_cache_lock:
+        _asset_cache = cache
+        _asset_cache_configured = True
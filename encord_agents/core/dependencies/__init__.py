@@ -1,3 +1,3 @@
-from .models import Depends
+from .models import BatchDepends, Depends
 
-__all__ = ["Depends"]
+__all__ = ["Depends", "BatchDepends"]
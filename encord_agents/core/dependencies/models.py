@@ -1,5 +1,5 @@
 from dataclasses import dataclass, field
-from typing import Any, Callable, Optional
+from typing import Any, Callable, Literal, Mapping, Optional
 
 from encord.objects.ontology_labels_impl import LabelRowV2
 from encord.project import Project
@@ -8,16 +8,76 @@ from encord.workflow.stages.agent import AgentStage, AgentTask
 
 from encord_agents.core.data_model import FrameData
 
+DependencyScopeName = Literal["task", "batch", "stage", "process"]
+DEPENDENCY_SCOPES: tuple[DependencyScopeName, ...] = ("task", "batch", "stage", "process")
+"""Dependency scopes from the shortest to the longest lived."""
+
 
 class Depends:
-    def __init__(self, dependency: Optional[Callable[..., Any]] = None):
+    """
+    Declare a dependency of an agent (or of another dependency).
+
+    By default, the dependency is solved for every task and generator dependencies are torn down
+    once the agent is done with the task. Use `scope` to share the value for longer:
+
+    - `"batch"`: once per batch of tasks that the runner fetches.
+    - `"stage"`: once per stage for the duration of a runner run.
+    - `"process"`: once per process, e.g., for loading models.
+
+    Generator dependencies are torn down at the end of the scope.
+    A dependency can't depend on dependencies with a shorter scope, nor on the task, label row,
+    storage item or frame data unless it is task scoped.
+
+    **Example:**
+
+    ```python
+    def dep_model() -> Model:
+        return load_model()
+
+    @runner.stage("my stage")
+    def my_agent(model: Annotated[Model, Depends(dep_model, scope="process")]) -> str: ...
+    ```
+    """
+
+    def __init__(self, dependency: Optional[Callable[..., Any]] = None, *, scope: DependencyScopeName = "task"):
+        if scope not in DEPENDENCY_SCOPES:
+            raise ValueError(f"Unknown dependency scope `{scope}`. Valid scopes are {', '.join(DEPENDENCY_SCOPES)}")
         self.dependency = dependency
+        self.scope = scope
 
     def __repr__(self) -> str:
         attr = getattr(self.dependency, "__name__", type(self.dependency).__name__)
+        if self.scope != "task":
+            return f"{self.__class__.__name__}({attr}, scope={self.scope!r})"
         return f"{self.__class__.__name__}({attr})"
 
 
+class BatchDepends(Depends):
+    """
+    Declare a dependency that is solved once for a whole batch of tasks.
+
+    Like a batch agent, the dependency function takes lists with an entry per task, e.g.,
+    `list[StorageItem]`, and it returns a list with a value per task. Each task receives its own value.
+    This is for dependencies that are naturally bulk operations, like downloading assets concurrently.
+
+    The runners solve batch dependencies for a chunk of tasks before the agent is called on them.
+    Elsewhere, e.g., in editor agents, the function is called with lists of a single entry.
+    Generator batch dependencies are torn down when the runner's batch is done.
+
+    **Example:**
+
+    ```python
+    from encord_agents.tasks.dependencies import dep_single_frames
+
+    @runner.stage("my stage")
+    def my_agent(frame: Annotated[NDArray[np.uint8], BatchDepends(dep_single_frames)]) -> str: ...
+    ```
+    """
+
+    def __init__(self, dependency: Optional[Callable[..., Any]] = None):
+        super().__init__(dependency)
+
+
 @dataclass
 class _Field:
     name: str
@@ -32,6 +92,13 @@ class Dependant:
     field_params: list[_Field] = field(default_factory=list)
     needs_label_row: bool = False
     needs_storage_item: bool = False
+    needs_async: bool = False
+    scope: DependencyScopeName = "task"
+    batch: bool = False
+    """Whether this is a batch dependency, i.e., declared with `BatchDepends`."""
+    batch_params: list[str] = field(default_factory=list)
+    """Parameters of a batch agent (or batch dependency) that receive a list with a value per task."""
+    plan: Optional["ExecutionPlan"] = None
 
 
 @dataclass
@@ -42,9 +109,54 @@ class Context:
     frame_data: FrameData | None = None
     agent_stage: AgentStage | None = None
     storage_item: StorageItem | None = None
+    batch_values: dict[Callable[..., Any], Any] = field(default_factory=dict, repr=False)
+    """Values of dependencies that were solved ahead for a whole batch of tasks."""
 
 
 @dataclass
 class ParamDetails:
     type_annotation: Any
     depends: Optional[Depends]
+
+
+@dataclass(frozen=True)
+class PlanStep:
+    """
+    A dependency in an `ExecutionPlan` along with how to call it.
+    """
+
+    func: Callable[..., Any]
+    is_gen: bool
+    is_async_gen: bool
+    is_coroutine: bool
+    scope: DependencyScopeName
+    is_batch: bool
+    batch_params: tuple[str, ...]
+    dependency_args: tuple[tuple[str, int], ...]
+    """(parameter name, index of the step that provides the value)"""
+    field_args: tuple[tuple[str, Callable[[Context], Any]], ...]
+    """(parameter name, function that reads the value from the context)"""
+
+    def get_kwargs(self, solved: Mapping[int, Any] | list[Any], context: Context) -> dict[str, Any]:
+        kwargs = {name: solved[index] for name, index in self.dependency_args}
+        for name, get_value in self.field_args:
+            kwargs[name] = get_value(context)
+        return kwargs
+
+
+@dataclass(frozen=True)
+class ExecutionPlan:
+    """
+    A dependency tree compiled into a flat list of steps.
+
+    The steps are topologically sorted, i.e., every step comes after the steps
+    that it depends on, and every dependency function occurs once.
+    """
+
+    steps: tuple[PlanStep, ...]
+    dependency_args: tuple[tuple[str, int], ...]
+    field_args: tuple[tuple[str, Callable[[Context], Any]], ...]
+
+    @property
+    def has_batch_steps(self) -> bool:
+        return any(step.is_batch for step in self.steps)
@@ -0,0 +1,80 @@
+import asyncio
+import atexit
+import threading
+from contextlib import AsyncExitStack, ExitStack
+from typing import Any, Callable
+
+from encord_agents.core.dependencies.models import DependencyScopeName
+
+
+class DependencyScope:
+    """
+    Holds the values of dependencies that live for the duration of a scope.
+
+    Generator dependencies are torn down when the scope is closed.
+    A closed scope can be used again, in which case the dependencies are solved anew.
+    """
+
+    def __init__(self, name: DependencyScopeName) -> None:
+        self.name = name
+        self.discard()
+
+    def discard(self) -> None:
+        """
+        Forget all values without tearing them down.
+
+        This is for a forked process, which must not clean up the resources of its parent.
+        """
+        self.values: dict[Callable[..., Any], Any] = {}
+        # Resolved once the async dependency that is being solved is in `values`, or failed to be solved
+        self.pending: dict[Callable[..., Any], asyncio.Future[None]] = {}
+        self.stack = ExitStack()
+        self.async_stack = AsyncExitStack()
+        self.lock = threading.RLock()
+
+    def close(self) -> None:
+        """
+        Tear down the (sync) generator dependencies and forget all values.
+        """
+        with self.lock:
+            self.values.clear()
+            self.pending.clear()
+            self.stack.close()
+
+    async def aclose(self) -> None:
+        """
+        Tear down all generator dependencies, including async ones, and forget all values.
+        """
+        await self.async_stack.aclose()
+        self.close()
+
+    def __getstate__(self) -> dict[str, Any]:
+        # Values and locks don't cross process boundaries
+        return {"name": self.name}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.name = state["name"]
+        self.discard()
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.name!r})"
+
+
+PROCESS_SCOPE = DependencyScope("process")
+atexit.register(PROCESS_SCOPE.close)
+
+
+def get_scope(
+    name: DependencyScopeName, scopes: dict[DependencyScopeName, DependencyScope] | None
+) -> DependencyScope | None:
+    """
+    Get the scope in which a dependency with scope `name` should be cached.
+
+    The process scope is always available. Other scopes are only available where a
+    runner provides them; without one, the dependency is solved per call, like a task scoped one.
+    """
+    if scopes is not None and name in scopes:
+        return scopes[name]
+    if name == "process":
+        return PROCESS_SCOPE
+    return None
@@ -40,7 +40,14 @@ from typing_extensions import Annotated
 from encord_agents.core.data_model import Frame, FrameData, InstanceCrop
 from encord_agents.core.dependencies.models import Depends
 from encord_agents.core.dependencies.shares import DataLookup
-from encord_agents.core.utils import download_asset, get_user_client
+from encord_agents.core.utils import (
+    download_asset,
+    download_asset_bytes,
+    get_user_client,
+    get_video_streaming,
+    load_single_frame,
+    open_video,
+)
 
 
 def dep_client() -> EncordUserClient:
@@ -103,10 +110,38 @@ def dep_single_frame(storage_item: StorageItem, frame_data: FrameData) -> NDArra
             "Your data agent is depending on computer vision capabilities and `opencv` is not installed. Please install either `opencv-python` or `opencv-python-headless`."
         )
 
-    with download_asset(storage_item, frame=frame_data.frame) as asset:
-        img = cv2.cvtColor(cv2.imread(asset.as_posix()), cv2.COLOR_BGR2RGB)
+    return load_single_frame(storage_item, frame=frame_data.frame)
 
-    return np.asarray(img, dtype=np.uint8)
+
+def dep_image_bytes(storage_item: StorageItem, frame_data: FrameData) -> bytearray:
+    """
+    Dependency to inject the encoded image that the agent was triggered on, e.g., the content of a jpeg file.
+
+    The image is downloaded into memory only, which makes it fast to forward, e.g., to an LLM.
+    Only images and image groups are supported.
+
+    **Example:**
+
+    ```python
+    from encord_agents.gcp import editor_agent
+    from encord_agents.gcp.dependencies import dep_image_bytes
+    ...
+
+    @editor_agent()
+    def my_agent(
+        image: Annotated[bytearray, Depends(dep_image_bytes)]
+    ):
+        b64_image = base64.b64encode(image).decode()
+    ```
+
+    Args:
+        storage_item: The Storage item. Automatically injected (see example above).
+        frame_data: The frame data. Automatically injected (see example above).
+
+    Returns:
+        The encoded image.
+    """
+    return download_asset_bytes(storage_item, frame=frame_data.frame)
 
 
 def dep_asset(storage_item: StorageItem) -> Generator[Path, None, None]:
@@ -149,6 +184,8 @@ def dep_asset(storage_item: StorageItem) -> Generator[Path, None, None]:
 def dep_video_iterator(storage_item: StorageItem) -> Generator[Iterator[Frame], None, None]:
     """
     Dependency to inject a video frame iterator for performing operations over many frames.
+    With video streaming enabled, frames are decoded while the video is streamed where possible,
+    see `encord_agents.core.utils.open_video` and `encord_agents.core.utils.set_video_streaming`.
 
     **Example:**
 
@@ -181,7 +218,7 @@ def dep_video_iterator(storage_item: StorageItem) -> Generator[Iterator[Frame],
     if not storage_item.item_type == StorageItemType.VIDEO:
         raise NotImplementedError("`dep_video_iterator` only supported for video label rows")
 
-    with download_asset(storage_item, None) as asset:
+    with open_video(storage_item, stream=get_video_streaming()) as asset:
         yield iter_video(asset)
 
 
@@ -360,6 +397,11 @@ DSingleFrame = Annotated[NDArray[np.uint8], Depends(dep_single_frame)]
 Get the single frame that the agent was triggered on.
 """
 
+DImageBytes = Annotated[bytearray, Depends(dep_image_bytes)]
+"""
+Get the encoded image that the agent was triggered on, without writing it to disk.
+"""
+
 DAssetPath = Annotated[Path, Depends(dep_asset)]
 """
 Get a local file path to data asset temporarily stored till end of agent execution.
@@ -1,8 +1,9 @@
+import asyncio
 import inspect
-from contextlib import ExitStack, contextmanager
+from contextlib import AsyncExitStack, ExitStack, asynccontextmanager, contextmanager
 from copy import copy
 from dataclasses import dataclass
-from typing import Any, Callable, ForwardRef, Optional, cast
+from typing import Any, Callable, ForwardRef, Iterable, Mapping, Optional, cast
 
 from encord.objects.ontology_labels_impl import LabelRowV2
 from encord.project import Project
@@ -12,7 +13,21 @@ from pydantic._internal._typing_extra import eval_type_lenient as evaluate_forwa
 from typing_extensions import Annotated, get_args, get_origin
 
 from encord_agents.core.data_model import FrameData
-from encord_agents.core.dependencies.models import Context, Dependant, Depends, ParamDetails, _Field
+from encord_agents.core.dependencies.models import (
+    DEPENDENCY_SCOPES,
+    BatchDepends,
+    Context,
+    Dependant,
+    DependencyScopeName,
+    Depends,
+    ExecutionPlan,
+    ParamDetails,
+    PlanStep,
+    _Field,
+)
+from encord_agents.core.dependencies.scopes import DependencyScope, get_scope
+
+TASK_SPECIFIC_FIELD_TYPES = (AgentTask, LabelRowV2, StorageItem, FrameData)
 
 
 def get_typed_annotation(annotation: Any, globalns: dict[str, Any]) -> Any:
@@ -48,6 +63,7 @@ def get_dependant(
     dependant = Dependant(
         func=func,
         name=name,
+        needs_async=is_coroutine_callable(func) or is_async_gen_callable(func),
     )
     for param_name, param in signature_params.items():
         param_details = analyze_param(
@@ -63,6 +79,7 @@ def get_dependant(
             dependant.dependencies.append(sub_dependant)
             dependant.needs_label_row |= sub_dependant.needs_label_row
             dependant.needs_storage_item |= sub_dependant.needs_storage_item
+            dependant.needs_async |= sub_dependant.needs_async
         else:
             dependant.field_params.append(_Field(name=param_name, type_annotation=param_details.type_annotation))
             dependant.needs_label_row |= param_details.type_annotation is LabelRowV2
@@ -71,16 +88,54 @@ def get_dependant(
     return dependant
 
 
+def get_batch_dependant(*, func: Callable[..., Any], name: Optional[str] = None) -> Dependant:
+    """
+    Get the dependant of a batch agent (or a `BatchDepends` dependency), which is called with a whole batch of tasks at once.
+
+    Parameters annotated with `list[T]`, e.g., `list[AgentTask]` or `list[LabelRowV2]`, receive
+    a list with the value of `T` for every task. So do task scoped dependencies, which are solved per task.
+    `Project` and `AgentStage` parameters and dependencies with a longer scope are the same for
+    the whole batch and are passed as is.
+
+    Raises:
+        ValueError: If a parameter can't be provided to a batch agent.
+    """
+    dependant = get_dependant(func=func, name=name)
+    for param_field in dependant.field_params:
+        if get_origin(param_field.type_annotation) is list:
+            (param_field.type_annotation,) = get_args(param_field.type_annotation)
+            dependant.batch_params.append(param_field.name)
+            dependant.needs_label_row |= param_field.type_annotation is LabelRowV2
+            dependant.needs_storage_item |= param_field.type_annotation is StorageItem
+        elif param_field.type_annotation not in (Project, AgentStage):
+            raise ValueError(
+                f"`{get_func_name(func)}` is called with a whole batch of tasks but takes `{param_field.name}` of type "
+                f"`{param_field.type_annotation}`. Batches are passed as lists, so please annotate it as `list[{getattr(param_field.type_annotation, '__name__', param_field.type_annotation)}]`."
+            )
+    dependant.batch_params.extend(
+        sub_dependant.name
+        for sub_dependant in dependant.dependencies
+        if sub_dependant.name is not None and sub_dependant.scope == "task"
+    )
+    return dependant
+
+
 def get_param_sub_dependant(
     *,
     param_name: str,
     depends: Depends,
 ) -> Dependant:
     assert depends.dependency
-    return get_sub_dependant(
-        dependency=depends.dependency,
-        name=param_name,
-    )
+    if isinstance(depends, BatchDepends):
+        sub_dependant = get_batch_dependant(func=depends.dependency, name=param_name)
+        sub_dependant.batch = True
+    else:
+        sub_dependant = get_sub_dependant(
+            dependency=depends.dependency,
+            name=param_name,
+        )
+    sub_dependant.scope = depends.scope
+    return sub_dependant
 
 
 def get_sub_dependant(
@@ -158,55 +213,200 @@ def is_gen_callable(call: Callable[..., Any]) -> bool:
     return inspect.isgeneratorfunction(dunder_call)
 
 
+def is_async_gen_callable(call: Callable[..., Any]) -> bool:
+    if inspect.isasyncgenfunction(call):
+        return True
+    dunder_call = getattr(call, "__call__", None)  # noqa: B004
+    return inspect.isasyncgenfunction(dunder_call)
+
+
+def is_coroutine_callable(call: Callable[..., Any]) -> bool:
+    if inspect.iscoroutinefunction(call):
+        return True
+    if inspect.isclass(call):
+        return False
+    dunder_call = getattr(call, "__call__", None)  # noqa: B004
+    return inspect.iscoroutinefunction(dunder_call)
+
+
 def solve_generator(*, call: Callable[..., Any], stack: ExitStack, sub_values: dict[str, Any]) -> Any:
     cm = contextmanager(call)(**sub_values)
     return stack.enter_context(cm)
 
 
-def get_field_values(
-    deps: list[_Field], context: Context
-) -> dict[str, AgentTask | AgentStage | LabelRowV2 | Project | FrameData | StorageItem]:
-    values: dict[str, AgentTask | AgentStage | LabelRowV2 | Project | FrameData | StorageItem] = {}
-    for param_field in deps:
-        if param_field.type_annotation is FrameData:
+async def solve_async_generator(*, call: Callable[..., Any], stack: AsyncExitStack, sub_values: dict[str, Any]) -> Any:
+    cm = asynccontextmanager(call)(**sub_values)
+    return await stack.enter_async_context(cm)
+
+
+def get_field_getter(param_field: _Field) -> Callable[[Context], Any]:
+    """
+    Get a function that reads the value for a field parameter from the context.
+
+    Errors about values that are missing from the context (or unsupported types) are raised when the function is called.
+    """
+    name = param_field.name
+    type_annotation = param_field.type_annotation
+    if type_annotation is FrameData:
+
+        def get_frame_data(context: Context) -> FrameData:
             if context.frame_data is None:
                 raise ValueError(
                     "It looks like you're trying to access `frame_data` from a task agent. That is not supported, as task agents are not triggered from specific frames."
                 )
-            values[param_field.name] = context.frame_data
-        elif param_field.type_annotation is AgentTask:
+            return context.frame_data
+
+        return get_frame_data
+    elif type_annotation is AgentTask:
+
+        def get_task(context: Context) -> AgentTask:
             if context.task is None:
                 raise ValueError(
                     "It looks like you're trying to access an agent task from an editor agent. That is not supported, as editor agents are not associated with tasks."
                 )
-            values[param_field.name] = context.task
-        elif param_field.type_annotation is LabelRowV2:
+            return context.task
+
+        return get_task
+    elif type_annotation is LabelRowV2:
+
+        def get_label_row(context: Context) -> LabelRowV2:
             if context.label_row is None:
                 raise ValueError(
                     "Failed to parse dependency tree correctly. Context should have had a label row. Please contact support@encord.com with as much detail as you can (stacktrace, dependency, function declaration)"
                 )
-            values[param_field.name] = context.label_row
-        elif param_field.type_annotation is StorageItem:
+            return context.label_row
+
+        return get_label_row
+    elif type_annotation is StorageItem:
+
+        def get_storage_item(context: Context) -> StorageItem:
             if context.storage_item is None:
                 raise ValueError(
                     "Failed to parse dependency tree correctly. Context should have had a storage item. Please contact support@encord.com with as much detail as you can (stacktrace, dependency, function declaration)"
                 )
-            values[param_field.name] = context.storage_item
-        elif param_field.type_annotation is Project:
-            values[param_field.name] = context.project
-        elif param_field.type_annotation is AgentStage:
+            return context.storage_item
+
+        return get_storage_item
+    elif type_annotation is Project:
+        return lambda context: context.project
+    elif type_annotation is AgentStage:
+
+        def get_agent_stage(context: Context) -> AgentStage:
             if context.agent_stage is None:
                 raise ValueError(
                     "It looks like you're trying to access an agent stage from an editor agent. That is not supported, as editor agents are not associated with particular stages."
                 )
-            values[param_field.name] = context.agent_stage
-        else:
+            return context.agent_stage
+
+        return get_agent_stage
+
+    def unsupported(context: Context) -> Any:
+        raise ValueError(
+            f"Agent function is specifying a field `{name}` with type `{type_annotation}` "
+            "which is not supported. Consider wrapping it in a `encord_agents.core.dependencies.Depends` to define "
+            "how this value should be obtained. More info here: `https://agents-docs.encord.com/dependencies`"
+        )
+
+    return unsupported
+
+
+def get_func_name(func: Callable[..., Any] | None) -> str:
+    return getattr(func, "__name__", type(func).__name__)
+
+
+def validate_scope(dependant: Dependant, sub_dependant: Dependant) -> None:
+    """
+    Check that `sub_dependant` can be used by `dependant` and by the scope it is declared with.
+    """
+    name = get_func_name(sub_dependant.func)
+    if DEPENDENCY_SCOPES.index(sub_dependant.scope) < DEPENDENCY_SCOPES.index(dependant.scope):
+        raise ValueError(
+            f"Dependency `{get_func_name(dependant.func)}` with scope `{dependant.scope}` can't depend on "
+            f"`{name}`, which has the shorter scope `{sub_dependant.scope}`."
+        )
+    if sub_dependant.batch and sub_dependant.needs_async:
+        raise ValueError(
+            f"Batch dependency `{name}` is an `async def` function or depends on async dependencies. "
+            "Batch dependencies must be synchronous."
+        )
+    if sub_dependant.scope == "task":
+        return
+    for param_field in sub_dependant.field_params:
+        if param_field.type_annotation in TASK_SPECIFIC_FIELD_TYPES:
             raise ValueError(
-                f"Agent function is specifying a field `{param_field.name}` with type `{param_field.type_annotation}` "
-                "which is not supported. Consider wrapping it in a `encord_agents.core.dependencies.Depends` to define "
-                "how this value should be obtained. More info here: `https://agents-docs.encord.com/dependencies`"
+                f"Dependency `{name}` with scope `{sub_dependant.scope}` can't take the task specific field "
+                f"`{param_field.name}`. Only task scoped dependencies can."
             )
-    return values
+    func = cast(Callable[..., Any], sub_dependant.func)
+    if (is_async_gen_callable(func) or is_coroutine_callable(func)) and sub_dependant.scope in ("stage", "process"):
+        # E.g., an `httpx.AsyncClient` would outlive the event loop of the batch that created it
+        raise ValueError(
+            f"Async dependency `{name}` can't have scope `{sub_dependant.scope}`, "
+            "as the event loop that it is bound to is closed after every batch. Use `batch` scope instead."
+        )
+
+
+def compile_dependant(dependant: Dependant) -> ExecutionPlan:
+    """
+    Compile a dependency tree into a flat execution plan and store it on the dependant.
+
+    Walking the tree, inspecting the dependency functions and dispatching on field types
+    happens once here rather than for every call to `solve_dependencies`.
+    Like `solve_dependencies` used to, every dependency function is only called once,
+    even if multiple dependants depend on it.
+
+    Args:
+        dependant: The root of the dependency tree.
+
+    Returns:
+        The compiled plan. Also available as `dependant.plan`.
+
+    Raises:
+        ValueError: If the scopes of the dependencies are inconsistent.
+    """
+    steps: list[PlanStep] = []
+    step_index: dict[Callable[..., Any], int] = {}
+
+    def compile_fields(fields: list[_Field]) -> tuple[tuple[str, Callable[[Context], Any]], ...]:
+        return tuple((param_field.name, get_field_getter(param_field)) for param_field in fields)
+
+    def visit(node: Dependant) -> tuple[tuple[str, int], ...]:
+        dependency_args: list[tuple[str, int]] = []
+        for sub_dependant in node.dependencies:
+            func = cast(Callable[..., Any], sub_dependant.func)
+            validate_scope(node, sub_dependant)
+            if func in step_index:
+                if steps[step_index[func]].scope != sub_dependant.scope:
+                    raise ValueError(
+                        f"Dependency `{get_func_name(func)}` is used with both scope `{steps[step_index[func]].scope}` "
+                        f"and scope `{sub_dependant.scope}`. Please use the same scope everywhere."
+                    )
+            else:
+                sub_args = visit(sub_dependant)
+                step_index[func] = len(steps)
+                steps.append(
+                    PlanStep(
+                        func=func,
+                        is_gen=is_gen_callable(func),
+                        is_async_gen=is_async_gen_callable(func),
+                        is_coroutine=is_coroutine_callable(func),
+                        scope=sub_dependant.scope,
+                        is_batch=sub_dependant.batch,
+                        batch_params=tuple(sub_dependant.batch_params),
+                        dependency_args=sub_args,
+                        field_args=compile_fields(sub_dependant.field_params),
+                    )
+                )
+            if sub_dependant.name is not None:
+                dependency_args.append((sub_dependant.name, step_index[func]))
+        return tuple(dependency_args)
+
+    root_args = visit(dependant)
+    plan = ExecutionPlan(
+        steps=tuple(steps), dependency_args=root_args, field_args=compile_fields(dependant.field_params)
+    )
+    dependant.plan = plan
+    return plan
 
 
 def solve_dependencies(
@@ -215,35 +415,239 @@ def solve_dependencies(
     dependant: Dependant,
     stack: ExitStack,
     dependency_cache: Optional[dict[Callable[..., Any], Any]] = None,
+    scopes: Optional[dict[DependencyScopeName, DependencyScope]] = None,
 ) -> SolvedDependency:
-    values: dict[str, Any] = {}
+    """
+    Solve the dependencies of an agent for a single task (or editor agent call).
+
+    Task scoped generator dependencies are torn down when `stack` is closed.
+    Dependencies with a longer scope are looked up in, or added to, the matching scope in `scopes`.
+    The process scope is used if `scopes` doesn't provide one.
+    Values that were solved ahead for a batch (see `prepare_batch_dependencies`) are taken from the context.
+    """
+    plan = dependant.plan or compile_dependant(dependant)
     dependency_cache = dependency_cache if dependency_cache is not None else {}
-    sub_dependant: Dependant
-    for sub_dependant in dependant.dependencies:
-        sub_dependant.func = cast(Callable[..., Any], sub_dependant.func)
-        func = sub_dependant.func
+    solved: list[Any] = []
+    for step in plan.steps:
+        solved.append(solve_step(step, solved, context, stack, dependency_cache, scopes))
+
+    values: dict[str, Any] = {name: solved[index] for name, index in plan.dependency_args}
+    for name, get_value in plan.field_args:
+        values[name] = get_value(context)
+
+    return SolvedDependency(
+        values=values,
+        dependency_cache=dependency_cache,
+    )
+
 
-        if func in dependency_cache:
-            solved = dependency_cache[func]
+def solve_step(
+    step: PlanStep,
+    solved: Mapping[int, Any] | list[Any],
+    context: Context,
+    stack: ExitStack,
+    dependency_cache: dict[Callable[..., Any], Any],
+    scopes: Optional[dict[DependencyScopeName, DependencyScope]],
+) -> Any:
+    if step.func in dependency_cache:
+        return dependency_cache[step.func]
+    if step.func in context.batch_values:
+        value = context.batch_values[step.func]
+    else:
+        scope = get_scope(step.scope, scopes) if step.scope != "task" else None
+        if scope is None:
+            value = call_step(step, solved, context, stack)
         else:
-            solved_result = solve_dependencies(
-                context=context,
-                dependant=sub_dependant,
-                stack=stack,
-                dependency_cache=dependency_cache,
-            )
-            if is_gen_callable(func):
-                solved = solve_generator(call=func, stack=stack, sub_values=solved_result.values)
+            with scope.lock:
+                if step.func in scope.values:
+                    value = scope.values[step.func]
+                else:
+                    value = call_step(step, solved, context, scope.stack)
+                    scope.values[step.func] = value
+    dependency_cache[step.func] = value
+    return value
+
+
+def call_step(step: PlanStep, solved: Mapping[int, Any] | list[Any], context: Context, stack: ExitStack) -> Any:
+    kwargs = step.get_kwargs(solved, context)
+    if step.is_batch:
+        # Not solved ahead, so it's a batch of one
+        return call_batch_step(step, [kwargs], stack)[0]
+    if step.is_gen:
+        return solve_generator(call=step.func, stack=stack, sub_values=kwargs)
+    return step.func(**kwargs)
+
+
+def gather_batch_kwargs(kwargs_per_task: list[dict[str, Any]], batch_params: Iterable[str]) -> dict[str, Any]:
+    """
+    Turn the keyword arguments per task into the keyword arguments for a batch agent or dependency.
+
+    The values of `batch_params` are gathered into lists. The other values are taken from the first task.
+    """
+    if not kwargs_per_task:
+        return {}
+    batch_params = set(batch_params)
+    return {
+        name: [kwargs[name] for kwargs in kwargs_per_task] if name in batch_params else value
+        for name, value in kwargs_per_task[0].items()
+    }
+
+
+def call_batch_step(step: PlanStep, kwargs_per_task: list[dict[str, Any]], stack: ExitStack) -> list[Any]:
+    kwargs = gather_batch_kwargs(kwargs_per_task, step.batch_params)
+    if step.is_gen:
+        values = solve_generator(call=step.func, stack=stack, sub_values=kwargs)
+    else:
+        values = step.func(**kwargs)
+    if not isinstance(values, (list, tuple)) or len(values) != len(kwargs_per_task):
+        raise ValueError(
+            f"Batch dependency `{get_func_name(step.func)}` should return a list with a value per task. "
+            f"Got {type(values).__name__} for {len(kwargs_per_task)} tasks."
+        )
+    return list(values)
+
+
+def prepare_batch_dependencies(
+    *,
+    contexts: list[Context],
+    dependant: Dependant,
+    stack: ExitStack,
+    scopes: Optional[dict[DependencyScopeName, DependencyScope]] = None,
+) -> None:
+    """
+    Solve the batch dependencies (see `BatchDepends`) of `dependant` once for a batch of tasks.
+
+    The value for every task is stored in `context.batch_values`, where `solve_dependencies` picks it up.
+    So are the values of the dependencies that the batch dependencies depend on.
+    Generator dependencies among them are torn down when `stack` is closed.
+    """
+    plan = dependant.plan or compile_dependant(dependant)
+    if not plan.has_batch_steps or not contexts:
+        return
+    solved_per_context: list[dict[int, Any]] = [{} for _ in contexts]
+    # The indices of all the steps that a step depends on, directly or indirectly
+    required: list[set[int]] = []
+    for index, step in enumerate(plan.steps):
+        required.append(set().union(*({arg_index} | required[arg_index] for _, arg_index in step.dependency_args)))
+        if not step.is_batch:
+            continue
+        kwargs_per_task: list[dict[str, Any]] = []
+        for context, solved in zip(contexts, solved_per_context):
+            for required_index in sorted(required[index]):
+                if required_index not in solved:
+                    solved[required_index] = solve_step(
+                        plan.steps[required_index], solved, context, stack, context.batch_values, scopes
+                    )
+            kwargs_per_task.append(step.get_kwargs(solved, context))
+        values = call_batch_step(step, kwargs_per_task, stack)
+        for context, solved, value in zip(contexts, solved_per_context, values):
+            solved[index] = value
+            context.batch_values[step.func] = value
+
+
+async def call_step_async(
+    step: PlanStep,
+    solved: list[Any],
+    context: Context,
+    stack: ExitStack | AsyncExitStack,
+    async_stack: AsyncExitStack,
+) -> Any:
+    kwargs = step.get_kwargs(solved, context)
+    if step.is_async_gen:
+        return await solve_async_generator(call=step.func, stack=async_stack, sub_values=kwargs)
+    elif step.is_batch:
+        # Only `enter_context` is used, which an `AsyncExitStack` has as well
+        return call_batch_step(step, [kwargs], cast(ExitStack, stack))[0]
+    elif step.is_gen:
+        return stack.enter_context(contextmanager(step.func)(**kwargs))
+    elif step.is_coroutine:
+        return await step.func(**kwargs)
+    return step.func(**kwargs)
+
+
+async def solve_scoped_step_async(step: PlanStep, solved: list[Any], context: Context, scope: DependencyScope) -> Any:
+    """
+    Solve a scoped dependency exactly once, even if concurrent tasks need it at the same time.
+
+    Everything runs on the event loop thread, so the tasks that need the dependency while it's being
+    solved wait for it. If solving it fails, the next waiting task tries again.
+    """
+    while step.func not in scope.values:
+        pending = scope.pending.get(step.func)
+        if pending is not None:
+            await asyncio.wait({pending})
+            continue
+        pending = asyncio.get_running_loop().create_future()
+        scope.pending[step.func] = pending
+        try:
+            scope.values[step.func] = await call_step_async(step, solved, context, scope.stack, scope.async_stack)
+        finally:
+            scope.pending.pop(step.func, None)
+            pending.set_result(None)
+    return scope.values[step.func]
+
+
+async def solve_dependencies_async(
+    *,
+    context: Context,
+    dependant: Dependant,
+    stack: AsyncExitStack,
+    dependency_cache: Optional[dict[Callable[..., Any], Any]] = None,
+    scopes: Optional[dict[DependencyScopeName, DependencyScope]] = None,
+) -> SolvedDependency:
+    """
+    Async equivalent of `solve_dependencies`.
+
+    Coroutine functions are awaited and async generators are entered on the `AsyncExitStack`.
+    Regular functions and generators are resolved just like in `solve_dependencies`.
+    """
+    plan = dependant.plan or compile_dependant(dependant)
+    dependency_cache = dependency_cache if dependency_cache is not None else {}
+    solved: list[Any] = []
+    for step in plan.steps:
+        if step.func in dependency_cache:
+            value = dependency_cache[step.func]
+        elif step.func in context.batch_values:
+            value = context.batch_values[step.func]
+        else:
+            scope = get_scope(step.scope, scopes) if step.scope != "task" else None
+            if scope is None:
+                value = await call_step_async(step, solved, context, stack, stack)
             else:
-                solved = func(**solved_result.values)
-            dependency_cache.update({func: solved})
-        if sub_dependant.name is not None:
-            values[sub_dependant.name] = solved
+                value = await solve_scoped_step_async(step, solved, context, scope)
+            dependency_cache[step.func] = value
+        solved.append(value)
 
-    field_values = get_field_values(dependant.field_params, context)
-    values.update(field_values)
+    values: dict[str, Any] = {name: solved[index] for name, index in plan.dependency_args}
+    for name, get_value in plan.field_args:
+        values[name] = get_value(context)
 
     return SolvedDependency(
         values=values,
         dependency_cache=dependency_cache,
     )
+
+
+def solve_batch_dependencies(
+    *,
+    contexts: list[Context],
+    dependant: Dependant,
+    stack: ExitStack,
+    scopes: Optional[dict[DependencyScopeName, DependencyScope]] = None,
+) -> dict[str, Any]:
+    """
+    Solve the dependencies of a batch agent (see `get_batch_dependant`) for a batch of tasks.
+
+    Batch dependencies are solved once for all the tasks, the other dependencies are solved per task.
+    The values of the batch parameters are gathered into lists in the order of `contexts`.
+    The other parameters are taken from the first task.
+
+    Returns:
+        The keyword arguments for the batch agent.
+    """
+    prepare_batch_dependencies(contexts=contexts, dependant=dependant, stack=stack, scopes=scopes)
+    solved = [
+        solve_dependencies(context=context, dependant=dependant, stack=stack, scopes=scopes).values
+        for context in contexts
+    ]
+    return gather_batch_kwargs(solved, dependant.batch_params)
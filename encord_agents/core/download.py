@@ -0,0 +1,253 @@
+"""
+Downloading assets over a shared, pooled HTTP session.
+
+All downloads of the module go through a single `DownloadManager`, such that connections
+to the storage backends are kept alive and reused across assets and threads.
+Use `set_download_manager` to tune it, e.g.:
+
+```python
+from encord_agents.core.download import DownloadManager, set_download_manager
+
+set_download_manager(DownloadManager(max_workers=32, timeout=(5, 120)))
+```
+"""
+
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import BinaryIO, Callable, Sequence, TypeVar
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+T = TypeVar("T")
+
+TRANSIENT_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+CONTENT_RANGE_REGEX = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+
+
+class DownloadManager:
+    """
+    Downloads files over a pooled HTTP session.
+
+    Transient errors, i.e., connection errors, timeouts and responses with status 408, 429 or 5xx,
+    are retried with exponential backoff. Large files are downloaded in parallel range requests
+    if the server supports them. The first request asks for the first part only, so there is no
+    extra round trip for small files nor for servers that ignore ranges.
+
+    The manager is thread-safe.
+
+    Args:
+        chunk_size: Number of bytes read from the network and written to disk at a time.
+        timeout: Seconds to wait for a connection and between received bytes, respectively.
+        max_retries: Max number of times to retry a request after a transient error.
+        backoff_factor: Seconds to wait before the first retry. Doubles with every retry.
+        range_size: Size in bytes of the parts of large files. None disables range requests.
+        range_workers: Max number of parts of a single file that are downloaded at once.
+        max_workers: Max number of files that `download_many` downloads at once.
+    """
+
+    def __init__(
+        self,
+        *,
+        chunk_size: int = 1024 * 1024,
+        timeout: tuple[float, float] = (10.0, 60.0),
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        range_size: int | None = 16 * 1024 * 1024,
+        range_workers: int = 4,
+        max_workers: int = 8,
+    ) -> None:
+        if chunk_size < 1:
+            raise ValueError("We require that `chunk_size` >= 1")
+        if range_size is not None and range_size < 1:
+            raise ValueError("We require that `range_size` >= 1")
+        if range_workers < 1 or max_workers < 1:
+            raise ValueError("We require that `range_workers` >= 1 and `max_workers` >= 1")
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.range_size = range_size
+        self.range_workers = range_workers
+        self.max_workers = max_workers
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Start over with a new session.
+
+        This drops the pooled connections, e.g., in a forked process, which must not share them with its parent.
+        """
+        retry = Retry(
+            total=self.max_retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=TRANSIENT_STATUS_CODES,
+            allowed_methods=frozenset({"GET"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        # Enough connections for all files and all their parts at once
+        adapter = HTTPAdapter(
+            pool_connections=16, pool_maxsize=self.max_workers * self.range_workers, max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _with_retries(self, func: Callable[[], T]) -> T:
+        # The session retries failed requests. This retries failures while reading the body.
+        for retry in range(self.max_retries + 1):
+            try:
+                return func()
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+                if retry >= self.max_retries:
+                    raise
+                time.sleep(self.backoff_factor * 2**retry)
+        raise AssertionError("Unreachable")
+
+    def _write(self, response: requests.Response, f: BinaryIO) -> None:
+        for chunk in response.iter_content(chunk_size=self.chunk_size):
+            if chunk:
+                f.write(chunk)
+
+    def _get(self, url: str, byte_range: tuple[int, int] | None = None) -> requests.Response:
+        headers = {"Range": f"bytes={byte_range[0]}-{byte_range[1]}"} if byte_range else None
+        response = self.session.get(url, headers=headers, stream=True, timeout=self.timeout)
+        response.raise_for_status()
+        return response
+
+    def download(self, url: str, path: Path) -> Path:
+        """
+        Download the file at `url` to `path`.
+
+        Returns:
+            The path.
+
+        Raises:
+            requests.HTTPError: If the server responded with an error, after retries.
+        """
+        total = self._with_retries(lambda: self._download_first_part(url, path))
+        if total is not None and self.range_size is not None and total > self.range_size:
+            self._download_remaining_parts(url, path, total)
+        return path
+
+    def download_bytes(self, url: str) -> bytearray:
+        """
+        Download the file at `url` into memory.
+
+        Meant for small files, so the file is downloaded in a single request.
+
+        Returns:
+            The content of the file.
+
+        Raises:
+            requests.HTTPError: If the server responded with an error, after retries.
+        """
+        return self._with_retries(lambda: self._download_bytes(url))
+
+    def _download_bytes(self, url: str) -> bytearray:
+        with self._get(url) as response:
+            content_length = response.headers.get("Content-Length")
+            if content_length is None or response.headers.get("Content-Encoding"):
+                # Unknown size (or the size of the encoded content), so the buffer has to grow
+                buffer = bytearray()
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    buffer += chunk
+                return buffer
+
+            # Read straight into a preallocated buffer
+            buffer = bytearray(int(content_length))
+            view = memoryview(buffer)
+            position = 0
+            while position < len(buffer):
+                read = response.raw.readinto(view[position : position + self.chunk_size])
+                if not read:
+                    raise requests.exceptions.ChunkedEncodingError(
+                        f"Connection closed after {position} of {len(buffer)} bytes"
+                    )
+                position += read
+            return buffer
+
+    def _download_first_part(self, url: str, path: Path) -> int | None:
+        """
+        Download the whole file or, if the server supports ranges, the first part of it.
+
+        Returns:
+            The size of the whole file if only a part was downloaded.
+        """
+        byte_range = (0, self.range_size - 1) if self.range_size is not None else None
+        with self._get(url, byte_range) as response, open(path, "wb") as f:
+            self._write(response, f)
+            if response.status_code != 206:
+                return None
+            match = CONTENT_RANGE_REGEX.fullmatch(response.headers.get("Content-Range", ""))
+            if match is None:
+                raise ValueError(f"Unexpected `Content-Range` header: {response.headers.get('Content-Range')}")
+            return int(match.group(3))
+
+    def _download_remaining_parts(self, url: str, path: Path, total: int) -> None:
+        assert self.range_size is not None
+        range_size = self.range_size
+        with open(path, "r+b") as f:
+            f.truncate(total)
+
+        def download_part(start: int) -> None:
+            # Every part has its own file handle. The parts don't overlap.
+            with self._get(url, (start, min(start + range_size, total) - 1)) as response, open(path, "r+b") as f:
+                if response.status_code != 206:
+                    raise ValueError("The server stopped supporting range requests in the middle of a download")
+                f.seek(start)
+                self._write(response, f)
+
+        with ThreadPoolExecutor(max_workers=self.range_workers) as executor:
+            futures = [
+                executor.submit(self._with_retries, partial(download_part, start))
+                for start in range(range_size, total, range_size)
+            ]
+            for future in futures:
+                future.result()
+
+    def download_many(self, downloads: Sequence[tuple[str, Path]]) -> list[Path]:
+        """
+        Download multiple files concurrently.
+
+        Args:
+            downloads: Pairs of url and the path to download it to.
+
+        Returns:
+            The paths in the order of `downloads`.
+        """
+        if not downloads:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(downloads))) as executor:
+            futures = [executor.submit(self.download, url, path) for url, path in downloads]
+            return [future.result() for future in futures]
+
+
+_download_manager: DownloadManager | None = None
+_download_manager_lock = threading.Lock()
+
+
+def get_download_manager() -> DownloadManager:
+    """
+    Get the download manager that is shared by all asset downloads of the process.
+    """
+    global _download_manager
+    with _download_manager_lock:
+        if _download_manager is None:
+            _download_manager = DownloadManager()
+        return _download_manager
+
+
+def set_download_manager(manager: DownloadManager | None) -> None:
+    """
+    Replace the shared download manager. With None, a new one with the default settings is created on demand.
+    """
+    global _download_manager
+    with _download_manager_lock:
+        _download_manager = manager
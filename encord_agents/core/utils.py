@@ -1,21 +1,32 @@
 import mimetypes
-from contextlib import contextmanager
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
 from functools import lru_cache
 from pathlib import Path
 from tempfile import TemporaryDirectory
-from typing import Any, Generator, Iterable, List, TypeVar, cast
+from typing import Any, Callable, Generator, Iterable, List, Sequence, TypeVar, cast
 
+import numpy as np
 import requests
 from encord.constants.enums import DataType
 from encord.objects.ontology_labels_impl import LabelRowV2
 from encord.orm.storage import StorageItemType
 from encord.storage import StorageItem
 from encord.user_client import EncordUserClient
+from numpy.typing import NDArray
 
 from encord_agents import __version__
+from encord_agents.core.asset_cache import get_asset_cache
 from encord_agents.core.data_model import FrameData, LabelRowInitialiseLabelsArgs, LabelRowMetadataIncludeArgs
+from encord_agents.core.download import get_download_manager
 from encord_agents.core.settings import Settings
 
+# Images up to this size are downloaded into memory rather than to disk where possible
+IN_MEMORY_MAX_BYTES = 32 * 1024 * 1024
+IN_MEMORY_ITEM_TYPES = (StorageItemType.IMAGE, StorageItemType.IMAGE_GROUP)
+
 DOWNLOAD_NATIVE_IMAGE_GROUP_WO_FRAME_ERROR_MESSAGE = (
     "`frame` parameter set to None for a Native Image Group. "
     "Downloading entire native image group is currently not supported. "
@@ -166,42 +177,242 @@ def download_asset(storage_item: StorageItem, frame: int | None = None) -> Gener
         The file path for the requested asset.
 
     """
-    url = storage_item.get_signed_url()
+    asset_item = _get_asset_item(storage_item, frame)
+    cache = get_asset_cache()
+    # Within the cache directory, cached assets can be hard linked instead of copied
+    with TemporaryDirectory(dir=cache.temp_dir if cache else None) as dir_name:
+        dir_path = Path(dir_name)
+
+        if cache is None:
+            file_path = _download_asset_file(storage_item, asset_item, dir_path)
+        else:
+            with cache.lock(asset_item):
+                cached_path = cache.get(asset_item, dir_path, str(storage_item.uuid))
+                if cached_path is None:
+                    file_path = _download_asset_file(storage_item, asset_item, dir_path)
+                    cache.put(asset_item, file_path)
+                else:
+                    file_path = cached_path
+
+        if storage_item.item_type == StorageItemType.VIDEO and frame is not None:  # Get that exact frame
+            from .video import get_frame, write_frame
+
+            frame_content = get_frame(file_path, frame)
+            frame_file = file_path.with_name(f"{file_path.name}_{frame}").with_suffix(".png")
+            write_frame(frame_file, frame_content)
+            file_path = frame_file
+
+        yield file_path
+
+
+STREAM_VIDEOS_ENV = "ENCORD_AGENTS_STREAM_VIDEOS"
+_stream_videos: bool | None = None
+_stream_videos_lock = threading.Lock()
+
+
+def get_video_streaming() -> bool:
+    """
+    Whether dependencies like `dep_video_iterator` stream videos rather than downloading them, see `open_video`.
+
+    Unless `set_video_streaming` was called, streaming is enabled by setting the
+    `ENCORD_AGENTS_STREAM_VIDEOS` environment variable to `1` or `true`.
+    """
+    global _stream_videos
+    with _stream_videos_lock:
+        if _stream_videos is None:
+            _stream_videos = os.environ.get(STREAM_VIDEOS_ENV, "").lower() in ("1", "true")
+        return _stream_videos
+
+
+def set_video_streaming(enabled: bool) -> None:
+    """
+    Set whether dependencies like `dep_video_iterator` stream videos rather than downloading them.
+    """
+    global _stream_videos
+    with _stream_videos_lock:
+        _stream_videos = enabled
 
+
+@contextmanager
+def open_video(storage_item: StorageItem, stream: bool = False) -> Generator[Path | str, None, None]:
+    """
+    Get a video source for `encord_agents.core.video.iter_video` and friends.
+
+    By default, the video is downloaded with `download_asset`. With `stream`, this is the signed url
+    of the video where possible, such that frames are decoded while the video is streamed and the
+    first frames are available right away, also for videos that don't fit on disk.
+    The video is still downloaded if
+
+    - the asset cache is enabled, such that the video is downloaded once and reused afterwards,
+    - the storage item is not a video, or
+    - the video can't be streamed, e.g., because OpenCV's FFmpeg build doesn't support the url.
+
+    A stream that is cut off, e.g., because the connection dropped, raises an
+    `encord_agents.exceptions.IncompleteVideoError` while the frames are decoded.
+
+    This function is a context manager. A downloaded video is cleaned up when the context is left.
+
+    Args:
+        storage_item: The Storage item for which you want the video.
+        stream: Whether to stream the video if possible.
+
+    Yields:
+        The url to stream the video from or the file path of the downloaded video.
+    """
+    if stream and storage_item.item_type == StorageItemType.VIDEO and get_asset_cache() is None:
+        from .video import probe_stream
+
+        video_stream = probe_stream(_get_signed_url(storage_item))
+        if video_stream is not None:
+            try:
+                yield video_stream
+            finally:
+                video_stream.release()
+            return
+
+    with download_asset(storage_item) as asset:
+        yield asset
+
+
+def download_asset_bytes(storage_item: StorageItem, frame: int | None = None) -> bytearray:
+    """
+    Download the encoded image of an image or a frame of an image group into memory.
+
+    Unlike `download_asset`, nothing is written to disk (unless the asset cache is enabled),
+    which is faster for small images. Use it, e.g., to forward the image to an LLM as is.
+
+    Args:
+        storage_item: The Storage item for which you want to download the associated asset.
+        frame: The frame that you need of an image group. Ignored for images.
+
+    Raises:
+        NotImplementedError: If you try to get all frames of an image group.
+        ValueError: If the storage item is not an image or an image group.
+
+    Returns:
+        The encoded image, e.g., the bytes of a jpeg file.
+    """
+    if storage_item.item_type not in IN_MEMORY_ITEM_TYPES:
+        raise ValueError(f"Only images and image groups can be downloaded into memory, got {storage_item.item_type}")
+    asset_item = _get_asset_item(storage_item, frame)
+    cache = get_asset_cache()
+    if cache is None:
+        return get_download_manager().download_bytes(_get_signed_url(asset_item))
+
+    with cache.lock(asset_item):
+        content = cache.read(asset_item)
+        if content is None:
+            url = _get_signed_url(asset_item)
+            content = get_download_manager().download_bytes(url)
+            cache.put_bytes(asset_item, content, _guess_file_suffix(url, storage_item)[1])
+        return content
+
+
+def load_single_frame(storage_item: StorageItem, frame: int | None = None) -> NDArray[np.uint8]:
+    """
+    Load a single frame of the asset of a storage item.
+
+    Small images and the frames of image groups are downloaded into memory and decoded from there.
+    Other assets are downloaded to disk and removed again once the frame is read.
+
+    Args:
+        storage_item: The Storage item for which you want the frame.
+        frame: The frame that you need. See `download_asset`.
+
+    Returns:
+        Numpy array of shape [h, w, 3] RGB colors.
+    """
+    from .vision import decode_image, read_image
+
+    if fits_in_memory(storage_item):
+        return decode_image(download_asset_bytes(storage_item, frame))
+    with download_asset(storage_item, frame) as asset:
+        return read_image(asset)
+
+
+def fits_in_memory(storage_item: StorageItem) -> bool:
+    """
+    Whether the asset of a storage item should be downloaded with `download_asset_bytes` rather than to disk.
+
+    That is the case for images up to `IN_MEMORY_MAX_BYTES` in size and for the frames of image groups.
+    """
     if storage_item.item_type == StorageItemType.IMAGE_GROUP:
-        if frame is None:
-            # Can only download the whole image sequences - not image groups.
-            raise NotImplementedError(DOWNLOAD_NATIVE_IMAGE_GROUP_WO_FRAME_ERROR_MESSAGE)
+        return True
+    return (
+        storage_item.item_type == StorageItemType.IMAGE
+        and storage_item.file_size is not None
+        and storage_item.file_size <= IN_MEMORY_MAX_BYTES
+    )
 
-        child_storage_items = list(storage_item.get_child_items(get_signed_urls=True))
-        assert len(child_storage_items) > frame, "The requested frame in the Image Group does not exist"
-        url = child_storage_items[frame].get_signed_url()
 
+def _get_asset_item(storage_item: StorageItem, frame: int | None) -> StorageItem:
+    """
+    Get the storage item whose file holds the asset, i.e., the storage item itself or the child of an image group.
+    """
+    if storage_item.item_type != StorageItemType.IMAGE_GROUP:
+        return storage_item
+    if frame is None:
+        # Can only download the whole image sequences - not image groups.
+        raise NotImplementedError(DOWNLOAD_NATIVE_IMAGE_GROUP_WO_FRAME_ERROR_MESSAGE)
+
+    child_storage_items = list(storage_item.get_child_items(get_signed_urls=True))
+    assert len(child_storage_items) > frame, "The requested frame in the Image Group does not exist"
+    return child_storage_items[frame]
+
+
+def _get_signed_url(asset_item: StorageItem) -> str:
+    url = asset_item.get_signed_url()
     if url is None:
         raise ValueError("Failed to get a signed url for the asset")
+    return url
 
-    file_type, suffix = _guess_file_suffix(url, storage_item)
-    response = requests.get(url)
-    response.raise_for_status()
 
-    with TemporaryDirectory() as dir_name:
-        dir_path = Path(dir_name)
+def _download_asset_file(storage_item: StorageItem, asset_item: StorageItem, dir_path: Path) -> Path:
+    """
+    Download the file of `asset_item`, i.e., the storage item itself or the child of an image group, to `dir_path`.
+    """
+    url = _get_signed_url(asset_item)
+    _, suffix = _guess_file_suffix(url, storage_item)
+    file_path = dir_path / f"{storage_item.uuid}{suffix}"
+    return get_download_manager().download(url, file_path)
 
-        file_path = dir_path / f"{storage_item.uuid}{suffix}"
-        with open(file_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=4096):
-                if chunk:
-                    f.write(chunk)
 
-        if file_type == "video" and frame is not None:  # Get that exact frame
-            from .video import get_frame, write_frame
+@contextmanager
+def download_assets(
+    storage_items: Sequence[StorageItem], frame: int | None = None, max_workers: int | None = None
+) -> Generator[list[Path], None, None]:
+    """
+    Download the assets of multiple storage items to disk concurrently.
 
-            frame_content = get_frame(file_path, frame)
-            frame_file = file_path.with_name(f"{file_path.name}_{frame}").with_suffix(".png")
-            write_frame(frame_file, frame_content)
-            file_path = frame_file
+    Like `download_asset`, this function is a context manager and the data is cleaned up when the context is left.
 
-        yield file_path
+    Args:
+        storage_items: The storage items for which you want to download the associated assets.
+        frame: The frame that you need of every asset. See `download_asset`.
+        max_workers: Max number of assets that are downloaded at once.
+            Defaults to the `max_workers` of the shared `DownloadManager`.
+
+    Yields:
+        The file paths for the requested assets in the order of `storage_items`.
+    """
+
+    def download(item: StorageItem) -> tuple[ExitStack, Path]:
+        with ExitStack() as item_stack:
+            path = item_stack.enter_context(download_asset(item, frame))
+            return item_stack.pop_all(), path
+
+    with ExitStack() as stack:
+        if not storage_items:
+            yield []
+            return
+        max_workers = max_workers or get_download_manager().max_workers
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(storage_items))) as executor:
+            futures = [executor.submit(download, item) for item in storage_items]
+        # Assets that were downloaded are cleaned up by the stack, even if others failed
+        for future in futures:
+            if future.exception() is None:
+                stack.enter_context(future.result()[0])
+        yield [future.result()[1] for future in futures]
 
 
 def get_frame_count(storage_item: StorageItem) -> int:
@@ -220,12 +431,13 @@ def get_frame_count(storage_item: StorageItem) -> int:
 T = TypeVar("T")
 
 
-def batch_iterator(iterator: Iterable[T], batch_size: int) -> Iterable[List[T]]:
+def batch_iterator(iterator: Iterable[T], batch_size: int | Callable[[], int]) -> Iterable[List[T]]:
     """Yield batches of items from an iterator.
 
     Args:
         iterator: The source iterator
-        batch_size: Size of each batch > 0
+        batch_size: Size of each batch > 0. If a callable, it is called before
+            each batch to get the size of that batch.
 
     Returns:
         Iterable of lists, each containing up to batch_size items
@@ -233,7 +445,7 @@ def batch_iterator(iterator: Iterable[T], batch_size: int) -> Iterable[List[T]]:
     iterator = iter(iterator)  # Ensure we have an iterator
     while True:
         batch = []
-        for _ in range(batch_size):
+        for _ in range(batch_size() if callable(batch_size) else batch_size):
             try:
                 batch.append(next(iterator))
             except StopIteration:
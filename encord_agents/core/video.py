@@ -1,5 +1,8 @@
+import logging
+import threading
+from itertools import pairwise
 from pathlib import Path
-from typing import Iterable, Iterator
+from typing import Iterable, Iterator, Literal, Sequence, TypeAlias
 
 import numpy as np
 from numpy.typing import NDArray
@@ -13,6 +16,104 @@ except ImportError:
 
 
 from encord_agents.core.data_model import Frame
+from encord_agents.exceptions import IncompleteVideoError
+
+SamplingStrategy = Literal["sequential", "seek", "mixed"]
+# Seeking decodes from the previous keyframe, and keyframes are commonly 30 to 250 frames apart
+DEFAULT_MAX_GRAB_GAP = 64
+
+logger = logging.getLogger(__name__)
+
+VideoSource: TypeAlias = Path | str
+"""
+A local video file or the url of a video, which is decoded while it is streamed.
+"""
+
+
+class VideoStream(str):
+    """
+    The url of a video that can be decoded while it is streamed, see `probe_stream`.
+
+    It holds on to the capture that was opened to probe the url, such that the first
+    `open_video_capture` on it doesn't open the url again.
+    """
+
+    _capture: cv2.VideoCapture | None
+    _lock: threading.Lock
+
+    def __new__(cls, url: str, capture: cv2.VideoCapture) -> "VideoStream":
+        stream = super().__new__(cls, url)
+        stream._capture = capture
+        stream._lock = threading.Lock()
+        return stream
+
+    def take_capture(self) -> cv2.VideoCapture | None:
+        """
+        Take the capture that was opened to probe the url, if no one took it yet.
+        """
+        with self._lock:
+            capture, self._capture = self._capture, None
+        return capture
+
+    def release(self) -> None:
+        """
+        Release the capture that was opened to probe the url, if no one took it.
+        """
+        capture = self.take_capture()
+        if capture is not None:
+            capture.release()
+
+
+def open_video_capture(video: VideoSource) -> cv2.VideoCapture:
+    """
+    Open a video for decoding.
+
+    Urls are opened with the FFmpeg backend, which reads the video progressively over HTTP
+    and uses range requests to seek where the container requires it. A `VideoStream` hands over
+    the capture that was opened to probe it, the first time.
+
+    Raises:
+        Exception: If the video cannot be opened.
+    """
+    if isinstance(video, VideoStream) and (probed := video.take_capture()) is not None:
+        return probed
+    if isinstance(video, Path):
+        cap = cv2.VideoCapture(video.as_posix())
+    else:
+        cap = cv2.VideoCapture(video, cv2.CAP_FFMPEG)
+    if not cap.isOpened():
+        raise Exception("Error opening video file.")
+    return cap
+
+
+def probe_stream(url: str) -> VideoStream | None:
+    """
+    Check whether the video at `url` can be decoded while it is streamed.
+
+    That depends on the FFmpeg build of OpenCV, e.g., on its support for https, and on the container of the video.
+
+    Returns:
+        The url along with the capture that was opened to probe it, or None if the video can't be streamed.
+    """
+    cap = cv2.VideoCapture(url, cv2.CAP_FFMPEG)
+    if not cap.isOpened():
+        cap.release()
+        return None
+    return VideoStream(url, cap)
+
+
+def _check_complete(cap: cv2.VideoCapture, video: VideoSource, next_frame: int) -> None:
+    """
+    Raise if a streamed video ended before `next_frame` reached the frame count in its header.
+
+    Local files are not checked. They are complete once downloaded, and some containers only
+    have an estimate of the frame count.
+    """
+    if isinstance(video, Path):
+        return
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if 0 < frame_count and next_frame < frame_count:
+        raise IncompleteVideoError(f"The video stream ended after {next_frame} of {frame_count} frames.")
 
 
 def get_frame(video_path: Path, desired_frame: int) -> NDArray[np.uint8]:
@@ -57,62 +158,316 @@ def write_frame(frame_path: Path, frame: NDArray[np.uint8]) -> None:
     cv2.imwrite(frame_path.as_posix(), frame)
 
 
-def iter_video(video_path: Path) -> Iterator[Frame]:
+def iter_video(video_path: VideoSource) -> Iterator[Frame]:
     """
     Iterate video frame by frame.
 
     Args:
-        video_path: The file path to the video you wish to iterate.
+        video_path: The file path to the video you wish to iterate or a url to stream it from.
 
     Raises:
         Exception: If the video file could not be opened properly.
+        IncompleteVideoError: If a streamed video ended before all of its frames were decoded.
 
     Yields:
         Frames from the video.
 
     """
-    cap = cv2.VideoCapture(video_path.as_posix())
-    if not cap.isOpened():
-        raise Exception("Error opening video file.")
+    cap = open_video_capture(video_path)
+    try:
+        frame_num = 0
+        ret, frame = cap.read()
+        while ret:
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            yield Frame(frame=frame_num, content=rgb_frame.astype(np.uint8))
 
-    frame_num = 0
-    ret, frame = cap.read()
-    while ret:
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        yield Frame(frame=frame_num, content=rgb_frame.astype(np.uint8))
+            ret, frame = cap.read()
+            frame_num += 1
+        _check_complete(cap, video_path, frame_num)
+    finally:
+        cap.release()
 
-        ret, frame = cap.read()
-        frame_num += 1
 
-    cap.release()
+def sampling_strategy(frame_indices: Sequence[int], max_grab_gap: int = DEFAULT_MAX_GRAB_GAP) -> SamplingStrategy:
+    """
+    Get the strategy with which `iter_video_with_indices` reads the frames at `frame_indices`.
+
+    Seeking decodes the video again from the keyframe before the frame, so for frames that are close
+    to each other it is faster to decode the frames in between and skip them.
+
+    Args:
+        frame_indices: The frame indices to read in order.
+        max_grab_gap: Max number of frames to decode and skip to get to the next frame instead of seeking.
+
+    Returns:
+        "sequential" if the video is only read forward, "seek" if it seeks for every frame but the first,
+        and "mixed" otherwise.
+    """
+    seeks = [seeks_to(previous + 1, index, max_grab_gap) for previous, index in pairwise(frame_indices)]
+    if not any(seeks):
+        return "sequential"
+    if all(seeks):
+        return "seek"
+    return "mixed"
 
 
-def iter_video_with_indices(video_path: Path, frame_indices: Iterable[int]) -> Iterator[Frame]:
+def seeks_to(position: int, frame_index: int, max_grab_gap: int = DEFAULT_MAX_GRAB_GAP) -> bool:
+    """
+    Whether to seek from `position`, the index of the next frame in the video, to `frame_index`.
+    """
+    return not 0 <= frame_index - position <= max_grab_gap
+
+
+def iter_video_with_indices(
+    video_path: VideoSource, frame_indices: Iterable[int], max_grab_gap: int = DEFAULT_MAX_GRAB_GAP
+) -> Iterator[Frame]:
     """
     Iterate video frame by frame with specified frame indices.
 
+    Frames that are at most `max_grab_gap` frames after the previous one are reached by decoding and skipping
+    the frames in between, which is much faster than seeking for dense or regular samples. Frames further away,
+    or before the previous one, are sought. See `sampling_strategy`.
+
     Args:
-        video_path: The file path to the video you wish to iterate.
+        video_path: The file path to the video you wish to iterate or a url to stream it from.
         frame_indices: The frame indices to iterate over.
+        max_grab_gap: Max number of frames to skip by decoding them rather than by seeking.
+
+    Raises:
+        IncompleteVideoError: If a streamed video ended before the frames were decoded.
 
     Yields:
         Frames from the video.
 
     """
-    if not video_path.exists():
+    if isinstance(video_path, Path) and not video_path.exists():
         raise Exception("Video file does not exist.")
-    cap = cv2.VideoCapture(video_path.as_posix())
-    if not cap.isOpened():
-        raise Exception("Error opening video file.")
+    # The strategy depends on all indices, so iterators are read up front. That's cheap compared to decoding.
+    frame_indices = list(frame_indices)
+    logger.info(
+        f"Sampling {len(frame_indices)} frames with the {sampling_strategy(frame_indices, max_grab_gap)} strategy"
+    )
+    cap = open_video_capture(video_path)
+    try:
+        # The index of the frame that the next read returns
+        position = 0
+        for frame_num in frame_indices:
+            if seeks_to(position, frame_num, max_grab_gap):
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+            else:
+                for _ in range(frame_num - position):
+                    if not cap.grab():
+                        break
+            ret, frame = cap.read()
+            if not ret:
+                # Past the end of the video, unless the stream was cut off
+                _check_complete(cap, video_path, frame_num)
+                break
+            position = frame_num + 1
+
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            yield Frame(frame=frame_num, content=rgb_frame.astype(np.uint8))
+    finally:
+        cap.release()
+
+
+def plan_frame_indices(
+    frame_count: int,
+    fps: float | None = None,
+    *,
+    rate: float | None = None,
+    target_fps: float | None = None,
+    start: float | None = None,
+    end: float | None = None,
+    max_frames: int | None = None,
+) -> NDArray[np.int64]:
+    """
+    Compute the indices of the frames to sample from a video.
 
-    for frame_num in frame_indices:
-        # Set the frame position before reading
-        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
-        ret, frame = cap.read()
-        if not ret:
-            break
+    The indices are sorted, unique and within `[0, frame_count)`.
+
+    Args:
+        frame_count: The number of frames in the video.
+        fps: The frame rate of the video. Required for `target_fps`, `start` and `end`.
+        rate: The proportion of frames to sample, e.g., 1/5 samples every 5th frame.
+        target_fps: The number of frames to sample per second of video. Mutually exclusive with `rate`.
+            Without either, every frame is sampled.
+        start: The time in seconds from which to sample.
+        end: The time in seconds until which to sample (exclusive).
+        max_frames: Max number of frames to sample. If there are more, they are thinned out evenly.
 
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        yield Frame(frame=frame_num, content=rgb_frame.astype(np.uint8))
+    Raises:
+        ValueError: If the arguments are invalid or `fps` is required but missing.
 
-    cap.release()
+    Returns:
+        The frame indices.
+    """
+    if rate is not None and target_fps is not None:
+        raise ValueError("Specify either a sampling rate or a target fps, not both")
+    if rate is not None and not 0 < rate <= 1:
+        raise ValueError("Frame sampling rate must be between 0 and 1")
+    if target_fps is not None and target_fps <= 0:
+        raise ValueError("We require that `target_fps` > 0")
+    if max_frames is not None and max_frames < 0:
+        raise ValueError("We require that `max_frames` >= 0")
+    if fps is None and (target_fps is not None or start is not None or end is not None):
+        raise ValueError("The frame rate of the video is required to sample by time")
+
+    first = 0 if start is None or fps is None else max(int(np.ceil(start * fps)), 0)
+    last = float(frame_count) if end is None or fps is None else min(end * fps, float(frame_count))
+    if target_fps is not None and fps is not None:
+        step = max(fps / target_fps, 1.0)
+    else:
+        step = 1 / (rate or 1.0)
+
+    num = max(int(np.ceil((last - first) / step)), 0)
+    # The epsilon keeps float steps like 1 / (1 / 3) from landing just below the frame index
+    indices = np.floor(first + np.arange(num) * step + 1e-9).astype(np.int64)
+    indices = np.unique(indices[indices < last])
+    return _thin_out(indices, max_frames)
+
+
+def _thin_out(indices: NDArray[np.int64], max_frames: int | None) -> NDArray[np.int64]:
+    if max_frames is None or len(indices) <= max_frames:
+        return indices
+    positions = np.unique(np.linspace(0, len(indices) - 1, max_frames).round().astype(np.int64))
+    thinned: NDArray[np.int64] = indices[positions]
+    return thinned
+
+
+def iter_keyframes(
+    video_path: VideoSource, start_frame: int = 0, end_frame: int | None = None, max_frames: int | None = None
+) -> Iterator[Frame]:
+    """
+    Iterate the keyframes of a video.
+
+    OpenCV doesn't expose the index of keyframes, so all frames in the range are decoded to find them,
+    but only the keyframes are converted and yielded.
+
+    Args:
+        video_path: The file path to the video you wish to iterate or a url to stream it from.
+        start_frame: The index of the first frame to consider.
+        end_frame: The index of the frame to stop at (exclusive).
+        max_frames: Max number of keyframes to yield.
+
+    Raises:
+        IncompleteVideoError: If a streamed video ended before the range was decoded.
+
+    Yields:
+        The keyframes in the range.
+    """
+    cap = open_video_capture(video_path)
+    try:
+        if start_frame > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+        frame_num, yielded = start_frame, 0
+        while (end_frame is None or frame_num < end_frame) and (max_frames is None or yielded < max_frames):
+            if not cap.grab():
+                _check_complete(cap, video_path, frame_num)
+                break
+            if cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+                ret, frame = cap.retrieve()
+                if not ret:
+                    break
+                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                yield Frame(frame=frame_num, content=rgb_frame.astype(np.uint8))
+                yielded += 1
+            frame_num += 1
+    finally:
+        cap.release()
+
+
+class VideoSampler:
+    """
+    Samples frames from a video. See `__call__` for the ways to sample.
+
+    Args:
+        video_path: The file path to the video or a url to stream it from.
+        frame_count: The number of frames in the video. Read from the video if not given.
+        fps: The frame rate of the video. Read from the video if not given.
+    """
+
+    def __init__(self, video_path: VideoSource, frame_count: int | None = None, fps: float | None = None) -> None:
+        self.video_path = video_path
+        self._frame_count = frame_count
+        self._fps = fps
+
+    def _read_properties(self) -> None:
+        cap = open_video_capture(self.video_path)
+        try:
+            if self._frame_count is None:
+                self._frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            if self._fps is None:
+                self._fps = float(cap.get(cv2.CAP_PROP_FPS)) or None
+        finally:
+            cap.release()
+
+    @property
+    def frame_count(self) -> int:
+        if self._frame_count is None:
+            self._read_properties()
+        assert self._frame_count is not None
+        return self._frame_count
+
+    @property
+    def fps(self) -> float | None:
+        if self._fps is None:
+            self._read_properties()
+        return self._fps
+
+    def __call__(
+        self,
+        frame_indexer: float | Sequence[int] | None = None,
+        *,
+        fps: float | None = None,
+        start: float | None = None,
+        end: float | None = None,
+        max_frames: int | None = None,
+        keyframes_only: bool = False,
+    ) -> Iterator[Frame]:
+        """
+        Sample frames.
+
+        Args:
+            frame_indexer:
+                * If int or float, the frame sampling rate, e.g., 1/5 will return every 5th frame.
+                * If a sequence of ints, the frames to return. Frames past the end of the video are dropped.
+                * If None, every frame, unless `fps` or `keyframes_only` is given.
+            fps: The number of frames to sample per second of video.
+            start: The time in seconds from which to sample.
+            end: The time in seconds until which to sample (exclusive).
+            max_frames: Max number of frames to sample. If there are more, they are thinned out evenly.
+                For keyframes, the first ones are returned.
+            keyframes_only: Return only the keyframes of the video, within `start` and `end`.
+
+        Returns:
+            Iterates over the sampled frames in order.
+        """
+        if keyframes_only:
+            if frame_indexer is not None or fps is not None:
+                raise ValueError("Keyframe sampling can't be combined with frame indices, rates or fps")
+            video_fps = self.fps if start is not None or end is not None else None
+            if video_fps is None and (start is not None or end is not None):
+                raise ValueError("The frame rate of the video is required to sample by time")
+            start_frame = int(np.ceil(start * video_fps)) if start is not None and video_fps else 0
+            end_frame = int(np.ceil(end * video_fps)) if end is not None and video_fps else None
+            return iter_keyframes(self.video_path, start_frame, end_frame, max_frames)
+
+        if frame_indexer is None or isinstance(frame_indexer, (int, float)):
+            needs_fps = fps is not None or start is not None or end is not None
+            indices = plan_frame_indices(
+                self.frame_count,
+                self.fps if needs_fps else None,
+                rate=frame_indexer,
+                target_fps=fps,
+                start=start,
+                end=end,
+                max_frames=max_frames,
+            )
+        else:
+            if fps is not None or start is not None or end is not None:
+                raise ValueError("Explicit frame indices can't be combined with fps, start or end")
+            indices = np.unique(np.asarray(frame_indexer, dtype=np.int64))
+            indices = _thin_out(indices[(indices >= 0) & (indices < self.frame_count)], max_frames)
+        return iter_video_with_indices(self.video_path, indices.tolist())
@@ -1,4 +1,5 @@
 import base64
+from pathlib import Path
 from typing import TypeAlias
 
 import numpy as np
@@ -27,6 +28,35 @@ DATA_TYPES = {
 }
 
 
+def decode_image(buffer: bytes | bytearray | memoryview) -> NDArray[np.uint8]:
+    """
+    Decode an encoded image, e.g., the content of a jpeg file, into RGB colors.
+
+    The image is decoded straight from the buffer, without copying it or writing it to disk.
+
+    Returns:
+        Numpy array of shape [h, w, 3] RGB colors.
+    """
+    img = cv2.imdecode(np.frombuffer(buffer, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Failed to decode the image")
+    # In place, the decoded image is not referenced anywhere else
+    return np.asarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=img), dtype=np.uint8)
+
+
+def read_image(path: Path) -> NDArray[np.uint8]:
+    """
+    Read an image file into RGB colors.
+
+    Returns:
+        Numpy array of shape [h, w, 3] RGB colors.
+    """
+    img = cv2.imread(path.as_posix())
+    if img is None:
+        raise ValueError(f"Failed to read the image `{path.name}`")
+    return np.asarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=img), dtype=np.uint8)
+
+
 def rbb_to_poly(
     rbb: RotatableBoundingBoxCoordinates,
     img_width: int,
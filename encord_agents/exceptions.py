@@ -18,3 +18,15 @@ class PrintableError(ValueError):
         text_obj = Text.from_markup(self.args[0])
         console.print(text_obj, end="")
         return output.getvalue()
+
+
+class TaskTimeoutError(TimeoutError):
+    """
+    Raised when an agent doesn't finish a task within its `task_timeout`.
+    """
+
+
+class IncompleteVideoError(ConnectionError):
+    """
+    Raised when a streamed video ends before all of its frames were decoded, e.g., because the connection dropped.
+    """
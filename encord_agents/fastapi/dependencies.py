@@ -50,8 +50,12 @@ except ModuleNotFoundError:
 from encord_agents.core.data_model import Frame, FrameData, InstanceCrop
 from encord_agents.core.utils import (
     download_asset,
+    download_asset_bytes,
     get_initialised_label_row,
     get_user_client,
+    get_video_streaming,
+    load_single_frame,
+    open_video,
 )
 from encord_agents.core.video import iter_video
 
@@ -225,9 +229,39 @@ def dep_single_frame(
             "Your data agent is depending on computer vision capabilities and `opencv` is not installed. Please install either `opencv-python` or `opencv-python-headless`."
         )
 
-    with download_asset(storage_item, frame_data.frame) as asset:
-        img = cv2.cvtColor(cv2.imread(asset.as_posix()), cv2.COLOR_BGR2RGB)
-    return np.asarray(img, dtype=np.uint8)
+    return load_single_frame(storage_item, frame_data.frame)
+
+
+def dep_image_bytes(
+    storage_item: Annotated[StorageItem, Depends(dep_storage_item)], frame_data: FrameData
+) -> bytearray:
+    """
+    Dependency to inject the encoded image of the frame data, e.g., the content of a jpeg file.
+
+    The image is downloaded into memory only, which makes it fast to forward, e.g., to an LLM.
+    Only images and image groups are supported.
+
+    **Example:**
+
+    ```python
+    from encord_agents.fastapi.dependencies import dep_image_bytes
+    ...
+
+    @app.post("/my-route")
+    def my_route(
+        image: Annotated[bytearray, Depends(dep_image_bytes)]
+    ):
+        b64_image = base64.b64encode(image).decode()
+    ```
+
+    Args:
+        storage_item: The storage item. Automatically injected (see example above).
+        frame_data: the frame data from the route. This parameter is automatically injected
+            if it's a part of your route (see example above).
+
+    Returns: The encoded image.
+    """
+    return download_asset_bytes(storage_item, frame_data.frame)
 
 
 def dep_asset(
@@ -274,6 +308,8 @@ def dep_video_iterator(
 ) -> Generator[Iterator[Frame], None, None]:
     """
     Dependency to inject a video frame iterator for doing things over many frames.
+    With video streaming enabled, frames are decoded while the video is streamed where possible,
+    see `encord_agents.core.utils.open_video` and `encord_agents.core.utils.set_video_streaming`.
 
     **Example:**
 
@@ -301,7 +337,7 @@ def dep_video_iterator(
     """
     if not storage_item.item_type == StorageItemType.VIDEO:
         raise NotImplementedError("`dep_video_iterator` only supported for video label rows")
-    with download_asset(storage_item, None) as asset:
+    with open_video(storage_item, stream=get_video_streaming()) as asset:
         yield iter_video(asset)
 
 
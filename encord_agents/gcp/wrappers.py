@@ -19,7 +19,7 @@ from encord_agents.core.data_model import (
     LabelRowMetadataIncludeArgs,
 )
 from encord_agents.core.dependencies.models import Context
-from encord_agents.core.dependencies.utils import get_dependant, solve_dependencies
+from encord_agents.core.dependencies.utils import compile_dependant, get_dependant, solve_dependencies
 from encord_agents.core.exceptions import EncordEditorAgentException
 from encord_agents.core.utils import get_user_client
 
@@ -64,6 +64,7 @@ def editor_agent(
 
     def context_wrapper_inner(func: AgentFunction) -> Callable[[Request], Response]:
         dependant = get_dependant(func=func)
+        compile_dependant(dependant)
         cors_regex = re.compile(custom_cors_regex or ENCORD_DOMAIN_REGEX)
 
         @wraps(func)
@@ -1,5 +1,5 @@
-from encord_agents.core.dependencies import Depends
+from encord_agents.core.dependencies import BatchDepends, Depends
 
-from .runner import QueueRunner, Runner, SequentialRunner
+from .runner import AsyncRunner, QueueRunner, RetryPolicy, Runner, SequentialRunner
 
-__all__ = ["Runner", "QueueRunner", "Depends", "SequentialRunner"]
+__all__ = ["Runner", "QueueRunner", "Depends", "BatchDepends", "SequentialRunner", "AsyncRunner", "RetryPolicy"]
@@ -1,6 +1,8 @@
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from functools import partial
 from pathlib import Path
-from typing import Callable, Generator, Iterable, Iterator, Sequence
+from typing import TYPE_CHECKING, Callable, Generator, Iterable, Iterator, Sequence
 
 import numpy as np
 from encord.exceptions import AuthenticationError, AuthorisationError, UnknownException
@@ -16,9 +18,23 @@ from typing_extensions import Annotated
 from encord_agents.core.data_model import Frame
 from encord_agents.core.dependencies.models import Depends
 from encord_agents.core.dependencies.shares import DataLookup
-from encord_agents.core.utils import download_asset, get_frame_count, get_user_client
+from encord_agents.core.download import get_download_manager
+from encord_agents.core.utils import (
+    download_asset,
+    download_asset_bytes,
+    download_assets,
+    get_frame_count,
+    get_user_client,
+    get_video_streaming,
+    load_single_frame,
+    open_video,
+)
 from encord_agents.exceptions import PrintableError
 
+if TYPE_CHECKING:
+    # Imports opencv, which is optional
+    from encord_agents.core.video import VideoSampler
+
 
 def dep_client() -> EncordUserClient:
     """
@@ -113,17 +129,86 @@ def dep_single_frame(storage_item: StorageItem) -> NDArray[np.uint8]:
             "Your data agent is depending on computer vision capabilities and `opencv` is not installed. Please install either `opencv-python` or `opencv-python-headless`."
         )
 
-    with download_asset(storage_item, frame=0) as asset:
-        img = cv2.cvtColor(cv2.imread(asset.as_posix()), cv2.COLOR_BGR2RGB)
+    return load_single_frame(storage_item, frame=0)
+
+
+def dep_image_bytes(storage_item: StorageItem) -> bytearray:
+    """
+    Dependency to inject the encoded image of the task, e.g., the content of a jpeg file.
+
+    The image is downloaded into memory only, which makes it fast to forward, e.g., to an LLM.
+    For image groups, it is the first image. Other data types are not supported.
+
+    **Example:**
+
+    ```python
+    from encord_agents.tasks.dependencies import dep_image_bytes
+    ...
+
+    @runner.stage("<my_stage_name>")
+    def my_agent(
+        image: Annotated[bytearray, Depends(dep_image_bytes)]
+    ) -> str:
+        b64_image = base64.b64encode(image).decode()
+    ```
+
+    Args:
+        storage_item: The Storage item. Automatically injected (see example above).
+
+    Returns:
+        The encoded image.
+    """
+    return download_asset_bytes(storage_item, frame=0)
+
+
+def dep_single_frames(storage_items: list[StorageItem]) -> list[NDArray[np.uint8]]:
+    """
+    Batch dependency to inject the first frame of the underlying asset of every task in a batch.
+
+    Unlike `dep_single_frame`, the assets of a whole batch of tasks are downloaded concurrently
+    before the agent is called on any of them. Use it with `BatchDepends`.
+
+    **Example:**
+
+    ```python
+    from encord_agents.tasks import BatchDepends
+    from encord_agents.tasks.dependencies import dep_single_frames
+    ...
+
+    @runner.stage("<my_stage_name>")
+    def my_agent(
+        frame: Annotated[NDArray[np.uint8], BatchDepends(dep_single_frames)]
+    ) -> str:
+        assert frame.ndim == 3, "Will work"
+    ```
+
+    Args:
+        storage_items: The storage items of the tasks. Automatically injected (see example above).
+
+    Returns:
+        A numpy array of shape [h, w, 3] RGB colors per task.
+    """
+    try:
+        import cv2
+    except ImportError:
+        raise ImportError(
+            "Your data agent is depending on computer vision capabilities and `opencv` is not installed. Please install either `opencv-python` or `opencv-python-headless`."
+        )
 
-    return np.asarray(img, dtype=np.uint8)
+    if not storage_items:
+        return []
+    max_workers = min(get_download_manager().max_workers, len(storage_items))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(partial(load_single_frame, frame=0), storage_items))
 
 
 def dep_video_iterator(storage_item: StorageItem) -> Generator[Iterator[Frame], None, None]:
     """
     Dependency to inject a video frame iterator for doing things over many frames.
     This uses OpenCV and the local backend on your machine.
-    Decoding support may vary dependent on the video format, codec and your local configuration
+    Decoding support may vary dependent on the video format, codec and your local configuration.
+    With video streaming enabled, frames are decoded while the video is streamed where possible,
+    see `encord_agents.core.utils.open_video` and `encord_agents.core.utils.set_video_streaming`.
 
     **Intended use**
 
@@ -155,17 +240,22 @@ def dep_video_iterator(storage_item: StorageItem) -> Generator[Iterator[Frame],
     if storage_item.item_type != StorageItemType.VIDEO:
         raise NotImplementedError("`dep_video_iterator` only supported for video label rows")
 
-    with download_asset(storage_item, None) as asset:
+    with open_video(storage_item, stream=get_video_streaming()) as asset:
         yield iter_video(asset)
 
 
 def dep_video_sampler(
     storage_item: StorageItem,
-) -> Generator[Callable[[float | Sequence[int]], Iterable[Frame]], None, None]:
+) -> Generator["VideoSampler", None, None]:
     """
     Dependency to inject a video sampler for doing things over many frames.
     This uses OpenCV and the local backend on your machine.
     Decoding support may vary dependent on the video format, codec and your local configuration.
+    With video streaming enabled, frames are decoded while the video is streamed where possible,
+    see `encord_agents.core.utils.open_video` and `encord_agents.core.utils.set_video_streaming`.
+
+    Frames are sampled by rate, target fps, time range, frame budget, explicit indices or keyframes.
+    Sampled frames never go past the end of the video. See `encord_agents.core.video.VideoSampler`.
 
     Args:
         storage_item: Automatically injected Storage item dependency.
@@ -173,59 +263,41 @@ def dep_video_sampler(
     **Example:**
 
     ```python
+    from encord_agents.core.video import VideoSampler
     from encord_agents.tasks.dependencies import dep_video_sampler
     ...
     runner = Runner(project_hash="<project_hash_a>")
 
     @runner.stage("<stage_name_or_uuid>")
     def my_agent(
-        video_sampler: Annotated[Callable[[float | Sequence[int]], Iterable[Frame]], Depends(dep_video_sampler)],
+        video_sampler: Annotated[VideoSampler, Depends(dep_video_sampler)],
     ) -> str | None:
         for frame in video_sampler(1/5):
             # Get every 5th frame
             # i.e: [0,5,10,15,...]
         for frame in video_sampler([1, 2, 3]):
             # Get frames 1, 2, 3
+        for frame in video_sampler(fps=2, start=10, end=20, max_frames=16):
+            # Get 2 frames per second between 10s and 20s, at most 16
+        for frame in video_sampler(keyframes_only=True):
+            # Get the keyframes
         ...
     ```
 
     """
-    from encord_agents.core.video import iter_video_with_indices
+    from encord_agents.core.video import VideoSampler
 
     if storage_item.item_type != StorageItemType.VIDEO:
         raise NotImplementedError("`dep_video_sampler` only supported for video label rows")
 
-    with download_asset(storage_item, None) as asset:
-
-        def video_sampler(
-            frame_indexer: int | float | Sequence[int],
-        ) -> Iterable[Frame]:
-            """
-
-            Args:
-                frame_indexer (int | float | Iterable[int]):
-                    * If int or float, the frame indexer is the frame sampling rate, e.g., 1/5 will return every 5th frame.
-                    * If Iterable[int], the frame indexer is the list of frames to return.
-
-            Returns:
-                Iterable[Frame]: Iterates over the frames as described by the frame_indexer.
-            """
-            if isinstance(frame_indexer, (int, float)):
-                # If frame_indexer is a float / int, it is the frame sampling rate
-                # The larger the frame_indexer, the more frames you get
-                if frame_indexer <= 0 or frame_indexer > 1:
-                    raise ValueError("Frame sampling rate must be between 0 and 1")
-                N_frames = get_frame_count(storage_item)
-                frame_indices = [int(k / frame_indexer) for k in range(N_frames)]
-            else:
-                frame_indices = sorted(frame_indexer)
-
-            def inner() -> Iterable[Frame]:
-                yield from iter_video_with_indices(asset, frame_indices)
-
-            return inner()
+    try:
+        frame_count: int | None = get_frame_count(storage_item)
+    except ValueError:
+        # Read from the video instead
+        frame_count = None
 
-        yield video_sampler
+    with open_video(storage_item, stream=get_video_streaming()) as asset:
+        yield VideoSampler(asset, frame_count=frame_count, fps=storage_item.fps)
 
 
 def dep_asset(storage_item: StorageItem) -> Generator[Path, None, None]:
@@ -262,6 +334,36 @@ def dep_asset(storage_item: StorageItem) -> Generator[Path, None, None]:
         yield asset
 
 
+def dep_assets(storage_items: list[StorageItem]) -> Generator[list[Path], None, None]:
+    """
+    Batch dependency to get local file paths to the data assets of a whole batch of tasks.
+
+    Unlike `dep_asset`, the assets are downloaded concurrently before the agent is called
+    on any of the tasks. Use it with `BatchDepends`. The assets are removed from disk
+    once the runner is done with the batch.
+
+    **Example:**
+
+    ```python
+    from encord_agents.tasks import BatchDepends
+    from encord_agents.tasks.dependencies import dep_assets
+    ...
+
+    @runner.stage("<stage_name_or_uuid>")
+    def my_agent(
+        asset: Annotated[Path, BatchDepends(dep_assets)],
+    ) -> str | None:
+        asset.stat()  # read file stats
+        ...
+    ```
+
+    Returns:
+        The path to the asset of every task.
+    """
+    with download_assets(storage_items) as assets:
+        yield assets
+
+
 @dataclass(frozen=True)
 class Twin:
     """
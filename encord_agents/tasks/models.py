@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Callable, TypeVar
+from typing import Awaitable, Callable, Sequence, TypeVar
 from uuid import UUID
 
 from encord.objects.ontology_labels_impl import LabelRowV2
@@ -30,7 +30,13 @@ class TaskAgentReturnStruct:
 
 TaskAgentReturnType = TaskAgentReturnPathway | TaskAgentReturnStruct
 
-DecoratedCallable = TypeVar("DecoratedCallable", bound=Callable[..., TaskAgentReturnType])
+TaskAgentBatchReturnType = Sequence[TaskAgentReturnType]
+"""What batch agents return: a value per task."""
+
+TaskAgentCallableReturnType = TaskAgentReturnType | TaskAgentBatchReturnType | Awaitable[TaskAgentReturnType]
+"""What agent functions return, including batch agents and `async` agents."""
+
+DecoratedCallable = TypeVar("DecoratedCallable", bound=Callable[..., TaskAgentCallableReturnType])
 
 
 class AgentTaskConfig(BaseModel):
@@ -1,5 +1,21 @@
+from .async_runner import AsyncRunner
+from .local_pool import LocalRunSummary
+from .producer import InMemorySink, QueuedTask, QueueProducer, SQLiteSink, TaskSink
 from .queue_runner import QueueRunner
+from .retry import RetryPolicy
 from .sequential_runner import SequentialRunner
 
 Runner = SequentialRunner
-__all__ = ["Runner", "SequentialRunner", "QueueRunner"]
+__all__ = [
+    "Runner",
+    "SequentialRunner",
+    "QueueRunner",
+    "AsyncRunner",
+    "RetryPolicy",
+    "QueueProducer",
+    "QueuedTask",
+    "TaskSink",
+    "InMemorySink",
+    "SQLiteSink",
+    "LocalRunSummary",
+]
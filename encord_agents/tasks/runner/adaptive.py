@@ -0,0 +1,206 @@
+import os
+import sys
+import threading
+
+
+def get_memory_usage() -> int | None:
+    """
+    Get the current memory usage (resident set size) of this process in bytes.
+
+    Falls back to the peak memory usage on platforms without `/proc`.
+
+    Returns:
+        The number of bytes or None if it could not be determined.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class AdaptiveBatchSizer:
+    """
+    Tunes the task batch size and the label row bundle size at runtime.
+
+    The sizer is fed with the measured duration of assembling a batch (listing
+    label rows and fetching storage items), the duration of every bundle of
+    labels that is initialised lazily while the batch executes, the duration
+    of executing the agent on the batch and the memory usage.
+
+    The batch size is doubled while fetching takes more than `target_fetch_share`
+    of the total time, as larger batches amortise the latency of the bulk requests.
+    It is halved whenever the time per task of a batch exceeds the average by more
+    than `latency_tolerance`, e.g., because the larger requests got slow.
+    It is capped by the number of tasks that are estimated to fit within
+    `max_memory_bytes` and halved whenever the memory usage exceeds it.
+    The batch size always stays within `[min_batch_size, max_batch_size]`.
+
+    The bundle size is tuned on its own from the duration of the label bundles:
+    it's doubled while the time per label row keeps dropping, halved when it
+    rises by more than `latency_tolerance` or the memory usage exceeds
+    `max_memory_bytes`, and stays within `[1, max_label_row_bundle_size]`.
+
+    All methods are thread-safe, such that measurements can be recorded from prefetching threads.
+    """
+
+    def __init__(
+        self,
+        initial_batch_size: int,
+        min_batch_size: int = 1,
+        max_batch_size: int = 1000,
+        *,
+        initial_bundle_size: int,
+        max_label_row_bundle_size: int,
+        max_memory_bytes: int | None = None,
+        target_fetch_share: float = 0.1,
+        latency_tolerance: float = 0.5,
+        smoothing: float = 0.5,
+    ) -> None:
+        if not 1 <= min_batch_size <= max_batch_size:
+            raise ValueError("We require that 1 <= `min_batch_size` <= `max_batch_size`")
+        if max_label_row_bundle_size < 1:
+            raise ValueError("We require that `max_label_row_bundle_size` >= 1")
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_label_row_bundle_size = max_label_row_bundle_size
+        self.max_memory_bytes = max_memory_bytes
+        self.target_fetch_share = target_fetch_share
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+
+        self._lock = threading.Lock()
+        self._batch_size = self._clamp(initial_batch_size)
+        self._bundle_size = self._clamp_bundle(initial_bundle_size)
+        self._baseline_memory = get_memory_usage()
+        self._last_memory: int | None = self._baseline_memory
+        self._assembly_seconds_per_task: float | None = None
+        self._last_assembly_seconds_per_task = 0.0
+        # Labels initialised lazily since the last batch finished executing
+        self._label_seconds = 0.0
+        self._label_seconds_per_task: float | None = None
+        self._label_seconds_per_row: float | None = None
+        self._execute_seconds_per_task: float | None = None
+        self._seconds_per_task: float | None = None
+        self._memory_per_task: float | None = None
+
+    def _clamp(self, batch_size: float) -> int:
+        return int(min(self.max_batch_size, max(self.min_batch_size, batch_size)))
+
+    def _clamp_bundle(self, bundle_size: float) -> int:
+        return int(min(self.max_label_row_bundle_size, max(1, bundle_size)))
+
+    def _smooth(self, previous: float | None, value: float) -> float:
+        if previous is None:
+            return value
+        return self.smoothing * value + (1 - self.smoothing) * previous
+
+    def _exceeds(self, value: float, average: float | None) -> bool:
+        return average is not None and value > average * (1 + self.latency_tolerance)
+
+    @property
+    def batch_size(self) -> int:
+        with self._lock:
+            return self._batch_size
+
+    @property
+    def bundle_size(self) -> int:
+        with self._lock:
+            return self._bundle_size
+
+    def record_assembly(self, num_tasks: int, seconds: float) -> None:
+        """
+        Record the time it took to assemble the contexts for a batch of `num_tasks` tasks.
+
+        The memory usage is sampled at this point, as that's when the label rows are loaded
+        unless their labels are initialised lazily.
+        """
+        if num_tasks < 1:
+            return
+        memory = get_memory_usage()
+        with self._lock:
+            self._last_assembly_seconds_per_task = seconds / num_tasks
+            self._assembly_seconds_per_task = self._smooth(
+                self._assembly_seconds_per_task, self._last_assembly_seconds_per_task
+            )
+            self._record_memory(num_tasks, memory)
+
+    def record_label_bundle(self, num_label_rows: int, seconds: float) -> None:
+        """
+        Record the time it took to initialise the labels of a bundle of `num_label_rows` label rows
+        while a batch executes, and adjust the bundle size.
+        """
+        if num_label_rows < 1:
+            return
+        with self._lock:
+            self._label_seconds += seconds
+            seconds_per_row = seconds / num_label_rows
+            previous = self._label_seconds_per_row
+            self._label_seconds_per_row = self._smooth(previous, seconds_per_row)
+            if self._exceeds(seconds_per_row, previous):
+                self._bundle_size = self._clamp_bundle(self._bundle_size / 2)
+            elif num_label_rows >= self._bundle_size and (previous is None or seconds_per_row < previous):
+                # Only full bundles show whether a larger one would pay off
+                self._bundle_size = self._clamp_bundle(self._bundle_size * 2)
+
+    def _record_memory(self, num_tasks: int, memory: int | None) -> None:
+        if memory is not None and self._baseline_memory is not None:
+            self._last_memory = memory
+            self._memory_per_task = self._smooth(
+                self._memory_per_task, max(0, memory - self._baseline_memory) / num_tasks
+            )
+
+    def record_execution(self, num_tasks: int, seconds: float) -> None:
+        """
+        Record the time it took to execute the agent on a batch of `num_tasks` tasks and adjust the batch size.
+
+        `seconds` includes the label bundles recorded with `record_label_bundle` in the meantime,
+        which count as fetching rather than executing.
+        The memory usage is sampled again, as labels may be loaded lazily during the execution.
+        """
+        if num_tasks < 1:
+            return
+        memory = get_memory_usage()
+        with self._lock:
+            label_seconds, self._label_seconds = self._label_seconds, 0.0
+            execute_seconds_per_task = max(0.0, seconds - label_seconds) / num_tasks
+            label_seconds_per_task = label_seconds / num_tasks
+            self._execute_seconds_per_task = self._smooth(self._execute_seconds_per_task, execute_seconds_per_task)
+            self._label_seconds_per_task = self._smooth(self._label_seconds_per_task, label_seconds_per_task)
+            self._record_memory(num_tasks, memory)
+            seconds_per_task = self._last_assembly_seconds_per_task + label_seconds_per_task + execute_seconds_per_task
+            self._adjust(seconds_per_task)
+            self._seconds_per_task = self._smooth(self._seconds_per_task, seconds_per_task)
+
+    def _adjust(self, seconds_per_task: float) -> None:
+        batch_size: float = self._batch_size
+        if self.max_memory_bytes is not None and self._last_memory is not None:
+            if self._last_memory > self.max_memory_bytes:
+                self._batch_size = self._clamp(batch_size / 2)
+                self._bundle_size = self._clamp_bundle(self._bundle_size / 2)
+                return
+
+        if self._exceeds(seconds_per_task, self._seconds_per_task):
+            self._batch_size = self._clamp(batch_size / 2)
+            return
+
+        if self._assembly_seconds_per_task is not None and self._execute_seconds_per_task is not None:
+            fetch = self._assembly_seconds_per_task + (self._label_seconds_per_task or 0.0)
+            total = fetch + self._execute_seconds_per_task
+            if total > 0 and fetch / total > self.target_fetch_share:
+                batch_size *= 2
+
+        if (
+            self.max_memory_bytes is not None
+            and self._baseline_memory is not None
+            and self._memory_per_task  # Not None nor zero
+        ):
+            batch_size = min(batch_size, (self.max_memory_bytes - self._baseline_memory) / self._memory_per_task)
+        self._batch_size = self._clamp(batch_size)
@@ -0,0 +1,260 @@
+import asyncio
+import itertools
+import threading
+import time
+import traceback
+from contextlib import AsyncExitStack
+from typing import Awaitable, Callable, Iterable, cast
+
+from encord.http.bundle import Bundle
+from encord.workflow.stages.agent import AgentStage
+
+from encord_agents.core.dependencies.models import Context
+from encord_agents.core.dependencies.utils import (
+    is_coroutine_callable,
+    solve_dependencies_async,
+)
+from encord_agents.exceptions import PrintableError
+from encord_agents.tasks.models import TaskAgentReturnType
+from encord_agents.tasks.runner.bundles import FlushingBundle
+from encord_agents.tasks.runner.retry import RetryPolicy
+from encord_agents.tasks.runner.runner_base import RunnerAgent
+from encord_agents.tasks.runner.sequential_runner import (
+    MAX_LABEL_ROW_BATCH_SIZE,
+    MAX_TASK_BUNDLE_SIZE,
+    SequentialRunner,
+)
+from encord_agents.tasks.runner.timeout import await_call_in_thread, await_with_timeout, run_event_loop
+
+DEFAULT_ASYNC_MAX_WORKERS = 100
+
+
+class AsyncRunner(SequentialRunner):
+    """
+    Runs `async def` agents against Workflow projects.
+
+    The `AsyncRunner` works like the `Runner` but awaits coroutine agents and
+    resolves `async def` and async generator dependencies.
+    The tasks of a batch are executed concurrently on a single event loop.
+    The number of tasks in flight at once is bounded by `max_workers` (default: 100).
+
+    Synchronous agents are supported too. They are executed on a thread such
+    that they don't block the event loop.
+
+    **Example:**
+
+    ```python title="example_agent.py"
+    from encord_agents.tasks import AsyncRunner
+    runner = AsyncRunner()
+
+    async def dep_http_client() -> AsyncIterator[httpx.AsyncClient]:
+        async with httpx.AsyncClient() as client:
+            yield client
+
+    @runner.stage("<workflow_node_name>")
+    async def my_agent(
+        task: AgentTask,
+        client: Annotated[httpx.AsyncClient, Depends(dep_http_client)],
+    ) -> str | UUID | None:
+        response = await client.post("<your_llm_endpoint>", json={...})
+        ...
+        return "pathway name"  # or pathway uuid
+
+
+    if __name__ == "__main__":
+        runner.run()
+    ```
+
+    Note that the runner drives the event loop itself.
+    It can thus not be called from within an already running event loop, e.g., in a Jupyter notebook.
+    Every batch of tasks runs on an event loop of its own, so async dependencies can at most have `batch` scope.
+    """
+
+    _supports_async = True
+    _default_max_workers = DEFAULT_ASYNC_MAX_WORKERS
+
+    @staticmethod
+    def _handle_agent_response_locked(
+        context: Context,
+        agent_response: TaskAgentReturnType,
+        stage: AgentStage,
+        task_bundle: Bundle,
+        label_bundle: Bundle,
+        bundle_lock: threading.Lock,
+    ) -> None:
+        with bundle_lock:
+            SequentialRunner._handle_agent_response(
+                context, agent_response, stage, task_bundle=task_bundle, label_bundle=label_bundle
+            )
+
+    @staticmethod
+    def _flush_if_due(task_bundle: FlushingBundle, label_bundle: FlushingBundle, bundle_lock: threading.Lock) -> None:
+        with bundle_lock:
+            task_bundle.flush_if_due()
+            label_bundle.flush_if_due()
+
+    @staticmethod
+    async def _execute_task_async(
+        context: Context,
+        runner_agent: RunnerAgent,
+        stage: AgentStage,
+        retry_policy: RetryPolicy,
+        task_bundle: Bundle,
+        label_bundle: Bundle,
+        bundle_lock: threading.Lock,
+        pbar_update: Callable[[float | None], bool | None] | None = None,
+        task_timeout: float | None = None,
+    ) -> None:
+        """
+        Execute the agent on a single task, retrying it according to `retry_policy`.
+
+        While the task waits for a retry, the event loop carries on with other tasks.
+        """
+        started = time.monotonic()
+        for retry in itertools.count():
+            try:
+                # Dependencies are solved per attempt, such that an abandoned attempt can keep using its own
+                stack = AsyncExitStack()
+                try:
+                    dependencies = await solve_dependencies_async(
+                        context=context, dependant=runner_agent.dependant, stack=stack, scopes=runner_agent.scopes
+                    )
+                except BaseException:
+                    await stack.aclose()
+                    raise
+                agent_response: TaskAgentReturnType
+                if is_coroutine_callable(runner_agent.callable):
+                    # On timeout, the coroutine is cancelled, so its dependencies can be cleaned up right away
+                    async with stack:
+                        agent_response = await await_with_timeout(
+                            cast(Awaitable[TaskAgentReturnType], runner_agent.callable(**dependencies.values)),
+                            task_timeout,
+                        )
+                else:
+                    # On timeout, the thread is abandoned rather than stopped. It cleans up once the agent is done.
+                    agent_response = await await_call_in_thread(
+                        cast(Callable[..., TaskAgentReturnType], runner_agent.callable),
+                        dependencies.values,
+                        task_timeout,
+                        cleanup=stack.aclose,
+                    )
+                # Saving label rows and flushing bundles are blocking requests, so they run on threads
+                await asyncio.to_thread(
+                    AsyncRunner._handle_agent_response_locked,
+                    context,
+                    agent_response,
+                    stage,
+                    task_bundle,
+                    label_bundle,
+                    bundle_lock,
+                )
+                if pbar_update is not None:
+                    pbar_update(1.0)
+                return
+
+            except PrintableError:
+                raise
+            except Exception as err:
+                delay = retry_policy.next_delay(err, retry, time.monotonic() - started)
+                print(f"[attempt {retry+1}/{retry_policy.max_retries+1}] Agent failed with error: ")
+                traceback.print_exc()
+                if delay is None:
+                    return
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    async def _execute_tasks_async(
+        contexts: Iterable[Context],
+        runner_agent: RunnerAgent,
+        stage: AgentStage,
+        retry_policy: RetryPolicy,
+        task_bundle: FlushingBundle,
+        label_bundle: FlushingBundle,
+        pbar_update: Callable[[float | None], bool | None] | None,
+        max_workers: int,
+        task_timeout: float | None = None,
+    ) -> None:
+        semaphore = asyncio.Semaphore(max_workers)
+        # The bundles are used from the threads that send their requests
+        bundle_lock = threading.Lock()
+
+        async def bounded_execution(context: Context) -> None:
+            try:
+                await AsyncRunner._execute_task_async(
+                    context,
+                    runner_agent,
+                    stage,
+                    retry_policy,
+                    task_bundle=task_bundle,
+                    label_bundle=label_bundle,
+                    bundle_lock=bundle_lock,
+                    pbar_update=pbar_update,
+                    task_timeout=task_timeout,
+                )
+            finally:
+                semaphore.release()
+
+        context_iter = iter(contexts)
+        in_flight: set[asyncio.Task[None]] = set()
+        try:
+            while True:
+                await semaphore.acquire()
+                done = {task for task in in_flight if task.done()}
+                in_flight -= done
+                for task in done:
+                    task.result()
+                await asyncio.to_thread(AsyncRunner._flush_if_due, task_bundle, label_bundle, bundle_lock)
+
+                # Contexts may initialise label rows lazily, which must not block the event loop
+                context = await asyncio.to_thread(next, context_iter, None)
+                if context is None:
+                    semaphore.release()
+                    break
+                in_flight.add(asyncio.create_task(bounded_execution(context)))
+            await asyncio.gather(*in_flight)
+        except BaseException:
+            for task in in_flight:
+                task.cancel()
+            raise
+        finally:
+            # Async generators must be torn down on the event loop that they were started on
+            await runner_agent.scopes["batch"].aclose()
+
+    @staticmethod
+    def _execute_tasks(
+        contexts: Iterable[Context],
+        runner_agent: RunnerAgent,
+        stage: AgentStage,
+        retry_policy: RetryPolicy,
+        pbar_update: Callable[[float | None], bool | None] | None = None,
+        max_workers: int = DEFAULT_ASYNC_MAX_WORKERS,
+        label_bundle_size: int = MAX_LABEL_ROW_BATCH_SIZE,
+        flush_interval: float | None = None,
+        task_timeout: float | None = None,
+    ) -> None:
+        """
+        INVARIANT: Tasks should always be for the stage that the runner_agent is associated too
+
+        Runs all the tasks of the batch on a fresh event loop with at most `max_workers` tasks in flight.
+        Contexts are consumed lazily as tasks complete.
+        """
+        label_bundle = FlushingBundle(
+            bundle_size=label_bundle_size, max_operations=label_bundle_size, max_age=flush_interval
+        )
+        task_bundle = FlushingBundle(
+            max_operations=MAX_TASK_BUNDLE_SIZE, max_age=flush_interval, dependencies=[label_bundle]
+        )
+        with task_bundle, label_bundle:
+            run_event_loop(
+                AsyncRunner._execute_tasks_async(
+                    SequentialRunner._prepare_batch_dependencies(contexts, runner_agent, label_bundle_size),
+                    runner_agent,
+                    stage,
+                    retry_policy,
+                    task_bundle=task_bundle,
+                    label_bundle=label_bundle,
+                    pbar_update=pbar_update,
+                    max_workers=max_workers,
+                    task_timeout=task_timeout,
+                )
+            )
@@ -0,0 +1,77 @@
+import time
+from typing import Any, Callable, Sequence
+
+from encord.http.bundle import Bundle, BundleResultMapper
+
+
+class FlushingBundle(Bundle):
+    """
+    A bundle that can execute its pending operations early.
+
+    Calling `flush_if_due` executes the pending operations if `max_operations` operations
+    are pending or the oldest pending operation was added more than `max_age` seconds ago.
+    Either way, the remaining operations are executed when the bundle is exited.
+    Operations are never executed from within `add`, such that adding them never fails
+    because of a failed request.
+
+    Bundles listed in `dependencies` are executed right before this bundle is.
+    E.g., a task bundle depending on the label bundle ensures that tasks are never
+    proceeded before the label rows that the agent updated are saved.
+
+    The bundle is not thread-safe. Guard it with the same lock as its dependencies
+    if operations are added from multiple threads.
+    """
+
+    def __init__(
+        self,
+        bundle_size: int | None = None,
+        *,
+        max_operations: int | None = None,
+        max_age: float | None = None,
+        dependencies: Sequence[Bundle] = (),
+    ) -> None:
+        super().__init__(bundle_size=bundle_size)
+        self.max_operations = max_operations
+        self.max_age = max_age
+        self.dependencies = list(dependencies)
+        self._num_pending = 0
+        self._oldest_pending: float | None = None
+
+    def add(
+        self,
+        operation: Callable[..., list[Any]],
+        result_mapper: BundleResultMapper[Any] | None,
+        payload: Any,
+        limit: int,
+    ) -> None:
+        super().add(operation, result_mapper, payload, limit)
+        self._num_pending += 1
+        if self._oldest_pending is None:
+            self._oldest_pending = time.monotonic()
+
+    def flush_if_due(self) -> bool:
+        """
+        Execute the pending operations if there are too many or they are too old.
+
+        Returns:
+            Whether the operations were executed.
+        """
+        if self._num_pending == 0:
+            return False
+        too_many = self.max_operations is not None and self._num_pending >= self.max_operations
+        too_old = (
+            self.max_age is not None
+            and self._oldest_pending is not None
+            and time.monotonic() - self._oldest_pending >= self.max_age
+        )
+        if too_many or too_old:
+            self.execute()
+            return True
+        return False
+
+    def execute(self) -> None:
+        for dependency in self.dependencies:
+            dependency.execute()
+        super().execute()
+        self._num_pending = 0
+        self._oldest_pending = None
@@ -0,0 +1,281 @@
+"""
+A compact binary encoding of the messages of the `QueueRunner`.
+
+Task specs made with `task.model_dump_json()` and JSON results spell out field names and UUIDs
+as text and can carry whole tracebacks. At millions of queued messages, that dominates the memory
+of the message broker. The compact encoding is a fixed binary layout instead:
+
+* A header of a magic byte, the version of the layout and the kind of message.
+* UUIDs as their raw 16 bytes.
+* Timestamps as microseconds since the epoch in UTC.
+* Strings as their length followed by their UTF-8 bytes.
+* Errors of results truncated to their last `max_error_bytes` bytes, optionally with a reference
+  to where the full error was stored.
+
+Compact messages are `bytes`, whereas JSON messages are `str`. The functions wrapped by
+`QueueRunner.stage` accept both and reply in the encoding of the task spec, so producers and
+consumers can switch over independently.
+
+```python
+from encord_agents.tasks.runner.codec import decode_result, encode_task_config
+
+queue.put(encode_task_config(task))  # ~80 bytes plus the data title
+
+result = decode_result(my_agent(queue.get()))
+```
+"""
+
+import json
+import struct
+from datetime import datetime, timedelta, timezone
+from typing import Callable, TypeGuard
+from uuid import UUID
+
+from encord.workflow.stages.agent import AgentTask
+
+from encord_agents.tasks.models import AgentTaskConfig, TaskCompletionResult
+
+MAGIC = 0xEA
+VERSION = 1
+TASK_CONFIG_KIND = 1
+COMPLETION_RESULT_KIND = 2
+DEFAULT_MAX_ERROR_BYTES = 2048
+TRUNCATION_MARKER = "[truncated]\n"
+
+# Magic byte, version, message kind
+_HEADER = struct.Struct("!BBB")
+# Task uuid, data hash, flags, created at, updated at, lengths of the data title, label branch name,
+# status, assignee and last actioned by
+_TASK_CONFIG = struct.Struct("!16s16sBqqIIIII")
+_FULL_TASK = 1
+_HAS_ASSIGNEE = 2
+_HAS_LAST_ACTIONED_BY = 4
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# Task uuid, stage uuid, pathway, flags, error length
+_COMPLETION_RESULT = struct.Struct("!16s16s16sBI")
+_SUCCESS = 1
+_HAS_STAGE = 2
+_HAS_PATHWAY = 4
+_HAS_ERROR = 8
+_NIL_UUID = bytes(16)
+
+ErrorStore = Callable[[UUID, str], str]
+"""Stores the full error of a task and returns a reference to it, e.g., a URL."""
+
+
+def is_compact(message: str | bytes) -> TypeGuard[bytes]:
+    """
+    Whether a message is compactly encoded rather than JSON.
+    """
+    return isinstance(message, (bytes, bytearray)) and len(message) >= _HEADER.size and message[0] == MAGIC
+
+
+def _check_header(message: bytes, kind: int) -> None:
+    if not is_compact(message):
+        raise ValueError("The message is not compactly encoded")
+    _, version, message_kind = _HEADER.unpack_from(message)
+    if version != VERSION:
+        raise ValueError(f"Unsupported version {version} of the compact encoding. Only version {VERSION} is supported.")
+    if message_kind != kind:
+        raise ValueError(f"Expected a message of kind {kind} but got one of kind {message_kind}")
+
+
+def _to_micros(timestamp: datetime) -> int:
+    # Like the JSON of the task, naive timestamps are read as UTC
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return (timestamp - _EPOCH) // timedelta(microseconds=1)
+
+
+def encode_task_config(task: AgentTask | AgentTaskConfig) -> bytes:
+    """
+    Compactly encode a task spec.
+
+    Tasks keep all their fields, like specs made with `task.model_dump_json()`, such that the wrapped
+    functions can rebuild them without looking them up. Task configs keep just the `AgentTaskConfig` fields.
+    """
+    if isinstance(task, AgentTask):
+        flags = (
+            _FULL_TASK
+            | (_HAS_ASSIGNEE if task.assignee is not None else 0)
+            | (_HAS_LAST_ACTIONED_BY if task.last_actioned_by is not None else 0)
+        )
+        task_uuid, created_at, updated_at = task.uuid, _to_micros(task.created_at), _to_micros(task.updated_at)
+        strings = [task.data_title, task.label_branch_name, task.status.value, task.assignee, task.last_actioned_by]
+    else:
+        flags, task_uuid, created_at, updated_at = 0, task.task_uuid, 0, 0
+        strings = [task.data_title, task.label_branch_name, None, None, None]
+    encoded = [(string or "").encode() for string in strings]
+    return b"".join(
+        (
+            _HEADER.pack(MAGIC, VERSION, TASK_CONFIG_KIND),
+            _TASK_CONFIG.pack(
+                task_uuid.bytes,
+                task.data_hash.bytes,
+                flags,
+                created_at,
+                updated_at,
+                *(len(string) for string in encoded),
+            ),
+            *encoded,
+        )
+    )
+
+
+def decode_task(message: bytes) -> AgentTask | AgentTaskConfig:
+    """
+    Decode a task spec encoded with `encode_task_config`.
+
+    Returns:
+        The task, or the task config if just the `AgentTaskConfig` fields were encoded.
+        The task is not bound to its stage, see `encord_agents.tasks.runner.queue_runner.task_from_spec`.
+
+    Raises:
+        ValueError: If the message is not a compactly encoded task spec.
+    """
+    message = bytes(message)
+    _check_header(message, TASK_CONFIG_KIND)
+    try:
+        task_uuid, data_hash, flags, created_at, updated_at, *lengths = _TASK_CONFIG.unpack_from(message, _HEADER.size)
+    except struct.error as err:
+        raise ValueError("The message is truncated") from err
+    offset = _HEADER.size + _TASK_CONFIG.size
+    if len(message) != offset + sum(lengths):
+        raise ValueError("The message is truncated")
+    strings: list[str] = []
+    for length in lengths:
+        strings.append(message[offset : offset + length].decode())
+        offset += length
+    data_title, label_branch_name, status, assignee, last_actioned_by = strings
+    if not flags & _FULL_TASK:
+        return AgentTaskConfig(
+            uuid=UUID(bytes=task_uuid),
+            data_hash=UUID(bytes=data_hash),
+            data_title=data_title,
+            label_branch_name=label_branch_name,
+        )
+    return AgentTask(
+        uuid=UUID(bytes=task_uuid),
+        created_at=_EPOCH + timedelta(microseconds=created_at),
+        updated_at=_EPOCH + timedelta(microseconds=updated_at),
+        status=status,
+        data_hash=UUID(bytes=data_hash),
+        data_title=data_title,
+        label_branch_name=label_branch_name,
+        assignee=assignee if flags & _HAS_ASSIGNEE else None,
+        last_actioned_by=last_actioned_by if flags & _HAS_LAST_ACTIONED_BY else None,
+    )
+
+
+def decode_task_config(message: bytes) -> AgentTaskConfig:
+    """
+    Decode the `AgentTaskConfig` fields of a task spec encoded with `encode_task_config`.
+
+    Raises:
+        ValueError: If the message is not a compactly encoded task spec.
+    """
+    task = decode_task(message)
+    if isinstance(task, AgentTaskConfig):
+        return task
+    return AgentTaskConfig(
+        uuid=task.uuid, data_hash=task.data_hash, data_title=task.data_title, label_branch_name=task.label_branch_name
+    )
+
+
+def task_spec_json(spec: str | bytes) -> str:
+    """
+    The JSON task spec of a task spec in either encoding.
+    """
+    if is_compact(spec):
+        task = decode_task(spec)
+        if isinstance(task, AgentTask):
+            return task.model_dump_json()
+        return json.dumps(
+            {
+                "uuid": str(task.task_uuid),
+                "data_hash": str(task.data_hash),
+                "data_title": task.data_title,
+                "label_branch_name": task.label_branch_name,
+            }
+        )
+    return spec.decode() if isinstance(spec, (bytes, bytearray)) else spec
+
+
+def truncate_error(error: str, max_error_bytes: int) -> str:
+    """
+    Keep the last `max_error_bytes` bytes of an error, where tracebacks name the actual exception.
+    """
+    encoded = error.encode()
+    if len(encoded) <= max_error_bytes:
+        return error
+    # Dropping a partial character at the cut
+    return TRUNCATION_MARKER + encoded[len(encoded) - max_error_bytes :].decode(errors="ignore")
+
+
+def encode_result(
+    result: TaskCompletionResult,
+    *,
+    max_error_bytes: int = DEFAULT_MAX_ERROR_BYTES,
+    store_error: ErrorStore | None = None,
+) -> bytes:
+    """
+    Compactly encode the result of a wrapped function.
+
+    Args:
+        result: The result.
+        max_error_bytes: Max number of bytes of the error to keep. Longer errors keep their end.
+        store_error: Called with the task uuid and the full error when the error is truncated.
+            The reference it returns is appended to the truncated error.
+    """
+    flags = (
+        (_SUCCESS if result.success else 0)
+        | (_HAS_STAGE if result.stage_uuid is not None else 0)
+        | (_HAS_PATHWAY if result.pathway is not None else 0)
+        | (_HAS_ERROR if result.error is not None else 0)
+    )
+    error = b""
+    if result.error is not None:
+        truncated = truncate_error(result.error, max_error_bytes)
+        if truncated != result.error and store_error is not None:
+            truncated += f"\nFull error: {store_error(result.task_uuid, result.error)}"
+        error = truncated.encode()
+    return b"".join(
+        (
+            _HEADER.pack(MAGIC, VERSION, COMPLETION_RESULT_KIND),
+            _COMPLETION_RESULT.pack(
+                result.task_uuid.bytes,
+                result.stage_uuid.bytes if result.stage_uuid is not None else _NIL_UUID,
+                result.pathway.bytes if result.pathway is not None else _NIL_UUID,
+                flags,
+                len(error),
+            ),
+            error,
+        )
+    )
+
+
+def decode_result(message: str | bytes) -> TaskCompletionResult:
+    """
+    Decode the result of a wrapped function, compactly encoded or JSON.
+
+    Raises:
+        ValueError: If the message is neither.
+    """
+    if not is_compact(message):
+        return TaskCompletionResult.model_validate_json(message)
+    message = bytes(message)
+    _check_header(message, COMPLETION_RESULT_KIND)
+    try:
+        task_uuid, stage_uuid, pathway, flags, error_length = _COMPLETION_RESULT.unpack_from(message, _HEADER.size)
+    except struct.error as err:
+        raise ValueError("The message is truncated") from err
+    offset = _HEADER.size + _COMPLETION_RESULT.size
+    if len(message) != offset + error_length:
+        raise ValueError("The message is truncated")
+    return TaskCompletionResult(
+        task_uuid=UUID(bytes=task_uuid),
+        stage_uuid=UUID(bytes=stage_uuid) if flags & _HAS_STAGE else None,
+        success=bool(flags & _SUCCESS),
+        pathway=UUID(bytes=pathway) if flags & _HAS_PATHWAY else None,
+        error=message[offset:].decode() if flags & _HAS_ERROR else None,
+    )
@@ -0,0 +1,214 @@
+"""
+Execution of queue runner agents on a local pool of worker processes.
+
+A `QueueProducer` puts the tasks of the agent stages into a `multiprocessing.Queue`,
+from which forked worker processes take them and call the wrapped stage functions, just like
+workers of a queueing system would. The workers inherit the runner and its agents without any
+pickling. The only things that cross the process boundary are:
+
+* The `QueuedTask`s sent to the workers.
+* The `TaskCompletionResult` JSON strings sent back to the runner process over a pipe per worker.
+
+Workers that crash, e.g., because they ran out of memory, are restarted, and the task they were
+working on is reported as failed. Workers that hang are not: the `task_timeout` of a stage is enforced
+within the worker, see `QueueRunner.run_local`.
+"""
+
+import math
+import multiprocessing
+import time
+import traceback
+from collections import Counter
+from dataclasses import dataclass, field
+from multiprocessing.connection import Connection, wait
+from multiprocessing.process import BaseProcess
+from typing import TYPE_CHECKING, Any
+from uuid import UUID
+
+from encord_agents.core.dependencies.scopes import PROCESS_SCOPE, DependencyScope
+from encord_agents.core.download import get_download_manager
+from encord_agents.exceptions import PrintableError
+from encord_agents.tasks.models import TaskCompletionResult
+from encord_agents.tasks.runner.producer import InMemorySink, QueuedTask
+
+if TYPE_CHECKING:
+    from encord_agents.tasks.runner.queue_runner import QueueRunner
+
+WorkerMessage = tuple[UUID, UUID, str | None]
+"""(task uuid, stage uuid, result JSON or None when the worker starts on the task)"""
+
+
+@dataclass
+class LocalRunSummary:
+    """
+    The results of `QueueRunner.run_local`.
+    """
+
+    succeeded: int = 0
+    failed: list[TaskCompletionResult] = field(default_factory=list)
+    """The results of the tasks that the agents failed on, including the tasks of crashed workers."""
+    pathways: Counter[UUID] = field(default_factory=Counter)
+    """The number of tasks that were passed along each pathway."""
+    worker_restarts: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.succeeded + len(self.failed)
+
+    def add(self, result: TaskCompletionResult) -> None:
+        if result.success:
+            self.succeeded += 1
+            if result.pathway is not None:
+                self.pathways[result.pathway] += 1
+        else:
+            self.failed.append(result)
+
+
+def _run_worker(runner: "QueueRunner", task_queue: Any, connection: Connection) -> None:
+    # The pooled connections were opened by the runner process. Don't share them.
+    get_download_manager().reset()
+    # Scoped dependencies that were inherited from the runner process belong to the runner process
+    scopes: list[DependencyScope] = [PROCESS_SCOPE]
+    scopes.extend(scope for runner_agent in runner.agents for scope in runner_agent.scopes.values())
+    for scope in scopes:
+        scope.discard()
+    try:
+        while (queued_task := task_queue.get()) is not None:
+            # Sending is synchronous, so the runner process knows the task even if the worker crashes on it
+            started: WorkerMessage = (queued_task.task_uuid, queued_task.stage_uuid, None)
+            connection.send(started)
+            wrapper = runner._wrappers.get(queued_task.stage_uuid)
+            try:
+                if wrapper is None:
+                    raise PrintableError(f"The runner has no agent for stage `{queued_task.stage_uuid}`")
+                result_json = wrapper(queued_task.task_spec)
+            except Exception:
+                # The wrapper reports failures of the agent itself. Keep the worker alive for the others.
+                result_json = TaskCompletionResult(
+                    task_uuid=queued_task.task_uuid,
+                    stage_uuid=queued_task.stage_uuid,
+                    success=False,
+                    error=traceback.format_exc(),
+                ).model_dump_json()
+            completed: WorkerMessage = (queued_task.task_uuid, queued_task.stage_uuid, result_json)
+            connection.send(completed)
+    finally:
+        for scope in scopes:
+            scope.close()
+        connection.close()
+
+
+@dataclass
+class _Worker:
+    process: BaseProcess
+    connection: Connection
+    current: tuple[UUID, UUID] | None = None
+    """The task uuid and stage uuid of the task that the worker is working on."""
+
+
+def run_local_pool(
+    runner: "QueueRunner",
+    workers: int,
+    *,
+    max_outstanding: int,
+    poll_interval: float,
+    run_forever: bool,
+    done_ttl: float = math.inf,
+) -> LocalRunSummary:
+    """
+    Execute the agents of the runner on `workers` forked worker processes.
+
+    Every task is executed at most once every `done_ttl` seconds. Without `run_forever`, this returns
+    once no agent stage has tasks left that weren't executed.
+    """
+    if "fork" not in multiprocessing.get_all_start_methods():
+        raise PrintableError(
+            "Executing agents in multiple processes requires the `fork` start method, which is not available on your platform."
+        )
+    context = multiprocessing.get_context("fork")
+    task_queue = context.Queue()
+    # Crashed workers are detected directly, so tasks never expire
+    producer = runner.create_producer(
+        InMemorySink(task_queue),
+        max_outstanding=max_outstanding,
+        in_flight_ttl=math.inf,
+        requeue_done=False,
+        done_ttl=done_ttl,
+    )
+    summary = LocalRunSummary()
+
+    def start_worker() -> _Worker:
+        # Every worker has a pipe of its own, such that a crashing worker can't corrupt the messages of the others
+        reader, writer = context.Pipe(duplex=False)
+        process = context.Process(target=_run_worker, args=(runner, task_queue, writer))
+        process.start()
+        writer.close()
+        return _Worker(process=process, connection=reader)
+
+    def complete(result: TaskCompletionResult) -> None:
+        producer.mark_done(result)
+        summary.add(result)
+
+    def receive(worker: _Worker) -> None:
+        try:
+            while worker.connection.poll():
+                message: WorkerMessage = worker.connection.recv()
+                task_uuid, stage_uuid, result_json = message
+                if result_json is None:
+                    worker.current = (task_uuid, stage_uuid)
+                else:
+                    worker.current = None
+                    complete(TaskCompletionResult.model_validate_json(result_json))
+        except EOFError:  # The worker exited
+            pass
+
+    def restart_if_crashed(worker_index: int) -> None:
+        worker = pool[worker_index]
+        if worker.process.is_alive():
+            return
+        worker.process.join()
+        receive(worker)
+        worker.connection.close()
+        if worker.current is not None:
+            task_uuid, stage_uuid = worker.current
+            complete(
+                TaskCompletionResult(
+                    task_uuid=task_uuid,
+                    stage_uuid=stage_uuid,
+                    success=False,
+                    error=f"The worker process crashed with exit code {worker.process.exitcode}",
+                )
+            )
+        summary.worker_restarts += 1
+        pool[worker_index] = start_worker()
+
+    pool = [start_worker() for _ in range(workers)]
+    try:
+        last_pass = -math.inf
+        while True:
+            if producer.outstanding == 0 or time.monotonic() - last_pass >= poll_interval:
+                queued = producer.produce()
+                last_pass = time.monotonic()
+                if queued == 0 and producer.outstanding == 0:
+                    if not run_forever:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+            wait(
+                [worker.connection for worker in pool] + [worker.process.sentinel for worker in pool],
+                timeout=max(0.0, last_pass + poll_interval - time.monotonic()),
+            )
+            for worker_index, worker in enumerate(pool):
+                receive(worker)
+                restart_if_crashed(worker_index)
+    except BaseException:
+        for worker in pool:
+            worker.process.terminate()
+        raise
+    finally:
+        for _ in pool:
+            task_queue.put(None)
+        for worker in pool:
+            worker.process.join()
+            worker.connection.close()
+    return summary
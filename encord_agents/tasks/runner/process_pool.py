@@ -0,0 +1,217 @@
+"""
+Execution of task agents on a pool of worker processes.
+
+Worker processes are forked from the runner process. They thereby inherit the
+runner and its agents without any pickling. Every worker authenticates its own
+`EncordUserClient` and resolves all the dependencies of the tasks that it
+executes. The only things that cross the process boundary are:
+
+* The task uuids and data hashes sent to the workers.
+* The keyword arguments for `task.proceed` sent back to the runner process.
+
+Hence, neither the agents nor dependencies (nor their return values) have to be picklable.
+"""
+
+import multiprocessing
+import multiprocessing.util
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable
+from uuid import UUID
+
+from encord.http.bundle import Bundle
+from encord.project import Project
+from encord.user_client import EncordUserClient
+from encord.workflow.stages.agent import AgentStage, AgentTask
+
+from encord_agents.core.data_model import LabelRowInitialiseLabelsArgs, LabelRowMetadataIncludeArgs
+from encord_agents.core.dependencies.scopes import PROCESS_SCOPE, DependencyScope
+from encord_agents.core.download import get_download_manager
+from encord_agents.core.utils import batch_iterator, get_user_client, get_user_client_from_settings
+from encord_agents.exceptions import PrintableError
+
+if TYPE_CHECKING:
+    from encord_agents.tasks.runner.sequential_runner import SequentialRunner
+
+TaskSpec = tuple[UUID, UUID]
+"""(task uuid, data hash)"""
+TaskOutcome = tuple[UUID, dict[str, str] | None]
+"""(task uuid, keyword arguments for `task.proceed`)"""
+
+
+@dataclass
+class _ProcessWorkerState:
+    runner: "SequentialRunner"
+    client: EncordUserClient
+    project: Project
+    stages: dict[UUID, AgentStage] = field(default_factory=dict)
+
+
+_worker_state: _ProcessWorkerState | None = None
+
+
+def _init_process_worker(runner: "SequentialRunner", project_hash: str) -> None:
+    global _worker_state
+    # The cached client was created by the parent process. Don't share its connections.
+    get_user_client_from_settings.cache_clear()
+    get_download_manager().reset()
+    client = get_user_client()
+    _worker_state = _ProcessWorkerState(runner=runner, client=client, project=client.get_project(project_hash))
+    # Scoped dependencies that were inherited from the runner process belong to the runner process
+    scopes: list[DependencyScope] = [PROCESS_SCOPE]
+    scopes.extend(scope for runner_agent in runner.agents for scope in runner_agent.scopes.values())
+    for scope in scopes:
+        scope.discard()
+    # Forked processes skip `atexit` handlers, but do run multiprocessing finalizers
+    multiprocessing.util.Finalize(None, _close_scopes, args=(scopes,), exitpriority=10)
+
+
+def _close_scopes(scopes: list[DependencyScope]) -> None:
+    for scope in scopes:
+        scope.close()
+
+
+def _execute_task_chunk(
+    agent_index: int,
+    stage_uuid: UUID,
+    task_specs: list[TaskSpec],
+    num_retries: int,
+    max_workers: int,
+    task_timeout: float | None = None,
+) -> list[TaskOutcome]:
+    """
+    Execute the agent on a chunk of tasks within a worker process.
+
+    Label row updates are saved from the worker before returning.
+    Proceeding the tasks is left to the runner process.
+    """
+    assert _worker_state is not None, "Process worker was not initialised"
+    state = _worker_state
+    runner = state.runner
+    runner_agent = runner.agents[agent_index]
+    stage = state.stages.get(stage_uuid)
+    if stage is None:
+        stage = state.project.workflow.get_stage(uuid=stage_uuid, type_=AgentStage)
+        state.stages[stage_uuid] = stage
+
+    task_uuids = {task_uuid for task_uuid, _ in task_specs}
+    tasks = {
+        task.uuid: task
+        for task in stage.get_tasks(data_hash=[data_hash for _, data_hash in task_specs])
+        if task.uuid in task_uuids
+    }
+    # Tasks might have been moved by someone else in the meantime
+    task_batch = [tasks[task_uuid] for task_uuid, _ in task_specs if task_uuid in tasks]
+    if not task_batch:
+        return []
+
+    contexts = runner._assemble_contexts(
+        task_batch=task_batch,
+        runner_agent=runner_agent,
+        project=state.project,
+        include_args=runner_agent.label_row_metadata_include_args or LabelRowMetadataIncludeArgs(),
+        init_args=runner_agent.label_row_initialise_labels_args or LabelRowInitialiseLabelsArgs(),
+        stage=stage,
+        client=state.client,
+    )
+    retry_policy = runner.retry_policy.with_max_retries(num_retries)
+    proceed_kwargs: dict[UUID, dict[str, str] | None] = {}
+    try:
+        with Bundle() as label_bundle:
+            if runner_agent.batch:
+                for batch in batch_iterator(contexts, runner_agent.max_batch_size or len(contexts)):
+                    batch_kwargs = runner._call_batch_agent(
+                        batch,
+                        runner_agent,
+                        stage,
+                        retry_policy,
+                        task_bundle=None,
+                        label_bundle=label_bundle,
+                        task_timeout=task_timeout,
+                    )
+                    proceed_kwargs.update(
+                        (context.task.uuid, kwargs) for context, kwargs in zip(batch, batch_kwargs) if context.task
+                    )
+            else:
+                runs = runner._execute_runs(
+                    runner._prepare_batch_dependencies(contexts, runner_agent, len(contexts)),
+                    runner_agent,
+                    stage,
+                    retry_policy,
+                    task_bundle=None,
+                    label_bundle=label_bundle,
+                    bundle_lock=threading.Lock(),
+                    max_workers=max_workers,
+                    task_timeout=task_timeout,
+                )
+                proceed_kwargs.update((run.context.task.uuid, run.proceed_kwargs) for run in runs if run.context.task)
+    finally:
+        # Every chunk is a batch from the point of view of the worker
+        runner_agent.scopes["batch"].close()
+    return [(task.uuid, proceed_kwargs.get(task.uuid)) for task in task_batch]
+
+
+def create_process_pool(runner: "SequentialRunner", project_hash: str, num_processes: int) -> ProcessPoolExecutor:
+    """
+    Start `num_processes` worker processes for the runner.
+
+    Workers are forked, so this should be called before the runner starts any threads.
+    """
+    if "fork" not in multiprocessing.get_all_start_methods():
+        raise PrintableError(
+            "Executing agents in multiple processes requires the `fork` start method, which is not available on your platform. Please use `max_workers` instead."
+        )
+    pool = ProcessPoolExecutor(
+        max_workers=num_processes,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_init_process_worker,
+        initargs=(runner, project_hash),
+    )
+    # Forces all the workers to start now, before the runner starts any threads
+    pool.submit(os.getpid).result()
+    return pool
+
+
+def execute_tasks_in_processes(
+    pool: ProcessPoolExecutor,
+    task_batch: list[AgentTask],
+    agent_index: int,
+    stage: AgentStage,
+    num_retries: int,
+    num_processes: int,
+    max_workers: int,
+    pbar_update: Callable[[float | None], bool | None] | None = None,
+    task_timeout: float | None = None,
+) -> None:
+    """
+    Partition a task batch across the worker processes and proceed the tasks in a single bundle.
+    """
+    tasks = {task.uuid: task for task in task_batch}
+    chunk_size = -(-len(task_batch) // num_processes)  # ceil division
+    futures: list[Future[list[TaskOutcome]]] = [
+        pool.submit(
+            _execute_task_chunk,
+            agent_index,
+            stage.uuid,
+            [(task.uuid, task.data_hash) for task in task_batch[start : start + chunk_size]],
+            num_retries,
+            max_workers,
+            task_timeout,
+        )
+        for start in range(0, len(task_batch), chunk_size)
+    ]
+    with Bundle() as task_bundle:
+        try:
+            for future in futures:
+                outcomes = future.result()
+                for task_uuid, proceed_kwargs in outcomes:
+                    if proceed_kwargs is not None:
+                        tasks[task_uuid].proceed(**proceed_kwargs, bundle=task_bundle)
+                if pbar_update is not None:
+                    pbar_update(float(len(outcomes)))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
@@ -0,0 +1,271 @@
+import math
+import queue
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import closing
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, NamedTuple
+from uuid import UUID
+
+from encord_agents.tasks.models import TaskCompletionResult
+from encord_agents.tasks.runner.codec import decode_result, encode_task_config
+
+if TYPE_CHECKING:
+    from encord_agents.tasks.runner.queue_runner import QueueRunner
+
+
+class QueuedTask(NamedTuple):
+    """
+    A task spec as it's put into a queue by the `QueueProducer`.
+
+    Call the agent of the stage with `stage_uuid` with the `task_spec`.
+    """
+
+    stage_uuid: UUID
+    task_uuid: UUID
+    task_spec: str | bytes
+
+
+class TaskSink(ABC):
+    """
+    Where the `QueueProducer` puts tasks, e.g., a message broker.
+
+    Implement `put` to plug in your own queueing system.
+    """
+
+    @abstractmethod
+    def put(self, task: QueuedTask) -> None:
+        """
+        Put a task into the queue.
+        """
+
+
+class InMemorySink(TaskSink):
+    """
+    Puts tasks into a `queue.Queue` or a `multiprocessing.Queue`.
+
+    With a `multiprocessing.Queue`, worker processes can consume the tasks.
+
+    Args:
+        task_queue: The queue to put the tasks into. Defaults to a new `queue.Queue`.
+    """
+
+    def __init__(self, task_queue: "queue.Queue[QueuedTask] | Any | None" = None) -> None:
+        self.queue = task_queue if task_queue is not None else queue.Queue()
+
+    def put(self, task: QueuedTask) -> None:
+        self.queue.put(task)
+
+    def get(self, timeout: float | None = None) -> QueuedTask | None:
+        """
+        Take the next task from the queue.
+
+        Returns:
+            The task or None if there was none within `timeout` seconds.
+        """
+        try:
+            task: QueuedTask = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        return task
+
+
+class SQLiteSink(TaskSink):
+    """
+    Puts tasks into a table in a local SQLite database, which multiple processes can consume from.
+
+    A task that is already queued is not queued again.
+
+    Args:
+        path: The path of the database file. Created if it doesn't exist.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        with closing(self._connect()) as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "task_uuid TEXT NOT NULL UNIQUE, "
+                "stage_uuid TEXT NOT NULL, "
+                # Holds compact specs as bytes and JSON specs as text
+                "task_spec BLOB NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # Waits for locks held by other processes
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def put(self, task: QueuedTask) -> None:
+        with closing(self._connect()) as connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO tasks (task_uuid, stage_uuid, task_spec) VALUES (?, ?, ?)",
+                (str(task.task_uuid), str(task.stage_uuid), task.task_spec),
+            )
+
+    def get(self) -> QueuedTask | None:
+        """
+        Take the oldest task from the queue.
+
+        Returns:
+            The task or None if the queue is empty.
+        """
+        connection = self._connect()
+        try:
+            # Takes the write lock right away, such that no two consumers take the same task
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute(
+                "SELECT id, stage_uuid, task_uuid, task_spec FROM tasks ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                connection.execute("DELETE FROM tasks WHERE id = ?", (row[0],))
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+        if row is None:
+            return None
+        return QueuedTask(stage_uuid=UUID(row[1]), task_uuid=UUID(row[2]), task_spec=row[3])
+
+    def __len__(self) -> int:
+        with closing(self._connect()) as connection:
+            count: int = connection.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+        return count
+
+
+class QueueProducer:
+    """
+    Puts the tasks of the agent stages of a `QueueRunner` into a queue.
+
+    The producer keeps track of the tasks it queued that are still in flight, such that they are not
+    queued twice. A task is in flight until
+
+    - it's marked done with `mark_done`, e.g., with the result of the agent,
+    - it's not in its agent stage anymore the next time the producer lists the stage, or
+    - `in_flight_ttl` seconds have passed, e.g., because the worker that took it crashed.
+
+    At most `max_outstanding` tasks are in flight at once, which bounds the length of the queue.
+
+    Args:
+        runner: The runner whose agent stages to take the tasks from.
+        sink: The queue to put the tasks into.
+        max_outstanding: Max number of tasks in flight. If None, all tasks are queued.
+        in_flight_ttl: Seconds after which a task that is still in flight is queued again.
+        requeue_done: Whether to queue tasks again that were marked done but are still in their stage,
+            e.g., because the agent failed on them. If False, every task is queued at most once
+            (or again, once its `in_flight_ttl` or `done_ttl` expired).
+        done_ttl: Seconds after which a task that was marked done but is still in its stage is queued again
+            if `requeue_done` is False. Tasks that left their stage are forgotten either way.
+        compact: Queue compactly encoded task specs, see `encord_agents.tasks.runner.codec`, rather than
+            `task.model_dump_json()`. They're a fraction of the size and hold the same fields.
+    """
+
+    def __init__(
+        self,
+        runner: "QueueRunner",
+        sink: TaskSink,
+        *,
+        max_outstanding: int | None = None,
+        in_flight_ttl: float = 3600.0,
+        requeue_done: bool = True,
+        done_ttl: float = math.inf,
+        compact: bool = False,
+    ) -> None:
+        if max_outstanding is not None and max_outstanding < 1:
+            raise ValueError("We require that `max_outstanding` >= 1")
+        if in_flight_ttl <= 0:
+            raise ValueError("We require that `in_flight_ttl` > 0")
+        if done_ttl <= 0:
+            raise ValueError("We require that `done_ttl` > 0")
+        self.runner = runner
+        self.sink = sink
+        self.max_outstanding = max_outstanding
+        self.in_flight_ttl = in_flight_ttl
+        self.requeue_done = requeue_done
+        self.done_ttl = done_ttl
+        self.compact = compact
+        # Task uuid to the uuid of its stage and the time at which it was queued
+        self._in_flight: dict[UUID, tuple[UUID, float]] = {}
+        # Task uuid to the uuid of its stage, if known, and the time at which it was marked done
+        self._done: dict[UUID, tuple[UUID | None, float]] = {}
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float) -> None:
+        for task_uuid, (_, queued_at) in list(self._in_flight.items()):
+            if now - queued_at >= self.in_flight_ttl:
+                del self._in_flight[task_uuid]
+        for task_uuid, (_, done_at) in list(self._done.items()):
+            if now - done_at >= self.done_ttl:
+                del self._done[task_uuid]
+
+    @property
+    def outstanding(self) -> int:
+        """
+        The number of tasks in flight.
+        """
+        with self._lock:
+            self._expire(time.monotonic())
+            return len(self._in_flight)
+
+    def mark_done(self, result: str | bytes | TaskCompletionResult | UUID) -> None:
+        """
+        Stop tracking a task, which frees up room for another one.
+
+        Args:
+            result: The result of the agent, as returned by the wrapped function, or the task uuid.
+        """
+        if isinstance(result, (str, bytes)):
+            result = decode_result(result)
+        task_uuid = result.task_uuid if isinstance(result, TaskCompletionResult) else result
+        with self._lock:
+            in_flight = self._in_flight.pop(task_uuid, None)
+            if not self.requeue_done:
+                stage_uuid = in_flight[0] if in_flight is not None else None
+                if stage_uuid is None and isinstance(result, TaskCompletionResult):
+                    stage_uuid = result.stage_uuid
+                self._done[task_uuid] = (stage_uuid, time.monotonic())
+
+    def produce(self) -> int:
+        """
+        List the tasks of all agent stages once and queue the ones that are not in flight, up to `max_outstanding`.
+
+        Returns:
+            The number of tasks that were queued.
+        """
+        queued = 0
+        for stage in self.runner.get_agent_stages():
+            listed: set[UUID] = set()
+            for task in stage.get_tasks():
+                listed.add(task.uuid)
+                with self._lock:
+                    now = time.monotonic()
+                    self._expire(now)
+                    if task.uuid in self._in_flight or task.uuid in self._done:
+                        continue
+                    if self.max_outstanding is not None and len(self._in_flight) >= self.max_outstanding:
+                        # Keep listing to find the tasks that are done
+                        continue
+                    self._in_flight[task.uuid] = (stage.uuid, now)
+                task_spec = encode_task_config(task) if self.compact else task.model_dump_json()
+                self.sink.put(QueuedTask(stage_uuid=stage.uuid, task_uuid=task.uuid, task_spec=task_spec))
+                queued += 1
+            with self._lock:
+                # Tasks that left the stage are done. Tasks of other stages are left alone.
+                done = [t for t, (s, _) in self._in_flight.items() if s == stage.uuid and t not in listed]
+                for task_uuid in done:
+                    del self._in_flight[task_uuid]
+                # Tasks that left the stage can't be queued again, so there is no need to remember them
+                left = [t for t, (s, _) in self._done.items() if s == stage.uuid and t not in listed]
+                for task_uuid in left:
+                    del self._done[task_uuid]
+        return queued
+
+    def run(self, *, poll_interval: float = 10.0, stop: threading.Event | None = None) -> None:
+        """
+        Produce until `stop` is set, listing the agent stages every `poll_interval` seconds.
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            self.produce()
+            stop.wait(poll_interval)
@@ -1,19 +1,47 @@
+import atexit
+import logging
+import math
+import os
+import time
 import traceback
 from contextlib import ExitStack
 from functools import wraps
-from typing import Any, Callable, Iterable
+from typing import Any, Callable, Iterable, Protocol, cast, overload
 from uuid import UUID
 
+from encord.http.bundle import Bundle
+from encord.issues.issue_client import TaskIssues
 from encord.project import Project
 from encord.workflow.stages.agent import AgentStage, AgentTask
+from pydantic import ValidationError
 
 from encord_agents.core.data_model import LabelRowInitialiseLabelsArgs, LabelRowMetadataIncludeArgs
-from encord_agents.core.dependencies.utils import solve_dependencies
+from encord_agents.core.dependencies.models import Context, DependencyScopeName
+from encord_agents.core.dependencies.scopes import DependencyScope
+from encord_agents.core.dependencies.utils import prepare_batch_dependencies, solve_dependencies
 from encord_agents.exceptions import PrintableError
 from encord_agents.tasks.models import AgentTaskConfig, TaskAgentReturnStruct, TaskAgentReturnType, TaskCompletionResult
+from encord_agents.tasks.runner.bundles import FlushingBundle
+from encord_agents.tasks.runner.codec import (
+    DEFAULT_MAX_ERROR_BYTES,
+    ErrorStore,
+    encode_result,
+    is_compact,
+    task_spec_json,
+)
+from encord_agents.tasks.runner.local_pool import LocalRunSummary, run_local_pool
+from encord_agents.tasks.runner.producer import QueueProducer, TaskSink
+from encord_agents.tasks.runner.retry import RetryPolicy
 from encord_agents.tasks.runner.runner_base import RunnerBase
+from encord_agents.tasks.runner.sequential_runner import (
+    MAX_LABEL_ROW_BATCH_SIZE,
+    SequentialRunner,
+)
+from encord_agents.tasks.runner.timeout import call_with_timeout
 from encord_agents.utils.generic_utils import try_coerce_UUID
 
+logger = logging.getLogger(__name__)
+
 
 def handle_pathway(
     task: AgentTask,
@@ -24,8 +52,7 @@ def handle_pathway(
 ) -> UUID | None:
     next_stage_uuid: UUID | None = None
     if pathway_to_follow is None:
-        # TODO: Should we log that task didn't continue?
-        pass
+        logger.info(f"Task {task.uuid} stays in stage {stage.title}, as the agent returned no pathway")
     elif next_stage_uuid := try_coerce_UUID(pathway_to_follow):
         if next_stage_uuid not in pathway_lookup.keys():
             raise PrintableError(
@@ -42,6 +69,85 @@ def handle_pathway(
     return next_stage_uuid
 
 
+def task_from_spec(json_str: str, stage: AgentStage) -> AgentTask:
+    """
+    Rebuild a task that can be proceeded from a task spec, without looking it up with `stage.get_tasks`.
+
+    The task is not checked to still be in the stage. Specs serialized with `task.model_dump_json()`
+    rebuild the whole task. Specs that carry just the `AgentTaskConfig` fields rebuild a task with
+    only those fields set, which suffices to proceed it.
+
+    Raises:
+        ValidationError: If `json_str` is not a task spec.
+    """
+    try:
+        task = AgentTask.model_validate_json(json_str)
+    except ValidationError:
+        config = AgentTaskConfig.model_validate_json(json_str)
+        # The other fields are unknown, so they're left unset
+        task = AgentTask.model_construct(  # type: ignore[call-arg]
+            uuid=config.task_uuid,
+            data_hash=config.data_hash,
+            data_title=config.data_title,
+            label_branch_name=config.label_branch_name,
+        )
+    return bind_task(task, stage)
+
+
+_BOUND_TASK_ATTRIBUTES = ("_stage_uuid", "_workflow_client", "_task_issues")
+
+
+def bind_task(task: AgentTask, stage: AgentStage) -> AgentTask:
+    """
+    Set a task up to be proceeded in `stage`, like `AgentStage.get_tasks` does for the tasks it lists.
+
+    encord has no public way to do so, so this sets the private attributes that `AgentStage.get_tasks` sets.
+
+    Raises:
+        PrintableError: If the installed version of encord doesn't have those attributes anymore.
+    """
+    missing = [f"AgentTask.{name}" for name in _BOUND_TASK_ATTRIBUTES if name not in AgentTask.__private_attributes__]
+    workflow_client = getattr(stage, "_workflow_client", None)
+    if workflow_client is None:
+        missing.append("AgentStage._workflow_client")
+    if missing or workflow_client is None:
+        raise PrintableError(
+            f"The installed version of encord doesn't set up tasks as expected ({', '.join(missing)} not found), "
+            "so tasks can't be rebuilt from their specs. Pass `verify_task_specs=True` to the `QueueRunner` "
+            "to look them up instead."
+        )
+    task._stage_uuid = stage.uuid
+    task._workflow_client = workflow_client
+    task._task_issues = TaskIssues(
+        api_client=workflow_client.api_client, project_uuid=workflow_client.project_hash, data_uuid=task.data_hash
+    )
+    return task
+
+
+class QueueAgentWrapper(Protocol):
+    """
+    An agent wrapped by `QueueRunner.stage`.
+
+    Call it with a task spec to execute the agent on a single task, or call `batch` with many task specs
+    to execute the agent on all of them with a single round-trip to Encord per resource type.
+
+    Task specs are JSON strings or compactly encoded bytes, see `encord_agents.tasks.runner.codec`.
+    The results are encoded like the task specs.
+    """
+
+    @overload
+    def __call__(self, json_str: str) -> str: ...
+
+    @overload
+    def __call__(self, json_str: bytes) -> bytes: ...
+
+    @overload
+    def batch(self, json_strs: list[str]) -> list[str]: ...
+
+    @overload
+    def batch(self, json_strs: list[bytes]) -> list[bytes]: ...
+
+
 class QueueRunner(RunnerBase):
     """
     This class is intended to hold agent implementations.
@@ -60,20 +166,29 @@ class QueueRunner(RunnerBase):
         return "<pathway_name>"
 
     # Populate the queue
-    my_queue = ...
-    for stage in runner.get_agent_stages():
-        for task in stage.get_tasks():
-            my_queue.append(task.model_dump_json())
+    sink = InMemorySink()
+    producer = runner.create_producer(sink, max_outstanding=1000)
+    producer.produce()
 
     # Execute on the queue
-    while my_queue:
-        task_spec = my_queue.pop()
-        result_json = my_agent_implementation(task_spec)
+    while (queued_task := sink.get(timeout=0)) is not None:
+        result_json = my_agent_implementation(queued_task.task_spec)
+        producer.mark_done(result_json)
         result = TaskCompletionResult.model_validate_json(result_json)
     ```
+
+    Implement a `TaskSink` to put the tasks into your own queueing system.
     """
 
-    def __init__(self, project_hash: str | UUID):
+    def __init__(
+        self,
+        project_hash: str | UUID,
+        *,
+        retry_policy: RetryPolicy | None = None,
+        verify_task_specs: bool = True,
+        max_error_bytes: int = DEFAULT_MAX_ERROR_BYTES,
+        store_error: ErrorStore | None = None,
+    ):
         """
         Initialize the QueueRunner with a project hash.
 
@@ -81,8 +196,28 @@ class QueueRunner(RunnerBase):
 
         Args:
             project_hash: The hash of the project to run the tasks on.
+            retry_policy: Decides if and when a wrapped function retries a task on which the
+                agent failed before returning a failed `TaskCompletionResult`. The wrapped function
+                waits for the retries. If `None`, tasks are not retried, leaving retries to your
+                queueing system.
+            verify_task_specs: Look every task up in its stage before executing the agent on it,
+                such that tasks that left the stage are skipped. If False, tasks are rebuilt from their
+                specs without a request to Encord. A task that left the stage in the meantime is then
+                only noticed when it's proceeded, after the agent ran and its label updates were saved.
+            max_error_bytes: Max number of bytes of the error of a compactly encoded result.
+                Longer errors, e.g., tracebacks, are cut to their end. JSON results keep the whole error.
+            store_error: Called with the task uuid and the full error when the error of a compactly encoded
+                result is cut. The reference it returns, e.g., a URL, is appended to the error.
         """
+        if max_error_bytes < 0:
+            raise PrintableError("We require that `max_error_bytes` >= 0")
         super().__init__(project_hash)
+        self.retry_policy = retry_policy or RetryPolicy(max_retries=0)
+        self.verify_task_specs = verify_task_specs
+        self.max_error_bytes = max_error_bytes
+        self.store_error = store_error
+        # The wrapped functions by stage uuid, for `run_local`
+        self._wrappers: dict[UUID, QueueAgentWrapper] = {}
         assert self.project is not None
         self._project: Project = self.project
 
@@ -100,7 +235,8 @@ class QueueRunner(RunnerBase):
         label_row_metadata_include_args: LabelRowMetadataIncludeArgs | None = None,
         label_row_initialise_labels_args: LabelRowInitialiseLabelsArgs | None = None,
         will_set_priority: bool = False,
-    ) -> Callable[[Callable[..., TaskAgentReturnType]], Callable[[str], str]]:
+        task_timeout: float | None = None,
+    ) -> Callable[[Callable[..., TaskAgentReturnType]], QueueAgentWrapper]:
         """
         Agent wrapper intended for queueing systems and distributed workloads.
 
@@ -131,6 +267,15 @@ class QueueRunner(RunnerBase):
         As the pseudo code indicates, `wrapped_function` understands how to take that string from
         the queue and resolve all your defined dependencies before calling `your_function`.
 
+        To execute many tasks at once, e.g., in a worker that pulls 50 specs off the queue at a time,
+        call `wrapped_function.batch(task_json_specs)`. It returns a result per spec, in order.
+        The tasks, label rows and storage items of all the specs are fetched together, and the label
+        row updates and task pathways are sent to Encord in bundles, which saves most of the round-trips
+        of calling `wrapped_function` for every spec. Batch scoped dependencies are solved once per call.
+        If sending the bundles fails, the updates are sent task by task instead, and every task reports
+        whether its own updates went through. A task that a partially sent bundle already proceeded is
+        then reported as failed, even though it has left the stage.
+
         Args:
             stage: The name or uuid of the stage that the function should be
                 associated with.
@@ -142,13 +287,16 @@ class QueueRunner(RunnerBase):
                 with a `label_row_priority` field set. This field is only required if you are
                 returning the priority of the label row but not depending on the label row it self.
                 That is, if your function signature does not include a `LabelRowV2` parameter.
+            task_timeout: Max number of seconds that the function may take for a single task.
+                If it takes longer, the call is abandoned, the task is not proceeded and the
+                wrapper returns a failed `TaskCompletionResult`. Dependencies are cleaned up either way.
 
         Returns:
             The decorated function.
         """
         stage_uuid, printable_name = self._validate_stage(stage)
 
-        def decorator(func: Callable[..., TaskAgentReturnType]) -> Callable[[str], str]:
+        def decorator(func: Callable[..., TaskAgentReturnType]) -> QueueAgentWrapper:
             runner_agent = self._add_stage_agent(
                 stage_uuid,
                 func,
@@ -156,6 +304,7 @@ class QueueRunner(RunnerBase):
                 printable_name=printable_name,
                 label_row_metadata_include_args=label_row_metadata_include_args,
                 label_row_initialise_labels_args=label_row_initialise_labels_args,
+                task_timeout=task_timeout,
             )
             include_args = runner_agent.label_row_metadata_include_args or LabelRowMetadataIncludeArgs()
             init_args = runner_agent.label_row_initialise_labels_args or LabelRowInitialiseLabelsArgs()
@@ -167,79 +316,380 @@ class QueueRunner(RunnerBase):
                 error = err
 
                 @wraps(func)
-                def null_wrapper(json_str: str) -> str:
-                    conf = AgentTaskConfig.model_validate_json(json_str)
-                    return TaskCompletionResult(
-                        task_uuid=conf.task_uuid,
-                        success=False,
-                        error=str(error),
-                    ).model_dump_json()
+                def null_wrapper(task_spec: str | bytes) -> str | bytes:
+                    conf = AgentTaskConfig.model_validate_json(task_spec_json(task_spec))
+                    return self._encode_result(
+                        task_spec,
+                        TaskCompletionResult(
+                            task_uuid=conf.task_uuid,
+                            success=False,
+                            error=str(error),
+                        ),
+                    )
+
+                def null_batch_wrapper(task_specs: list[str | bytes]) -> list[str | bytes]:
+                    return [null_wrapper(task_spec) for task_spec in task_specs]
 
-                return null_wrapper
+                null_wrapper.batch = null_batch_wrapper  # type: ignore[attr-defined]
+                return null_wrapper  # type: ignore[return-value]
             pathway_lookup = {pathway.uuid: pathway.name for pathway in stage.pathways}
             name_lookup = {pathway.name: pathway.uuid for pathway in stage.pathways}
+            # Every call handles a single task, so batch scoped dependencies are solved per task.
+            # The stage scope lives as long as the queue worker.
+            scopes: dict[DependencyScopeName, DependencyScope] = {"stage": runner_agent.scopes["stage"]}
+            atexit.register(runner_agent.scopes["stage"].close)
+
+            def run_task(task: AgentTask) -> TaskCompletionResult:
+                context = self._assemble_context(
+                    task=task,
+                    runner_agent=runner_agent,
+                    project=self._project,
+                    include_args=include_args,
+                    init_args=init_args,
+                    stage=stage,
+                    client=self.client,
+                )
+
+                with ExitStack() as stack:
+                    dependencies = solve_dependencies(
+                        context=context, dependant=runner_agent.dependant, stack=stack, scopes=scopes
+                    )
+                    # Handed over to the call, which cleans up once the agent is done, even if that's after a timeout
+                    attempt_stack = stack.pop_all()
+                agent_response = cast(
+                    TaskAgentReturnType,
+                    call_with_timeout(
+                        runner_agent.callable,
+                        dependencies.values,
+                        runner_agent.task_timeout,
+                        cleanup=attempt_stack.close,
+                    ),
+                )
+                pathway_to_follow: UUID | str | None = None
+                if isinstance(agent_response, TaskAgentReturnStruct):
+                    # Can't batch handle updates for Queue Runner
+                    if agent_response.label_row:
+                        # If the user has returned a struct, we should save in case they haven't actually updated
+                        agent_response.label_row.save()
+                    if agent_response.pathway:
+                        pathway_to_follow = agent_response.pathway
+                    if agent_response.label_row_priority:
+                        assert (
+                            context.label_row is not None
+                        ), f"Label row is not set for task {task} setting the priority requires either setting the `will_set_priority` to True on the stage decorator or depending on the label row."
+                        context.label_row.set_priority(agent_response.label_row_priority)
+                else:
+                    pathway_to_follow = agent_response
+                next_stage_uuid = handle_pathway(task, pathway_to_follow, pathway_lookup, name_lookup, stage=stage)
+                return TaskCompletionResult(
+                    task_uuid=task.uuid, stage_uuid=stage.uuid, success=True, pathway=next_stage_uuid
+                )
+
+            def get_tasks(json_strs: list[str]) -> list[AgentTask | None]:
+                """
+                Get the tasks of the specs, looking them up in a single request if `verify_task_specs` is set.
+                """
+                if not self.verify_task_specs:
+                    return [task_from_spec(json_str, stage) for json_str in json_strs]
+                configs = [AgentTaskConfig.model_validate_json(json_str) for json_str in json_strs]
+                data_hashes = list(dict.fromkeys(config.data_hash for config in configs))
+                # A data unit may have had another task in the stage by now, so the task uuids have to match
+                found = {task.uuid: task for task in stage.get_tasks(data_hash=data_hashes)}
+                return [found.get(config.task_uuid) for config in configs]
+
+            def missing(json_str: str) -> TaskCompletionResult:
+                task_uuid = AgentTaskConfig.model_validate_json(json_str).task_uuid
+                logger.warning(f"Task {task_uuid} is no longer in stage {stage.title}, skipping it")
+                return TaskCompletionResult(
+                    task_uuid=task_uuid,
+                    stage_uuid=stage.uuid,
+                    success=False,
+                    error="Failed to obtain task from Encord",
+                )
+
+            def execute(json_str: str) -> TaskCompletionResult:
+                task = get_tasks([json_str])[0]
+                if task is None:
+                    return missing(json_str)
+
+                started = time.monotonic()
+                retry = 0
+                while True:
+                    try:
+                        return run_task(task)
+                    except PrintableError:
+                        raise
+                    except Exception as err:
+                        delay = self.retry_policy.next_delay(err, retry, time.monotonic() - started)
+                        if delay is None:
+                            logger.warning(f"Task {task.uuid} failed after {retry + 1} attempt(s)", exc_info=True)
+                            return TaskCompletionResult(
+                                task_uuid=task.uuid, stage_uuid=stage.uuid, success=False, error=traceback.format_exc()
+                            )
+                    retry += 1
+                    time.sleep(delay)
 
             @wraps(func)
-            def wrapper(json_str: str) -> str:
-                conf = AgentTaskConfig.model_validate_json(json_str)
+            def wrapper(task_spec: str | bytes) -> str | bytes:
+                return self._encode_result(task_spec, execute(task_spec_json(task_spec)))
 
-                task = next((s for s in stage.get_tasks(data_hash=conf.data_hash)), None)
-                if task is None:
-                    # TODO logging?
+            def run_batch(tasks: list[AgentTask]) -> list[TaskCompletionResult]:
+                def failed(task: AgentTask) -> TaskCompletionResult:
                     return TaskCompletionResult(
-                        task_uuid=conf.task_uuid,
-                        stage_uuid=stage.uuid,
-                        success=False,
-                        error="Failed to obtain task from Encord",
-                    ).model_dump_json()
+                        task_uuid=task.uuid, stage_uuid=stage.uuid, success=False, error=traceback.format_exc()
+                    )
 
                 try:
-                    context = self._assemble_context(
-                        task=task,
-                        runner_agent=runner_agent,
-                        project=self._project,
-                        include_args=include_args,
-                        init_args=init_args,
-                        stage=stage,
-                        client=self.client,
+                    contexts = self._assemble_contexts(
+                        tasks, runner_agent, self._project, include_args, init_args, stage, self.client
                     )
+                except Exception:
+                    return [failed(task) for task in tasks]
 
-                    with ExitStack() as stack:
-                        dependencies = solve_dependencies(
-                            context=context, dependant=runner_agent.dependant, stack=stack
+                batch_scope = DependencyScope("batch")
+                batch_scopes: dict[DependencyScopeName, DependencyScope] = {**scopes, "batch": batch_scope}
+                label_bundle = FlushingBundle(bundle_size=MAX_LABEL_ROW_BATCH_SIZE)
+                task_bundle = FlushingBundle(dependencies=[label_bundle])
+                outcomes: list[tuple[TaskCompletionResult, TaskAgentReturnType]] = []
+                try:
+                    try:
+                        prepare_batch_dependencies(
+                            contexts=contexts,
+                            dependant=runner_agent.dependant,
+                            stack=batch_scope.stack,
+                            scopes=batch_scopes,
                         )
-                        agent_response: TaskAgentReturnType = runner_agent.callable(**dependencies.values)
-                    pathway_to_follow: UUID | str | None = None
-                    if isinstance(agent_response, TaskAgentReturnStruct):
-                        # Can't batch handle updates for Queue Runner
-                        if agent_response.label_row:
-                            # If the user has returned a struct, we should save in case they haven't actually updated
-                            agent_response.label_row.save()
-                        if agent_response.pathway:
-                            pathway_to_follow = agent_response.pathway
-                        if agent_response.label_row_priority:
-                            assert (
-                                context.label_row is not None
-                            ), f"Label row is not set for task {task} setting the priority requires either setting the `will_set_priority` to True on the stage decorator or depending on the label row."
-                            context.label_row.set_priority(agent_response.label_row_priority)
-                    else:
-                        pathway_to_follow = agent_response
-                    next_stage_uuid = handle_pathway(task, pathway_to_follow, pathway_lookup, name_lookup, stage=stage)
-                    return TaskCompletionResult(
-                        task_uuid=task.uuid, stage_uuid=stage.uuid, success=True, pathway=next_stage_uuid
-                    ).model_dump_json()
-                except PrintableError:
-                    raise
+                    except Exception:
+                        # Solved per task instead, where failures count towards the retries of the task
+                        traceback.print_exc()
+                    for context in contexts:
+                        outcomes.append(run_bundled_task(context, batch_scopes, task_bundle, label_bundle))
+                finally:
+                    batch_scope.close()
+
+                try:
+                    # Saves the label rows before proceeding the tasks
+                    task_bundle.execute()
+                except Exception:
+                    # Part of the bundle may have gone through. Apply the updates task by task instead,
+                    # such that every task reports whether its own updates went through.
+                    traceback.print_exc()
+                    return [
+                        apply_unbundled(context, result, agent_response) if result.success else result
+                        for context, (result, agent_response) in zip(contexts, outcomes)
+                    ]
+                return [result for result, _ in outcomes]
+
+            def apply_unbundled(
+                context: Context, result: TaskCompletionResult, agent_response: TaskAgentReturnType
+            ) -> TaskCompletionResult:
+                assert context.task
+                try:
+                    proceed_kwargs = SequentialRunner._handle_agent_response(
+                        context, agent_response, stage, task_bundle=None, label_bundle=None
+                    )
+                    if proceed_kwargs is not None:
+                        context.task.proceed(**proceed_kwargs, bundle=None)
                 except Exception:
-                    # TODO logging?
                     return TaskCompletionResult(
-                        task_uuid=task.uuid, stage_uuid=stage.uuid, success=False, error=traceback.format_exc()
-                    ).model_dump_json()
+                        task_uuid=context.task.uuid, stage_uuid=stage.uuid, success=False, error=traceback.format_exc()
+                    )
+                return result
+
+            def run_bundled_task(
+                context: Context,
+                batch_scopes: dict[DependencyScopeName, DependencyScope],
+                task_bundle: Bundle,
+                label_bundle: Bundle,
+            ) -> tuple[TaskCompletionResult, TaskAgentReturnType]:
+                """
+                Execute the agent on a task, registering its updates on the bundles.
+
+                Returns:
+                    The result and the response of the agent, which is None if the agent failed.
+                """
+                assert context.task
+                task = context.task
+                started = time.monotonic()
+                retry = 0
+                while True:
+                    try:
+                        with ExitStack() as stack:
+                            dependencies = solve_dependencies(
+                                context=context, dependant=runner_agent.dependant, stack=stack, scopes=batch_scopes
+                            )
+                            # Handed over to the call, which cleans up once the agent is done
+                            attempt_stack = stack.pop_all()
+                        agent_response = cast(
+                            TaskAgentReturnType,
+                            call_with_timeout(
+                                runner_agent.callable,
+                                dependencies.values,
+                                runner_agent.task_timeout,
+                                cleanup=attempt_stack.close,
+                            ),
+                        )
+                        proceed_kwargs = SequentialRunner._handle_agent_response(
+                            context, agent_response, stage, task_bundle=task_bundle, label_bundle=label_bundle
+                        )
+                        next_stage_uuid: UUID | None = None
+                        if proceed_kwargs and "pathway_uuid" in proceed_kwargs:
+                            next_stage_uuid = UUID(proceed_kwargs["pathway_uuid"])
+                        elif proceed_kwargs:
+                            next_stage_uuid = name_lookup[proceed_kwargs["pathway_name"]]
+                        return (
+                            TaskCompletionResult(
+                                task_uuid=task.uuid, stage_uuid=stage.uuid, success=True, pathway=next_stage_uuid
+                            ),
+                            agent_response,
+                        )
+                    except PrintableError:
+                        raise
+                    except Exception as err:
+                        delay = self.retry_policy.next_delay(err, retry, time.monotonic() - started)
+                        if delay is None:
+                            return (
+                                TaskCompletionResult(
+                                    task_uuid=task.uuid,
+                                    stage_uuid=stage.uuid,
+                                    success=False,
+                                    error=traceback.format_exc(),
+                                ),
+                                None,
+                            )
+                    retry += 1
+                    time.sleep(delay)
+
+            def batch_wrapper(task_specs: list[str | bytes]) -> list[str | bytes]:
+                if not task_specs:
+                    return []
+                json_strs = [task_spec_json(task_spec) for task_spec in task_specs]
+                tasks = get_tasks(json_strs)
+                found = [task for task in tasks if task is not None]
+                completed = iter(run_batch(found) if found else [])
+                return [
+                    self._encode_result(
+                        task_spec,
+                        next(completed) if task is not None else missing(json_str),
+                    )
+                    for task_spec, json_str, task in zip(task_specs, json_strs, tasks)
+                ]
 
-            return wrapper
+            wrapper.batch = batch_wrapper  # type: ignore[attr-defined]
+            self._wrappers[stage.uuid] = wrapper  # type: ignore[assignment]
+            return wrapper  # type: ignore[return-value]
 
         return decorator
 
+    def _encode_result(self, task_spec: str | bytes, result: TaskCompletionResult) -> str | bytes:
+        """
+        Encode the result like the task spec that it's the result of.
+        """
+        if is_compact(task_spec):
+            return encode_result(result, max_error_bytes=self.max_error_bytes, store_error=self.store_error)
+        if isinstance(task_spec, (bytes, bytearray)):
+            return result.model_dump_json().encode()
+        return result.model_dump_json()
+
+    def create_producer(
+        self,
+        sink: TaskSink,
+        *,
+        max_outstanding: int | None = None,
+        in_flight_ttl: float = 3600.0,
+        requeue_done: bool = True,
+        done_ttl: float = math.inf,
+        compact: bool = False,
+    ) -> QueueProducer:
+        """
+        Create a producer that puts the tasks of the agent stages of the runner into a queue.
+
+        Unlike listing the tasks yourself, the producer doesn't queue tasks that are still in flight
+        and bounds the number of queued tasks. See `QueueProducer` for details.
+
+        Args:
+            sink: The queue to put the tasks into.
+            max_outstanding: Max number of tasks in flight. If None, all tasks are queued.
+            in_flight_ttl: Seconds after which a task that is still in flight is queued again.
+            requeue_done: Whether to queue tasks again that were marked done but are still in their stage.
+            done_ttl: Seconds after which a task that was marked done but is still in its stage is queued again
+                if `requeue_done` is False.
+            compact: Queue compactly encoded task specs rather than `task.model_dump_json()`.
+
+        Returns:
+            The producer. Call `produce` for a single pass over the stages or `run` to keep producing.
+        """
+        return QueueProducer(
+            self,
+            sink,
+            max_outstanding=max_outstanding,
+            in_flight_ttl=in_flight_ttl,
+            requeue_done=requeue_done,
+            done_ttl=done_ttl,
+            compact=compact,
+        )
+
+    def run_local(
+        self,
+        workers: int | None = None,
+        *,
+        max_outstanding: int | None = None,
+        poll_interval: float = 10.0,
+        run_forever: bool = False,
+        retry_failed_after: float = 3600.0,
+    ) -> LocalRunSummary:
+        """
+        Execute the agents on a pool of local worker processes, without an external queueing system.
+
+        A producer puts the tasks of the agent stages into a queue, from which the workers take them
+        and call the wrapped functions, like the workers of a queueing system would. Workers that crash
+        are restarted, and the task they were working on is counted as failed. Without `run_forever`, every
+        task is executed at most once per call, so tasks that the agents failed on are not retried beyond the
+        `retry_policy`.
+
+        The `task_timeout` of a stage is enforced within the workers: a call that takes too long is abandoned
+        and its task fails, see `stage`. A worker that hangs otherwise, e.g., in a dependency that waits forever
+        or in native code that never releases the GIL, is not recovered. It keeps its task and its slot in the
+        pool, and without `run_forever`, this doesn't return until the worker is done.
+
+        Workers are forked from the current process, which requires a platform that supports `fork`.
+
+        Args:
+            workers: Number of worker processes. Defaults to the number of CPUs.
+            max_outstanding: Max number of tasks that are queued or being executed at once.
+                Defaults to twice the number of workers.
+            poll_interval: Seconds between listing the agent stages for new tasks while tasks are being executed.
+            run_forever: Keep listing the agent stages for new tasks every `poll_interval` seconds
+                rather than returning once all tasks have been executed.
+            retry_failed_after: With `run_forever`, seconds after which tasks that are still in their stage,
+                e.g., because the agent failed on them, are executed again.
+
+        Returns:
+            The number of tasks that succeeded, the results of those that failed, and the number of
+            tasks that were passed along each pathway.
+
+        Raises:
+            PrintableError: If the arguments are invalid or the platform doesn't support `fork`.
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 1:
+            raise PrintableError("We require that `workers` >= 1")
+        if max_outstanding is not None and max_outstanding < 1:
+            raise PrintableError("We require that `max_outstanding` >= 1")
+        if poll_interval <= 0:
+            raise PrintableError("We require that `poll_interval` > 0")
+        if retry_failed_after <= 0:
+            raise PrintableError("We require that `retry_failed_after` > 0")
+        return run_local_pool(
+            self,
+            workers,
+            max_outstanding=max_outstanding or 2 * workers,
+            poll_interval=poll_interval,
+            run_forever=run_forever,
+            done_ttl=retry_failed_after if run_forever else math.inf,
+        )
+
     def get_agent_stages(self) -> Iterable[AgentStage]:
         """
         Get the agent stages for which there exist an agent implementation.
@@ -0,0 +1,120 @@
+import random
+from dataclasses import dataclass, replace
+from typing import Callable
+
+import requests
+from encord.exceptions import GenericServerError, RateLimitExceededError, TimeOutError, UnknownException
+
+TRANSIENT_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+def is_transient_error(err: BaseException) -> bool:
+    """
+    Tell whether an error is likely to go away when trying again later.
+
+    These are rate limits and server errors from the Encord API, timeouts, connection
+    errors and HTTP responses (raised with `requests`) with status 408, 429 or 5xx,
+    e.g., from an overloaded model server.
+
+    Use it as the `retry_on` predicate of a `RetryPolicy` to only retry such errors.
+    """
+    if isinstance(err, (RateLimitExceededError, GenericServerError, TimeOutError, UnknownException)):
+        return True
+    if isinstance(err, (TimeoutError, ConnectionError, requests.Timeout, requests.ConnectionError)):
+        return True
+    if isinstance(err, requests.HTTPError) and err.response is not None:
+        return err.response.status_code in TRANSIENT_STATUS_CODES
+    return False
+
+
+def retry_all(err: BaseException) -> bool:
+    return True
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    Decides if and when a task on which the agent failed is tried again.
+
+    The delay before retry `n` (0-indexed) is `initial_delay * multiplier ** n`, capped at
+    `max_delay`. With `jitter`, a random fraction of up to `jitter` of the delay is subtracted,
+    such that tasks that failed at the same time don't hit a recovering service at the same time again.
+    If the error carries a `retry_after` hint, e.g., an Encord `RateLimitExceededError`,
+    the delay is at least that long.
+
+    **Example:**
+
+    ```python
+    from encord_agents.tasks import Runner, RetryPolicy
+    from encord_agents.tasks.runner.retry import is_transient_error
+
+    runner = Runner(
+        retry_policy=RetryPolicy(
+            max_retries=5,
+            initial_delay=2.0,
+            max_elapsed=300.0,
+            retry_on=is_transient_error,
+        )
+    )
+    ```
+
+    Args:
+        max_retries: Max number of times to retry a task after the first attempt.
+        initial_delay: Seconds to wait before the first retry.
+        multiplier: Factor by which the delay grows with every retry.
+        max_delay: Max number of seconds to wait before a retry.
+        jitter: Fraction in [0, 1] of the delay that is randomised. 0 disables jitter.
+        max_elapsed: Don't retry anymore once this many seconds have passed since the
+            first attempt. If `None`, only `max_retries` applies.
+        retry_on: Predicate that tells whether an error should be retried.
+            Defaults to retrying all errors.
+    """
+
+    max_retries: int = 3
+    initial_delay: float = 1.0
+    multiplier: float = 2.0
+    max_delay: float = 60.0
+    jitter: float = 1.0
+    max_elapsed: float | None = None
+    retry_on: Callable[[BaseException], bool] = retry_all
+
+    def __post_init__(self) -> None:
+        if self.max_retries < 0:
+            raise ValueError("We require that `max_retries` >= 0")
+        if self.initial_delay < 0 or self.max_delay < 0:
+            raise ValueError("We require that delays are >= 0")
+        if not 0 <= self.jitter <= 1:
+            raise ValueError("We require that 0 <= `jitter` <= 1")
+
+    def with_max_retries(self, max_retries: int) -> "RetryPolicy":
+        return replace(self, max_retries=max_retries)
+
+    def get_delay(self, retry: int, err: BaseException | None = None) -> float:
+        """
+        Get the number of seconds to wait before retry number `retry` (0-indexed).
+        """
+        delay = min(self.max_delay, self.initial_delay * self.multiplier**retry)
+        delay -= delay * self.jitter * random.random()
+        retry_after = getattr(err, "retry_after", None)
+        if isinstance(retry_after, (int, float)):
+            delay = max(delay, float(retry_after))
+        return delay
+
+    def next_delay(self, err: BaseException, retry: int, elapsed: float) -> float | None:
+        """
+        Decide whether to retry after a failed attempt.
+
+        Args:
+            err: The error of the failed attempt.
+            retry: The number of retries made so far.
+            elapsed: Number of seconds since the first attempt.
+
+        Returns:
+            The number of seconds to wait before the next attempt or None if the task should not be retried.
+        """
+        if retry >= self.max_retries or not self.retry_on(err):
+            return None
+        delay = self.get_delay(retry, err)
+        if self.max_elapsed is not None and elapsed + delay > self.max_elapsed:
+            return None
+        return delay
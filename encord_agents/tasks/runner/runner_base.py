@@ -1,4 +1,6 @@
-from typing import Callable
+import time
+from collections import deque
+from typing import Callable, Iterator
 from uuid import UUID
 
 from encord.objects.ontology_labels_impl import LabelRowV2
@@ -14,36 +16,52 @@ from encord_agents.core.data_model import LabelRowInitialiseLabelsArgs, LabelRow
 from encord_agents.core.dependencies.models import (
     Context,
     Dependant,
+    DependencyScopeName,
 )
-from encord_agents.core.dependencies.utils import get_dependant
+from encord_agents.core.dependencies.scopes import DependencyScope
+from encord_agents.core.dependencies.utils import compile_dependant, get_batch_dependant, get_dependant
 from encord_agents.core.utils import get_user_client
 from encord_agents.exceptions import PrintableError
-from encord_agents.tasks.models import TaskAgentReturnType
+from encord_agents.tasks.models import TaskAgentCallableReturnType
 
 
 class RunnerAgent:
     def __init__(
         self,
         identity: str | UUID,
-        callable: Callable[..., TaskAgentReturnType],
+        callable: Callable[..., TaskAgentCallableReturnType],
         printable_name: str | None = None,
         label_row_metadata_include_args: LabelRowMetadataIncludeArgs | None = None,
         label_row_initialise_labels_args: LabelRowInitialiseLabelsArgs | None = None,
         will_set_priority: bool = False,
+        task_timeout: float | None = None,
+        batch: bool = False,
+        max_batch_size: int | None = None,
     ):
         self.identity = identity
         self.printable_name = printable_name or identity
         self.callable = callable
-        self.dependant: Dependant = get_dependant(func=callable)
+        self.batch = batch
+        self.max_batch_size = max_batch_size
+        self.dependant: Dependant = get_batch_dependant(func=callable) if batch else get_dependant(func=callable)
+        compile_dependant(self.dependant)
+        # Where the dependencies with `batch` and `stage` scope live. The runners close them at the boundaries.
+        self.scopes: dict[DependencyScopeName, DependencyScope] = {
+            "batch": DependencyScope("batch"),
+            "stage": DependencyScope("stage"),
+        }
         self.label_row_metadata_include_args = label_row_metadata_include_args
         self.label_row_initialise_labels_args = label_row_initialise_labels_args
         self.will_set_priority = will_set_priority
+        self.task_timeout = task_timeout
 
     def __repr__(self) -> str:
         return f'RunnerAgent("{self.printable_name}")'
 
 
 class RunnerBase:
+    _supports_async: bool = False
+
     @staticmethod
     def _verify_project_hash(ph: str | UUID) -> str:
         try:
@@ -78,6 +96,68 @@ class RunnerBase:
                 raise PrintableError("We require that `max_tasks_per_stage` >= 1")
         return max_tasks_per_stage
 
+    @staticmethod
+    def _validate_max_workers(max_workers: int | None) -> int | None:
+        if max_workers is not None:
+            if max_workers < 1:
+                raise PrintableError("We require that `max_workers` >= 1")
+        return max_workers
+
+    @staticmethod
+    def _validate_num_processes(num_processes: int | None) -> int | None:
+        if num_processes is not None:
+            if num_processes < 1:
+                raise PrintableError("We require that `num_processes` >= 1")
+        return num_processes
+
+    @staticmethod
+    def _validate_task_batch_size_bounds(min_task_batch_size: int, max_task_batch_size: int) -> None:
+        if min_task_batch_size < 1:
+            raise PrintableError("We require that `min_task_batch_size` >= 1")
+        if max_task_batch_size < min_task_batch_size:
+            raise PrintableError("We require that `max_task_batch_size` >= `min_task_batch_size`")
+
+    @staticmethod
+    def _validate_max_memory_mb(max_memory_mb: int | None) -> int | None:
+        if max_memory_mb is not None:
+            if max_memory_mb < 1:
+                raise PrintableError("We require that `max_memory_mb` >= 1")
+        return max_memory_mb
+
+    @staticmethod
+    def _validate_poll_intervals(min_poll_interval: float, max_poll_interval: float) -> None:
+        if min_poll_interval <= 0:
+            raise PrintableError("We require that `min_poll_interval` > 0")
+        if max_poll_interval < min_poll_interval:
+            raise PrintableError("We require that `max_poll_interval` >= `min_poll_interval`")
+
+    @staticmethod
+    def _validate_task_timeout(task_timeout: float | None) -> float | None:
+        if task_timeout is not None:
+            if task_timeout <= 0:
+                raise PrintableError("We require that `task_timeout` > 0")
+        return task_timeout
+
+    @staticmethod
+    def _validate_flush_interval(flush_interval: float | None) -> float | None:
+        if flush_interval is not None:
+            if flush_interval <= 0:
+                raise PrintableError("We require that `flush_interval` > 0")
+        return flush_interval
+
+    @staticmethod
+    def _validate_max_batch_size(max_batch_size: int | None) -> int | None:
+        if max_batch_size is not None:
+            if max_batch_size < 1:
+                raise PrintableError("We require that `max_batch_size` >= 1")
+        return max_batch_size
+
+    @staticmethod
+    def _validate_prefetch_depth(prefetch_depth: int) -> int:
+        if prefetch_depth < 0:
+            raise PrintableError("We require that `prefetch_depth` >= 0")
+        return prefetch_depth
+
     @classmethod
     def _assemble_context(
         cls,
@@ -122,7 +202,15 @@ class RunnerBase:
         init_args: LabelRowInitialiseLabelsArgs,
         stage: AgentStage,
         client: EncordUserClient,
+        *,
+        initialise_labels: bool = True,
     ) -> list[Context]:
+        """
+        Assemble the contexts for a batch of tasks with as few requests as possible.
+
+        If `initialise_labels` is False, the labels of the label rows are not initialised.
+        That's left to the caller, e.g., to do it lazily.
+        """
         contexts = [
             Context(
                 project=project,
@@ -136,7 +224,7 @@ class RunnerBase:
         batch_lrs: list[LabelRowV2] = []
         if runner_agent.dependant.needs_label_row or runner_agent.will_set_priority:
             batch_lrs = RunnerBase._get_ordered_label_rows_from_tasks(task_batch, include_args, project)
-            if runner_agent.dependant.needs_label_row:
+            if runner_agent.dependant.needs_label_row and initialise_labels:
                 with project.create_bundle() as lr_bundle:
                     for lr in batch_lrs:
                         lr.initialise_labels(bundle=lr_bundle, **init_args.model_dump())
@@ -152,6 +240,50 @@ class RunnerBase:
 
         return contexts
 
+    @staticmethod
+    def _iter_contexts(
+        task_batch: list[AgentTask],
+        runner_agent: RunnerAgent,
+        project: Project,
+        include_args: LabelRowMetadataIncludeArgs,
+        init_args: LabelRowInitialiseLabelsArgs,
+        stage: AgentStage,
+        client: EncordUserClient,
+        *,
+        chunk_size: int,
+        on_label_bundle: Callable[[int, float], None] | None = None,
+    ) -> Iterator[Context]:
+        """
+        Assemble the contexts for a batch of tasks lazily.
+
+        Label row metadata and storage items are fetched for the whole batch right away.
+        The labels, which make up the bulk of the memory, are only initialised `chunk_size`
+        label rows at a time as the contexts are consumed. Contexts are not referenced
+        anymore once they were consumed, so they can be released after they were processed.
+        `on_label_bundle` is called with the number of label rows and the duration of every chunk.
+        """
+        pending = deque(
+            RunnerBase._assemble_contexts(
+                task_batch, runner_agent, project, include_args, init_args, stage, client, initialise_labels=False
+            )
+        )
+
+        def iterate() -> Iterator[Context]:
+            while pending:
+                chunk = deque(pending.popleft() for _ in range(min(chunk_size, len(pending))))
+                if runner_agent.dependant.needs_label_row:
+                    start = time.perf_counter()
+                    with project.create_bundle() as lr_bundle:
+                        for context in chunk:
+                            assert context.label_row
+                            context.label_row.initialise_labels(bundle=lr_bundle, **init_args.model_dump())
+                    if on_label_bundle is not None:
+                        on_label_bundle(len(chunk), time.perf_counter() - start)
+                while chunk:
+                    yield chunk.popleft()
+
+        return iterate()
+
     def __init__(
         self,
         project_hash: str | UUID | None = None,
@@ -219,13 +351,16 @@ class RunnerBase:
     def _add_stage_agent(
         self,
         identity: str | UUID,
-        func: Callable[..., TaskAgentReturnType],
+        func: Callable[..., TaskAgentCallableReturnType],
         *,
         stage_insertion: int | None,
         printable_name: str | None,
         label_row_metadata_include_args: LabelRowMetadataIncludeArgs | None,
         label_row_initialise_labels_args: LabelRowInitialiseLabelsArgs | None,
         will_set_priority: bool = False,
+        task_timeout: float | None = None,
+        batch: bool = False,
+        max_batch_size: int | None = None,
     ) -> RunnerAgent:
         runner_agent = RunnerAgent(
             identity=identity,
@@ -234,7 +369,19 @@ class RunnerBase:
             label_row_metadata_include_args=label_row_metadata_include_args,
             label_row_initialise_labels_args=label_row_initialise_labels_args,
             will_set_priority=will_set_priority,
+            task_timeout=self._validate_task_timeout(task_timeout),
+            batch=batch,
+            max_batch_size=self._validate_max_batch_size(max_batch_size),
         )
+        fn_name = getattr(func, "__name__", "agent function")
+        if runner_agent.dependant.needs_async and batch:
+            raise PrintableError(
+                f"Your batch agent [blue]`{fn_name}`[/blue] is an `async def` function or depends on async dependencies. Batch agents must be synchronous."
+            )
+        if runner_agent.dependant.needs_async and not self._supports_async:
+            raise PrintableError(
+                f"Your function [blue]`{fn_name}`[/blue] is an `async def` function or depends on async dependencies. The [blue]`{type(self).__name__}`[/blue] only supports synchronous agents. Please use the [magenta]`AsyncRunner`[/magenta] instead."
+            )
         if stage_insertion is not None:
             if stage_insertion >= len(self.agents):
                 raise ValueError("This should be impossible. Trying to update an agent at a location not defined")
@@ -1,16 +1,24 @@
+import heapq
+import itertools
 import logging
 import os
+import threading
 import time
 import traceback
-from contextlib import ExitStack
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from contextlib import AbstractContextManager, ExitStack, closing
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from typing import Callable, Iterable, Optional
+from functools import partial
+from typing import Any, Callable, Generator, Iterable, Iterator, Optional, cast
 from uuid import UUID
 
 import rich
 from encord.http.bundle import Bundle
 from encord.orm.workflow import WorkflowStageType
-from encord.workflow.stages.agent import AgentStage
+from encord.project import Project
+from encord.workflow.stages.agent import AgentStage, AgentTask
 from rich.live import Live
 from rich.panel import Panel
 from rich.progress import (
@@ -30,15 +38,85 @@ from encord_agents.core.dependencies.models import (
     Context,
     Dependant,
 )
-from encord_agents.core.dependencies.utils import get_dependant, solve_dependencies
+from encord_agents.core.dependencies.utils import (
+    SolvedDependency,
+    get_dependant,
+    prepare_batch_dependencies,
+    solve_batch_dependencies,
+    solve_dependencies,
+)
 from encord_agents.core.rich_columns import TaskSpeedColumn
 from encord_agents.core.utils import batch_iterator
 from encord_agents.exceptions import PrintableError
 from encord_agents.tasks.models import DecoratedCallable, TaskAgentReturnStruct, TaskAgentReturnType
+from encord_agents.tasks.runner.adaptive import AdaptiveBatchSizer
+from encord_agents.tasks.runner.bundles import FlushingBundle
+from encord_agents.tasks.runner.process_pool import create_process_pool, execute_tasks_in_processes
+from encord_agents.tasks.runner.retry import RetryPolicy
 from encord_agents.tasks.runner.runner_base import RunnerAgent, RunnerBase
+from encord_agents.tasks.runner.timeout import call_with_timeout
 from encord_agents.utils.generic_utils import try_coerce_UUID
 
 MAX_LABEL_ROW_BATCH_SIZE = 100
+# The most label rows that the SDK puts into one request
+MAX_LABEL_ROW_BUNDLE_SIZE = 1000
+MAX_TASK_BUNDLE_SIZE = 1000
+
+
+@dataclass
+class TaskRun:
+    """
+    The state of executing an agent on a task across attempts.
+    """
+
+    context: Context
+    retries: int = 0
+    started: float = field(default_factory=time.monotonic)
+    proceed_kwargs: dict[str, str] | None = None
+
+
+class SeenTasks:
+    """
+    The tasks that were executed within the last `ttl` seconds.
+
+    Used in `daemon` mode to skip tasks that are still listed in their stage right after
+    they were executed, e.g., because the agent failed on them. Entries expire after `ttl`
+    seconds, which bounds the memory when new tasks keep arriving and gives the tasks that
+    are left in the stage another chance. Thread-safe, such that stages can share it.
+    """
+
+    def __init__(self, ttl: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self.ttl = ttl
+        self._clock = clock
+        # Ordered by the time at which the tasks were seen
+        self._seen_at: dict[UUID, float] = {}
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float) -> None:
+        while self._seen_at:
+            task_uuid, seen_at = next(iter(self._seen_at.items()))
+            if now - seen_at < self.ttl:
+                break
+            del self._seen_at[task_uuid]
+
+    def __contains__(self, task_uuid: object) -> bool:
+        with self._lock:
+            self._expire(self._clock())
+            return task_uuid in self._seen_at
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._expire(self._clock())
+            return len(self._seen_at)
+
+    def update(self, task_uuids: Iterable[UUID]) -> None:
+        with self._lock:
+            now = self._clock()
+            for task_uuid in task_uuids:
+                # Moves the task to the end
+                self._seen_at.pop(task_uuid, None)
+                self._seen_at[task_uuid] = now
+            self._expire(now)
 
 
 class SequentialRunner(RunnerBase):
@@ -73,11 +151,14 @@ class SequentialRunner(RunnerBase):
 
     """
 
+    _default_max_workers: int = 1
+
     def __init__(
         self,
         project_hash: str | None = None,
         *,
         pre_execution_callback: Callable[[Self], None] | None = None,
+        retry_policy: RetryPolicy | None = None,
     ):
         """
         Initialize the runner with an optional project hash.
@@ -92,8 +173,12 @@ class SequentialRunner(RunnerBase):
             pre_execution_callback: Callable[RunnerBase, None]
 
                 Allows for optional additional validation e.g. Check specific Ontology form
+            retry_policy: Decides if and when tasks on which an agent failed are retried.
+                Tasks waiting for a retry don't hold up other tasks.
+                Defaults to 3 retries with exponential backoff from 1 second.
         """
         super().__init__(project_hash)
+        self.retry_policy = retry_policy or RetryPolicy()
         self.agents: list[RunnerAgent] = []
         self.was_called_from_cli = False
         self.pre_execution_callback = pre_execution_callback
@@ -106,6 +191,9 @@ class SequentialRunner(RunnerBase):
         label_row_initialise_labels_args: LabelRowInitialiseLabelsArgs | None = None,
         overwrite: bool = False,
         will_set_priority: bool = False,
+        task_timeout: float | None = None,
+        batch: bool = False,
+        max_batch_size: int | None = None,
     ) -> Callable[[DecoratedCallable], DecoratedCallable]:
         r"""
         Decorator to associate a function with an agent stage.
@@ -169,6 +257,26 @@ class SequentialRunner(RunnerBase):
             return "<pathway_name or pathway_uuid>"
         ```
 
+        With `batch=True`, the function is called once for a whole batch of tasks, e.g., to run
+        model inference on a batch. It takes lists, like `list[AgentTask]` and `list[LabelRowV2]`, with
+        an entry per task, and returns a list with a pathway (or `TaskAgentReturnStruct`) per task.
+        Dependencies are solved per task and gathered into lists, too, unless they have a scope
+        other than `"task"`, in which case they are passed as is. So are `Project` and `AgentStage`.
+
+        **Example:**
+
+        ```python
+        @runner.stage("<stage_name_or_uuid>", batch=True, max_batch_size=32)
+        def my_batch_func(
+            label_rows: list[LabelRowV2],
+            frames: Annotated[list[NDArray[np.uint8]], Depends(dep_single_frame)],
+            model: Annotated[Model, Depends(dep_model, scope="process")],
+        ) -> list[str | None]:
+            predictions = model.predict_batch(frames)
+            ...
+            return ["<pathway_name or pathway_uuid>" for _ in label_rows]
+        ```
+
         [docs-project]:    https://docs.encord.com/sdk-documentation/sdk-references/project
         [docs-label-row]:  https://docs.encord.com/sdk-documentation/sdk-references/LabelRowV2
         [docs-agent-task]: https://docs.encord.com/sdk-documentation/sdk-references/AgentTask
@@ -186,6 +294,14 @@ class SequentialRunner(RunnerBase):
                 with a `label_row_priority` field set. This field is only required if you are
                 returning the priority of the label row but not depending on the label row it self.
                 That is, if your function signature does not include a `LabelRowV2` parameter.
+            task_timeout: Max number of seconds that the function may take for a single task.
+                A task that takes longer is abandoned and treated as a failed attempt, i.e., it's
+                retried according to the retry policy. Overrides the `task_timeout` passed to the runner.
+                For batch agents, it applies to the call on the whole batch.
+            batch: Call the function once per batch of tasks rather than once per task.
+                If the function fails, the whole batch is retried.
+            max_batch_size: Max number of tasks that a batch agent is called with at once.
+                Defaults to the runner's task batch size.
 
         Returns:
             The decorated function.
@@ -202,72 +318,629 @@ class SequentialRunner(RunnerBase):
                 label_row_metadata_include_args=label_row_metadata_include_args,
                 label_row_initialise_labels_args=label_row_initialise_labels_args,
                 will_set_priority=will_set_priority,
+                task_timeout=task_timeout,
+                batch=batch,
+                max_batch_size=max_batch_size,
             )
             return func
 
         return decorator
 
+    @staticmethod
+    def _handle_agent_response(
+        context: Context,
+        agent_response: TaskAgentReturnType,
+        stage: AgentStage,
+        *,
+        task_bundle: Bundle | None,
+        label_bundle: Bundle | None,
+    ) -> dict[str, str] | None:
+        """
+        Register the label updates and the task pathway returned by an agent on the bundles.
+
+        Returns:
+            The keyword arguments for `task.proceed` or None if the task should not proceed.
+            If `task_bundle` is None, the task is not proceeded. It's left to the caller to do so.
+            If `label_bundle` is None, the label updates are sent right away.
+        """
+        assert context.task
+        task = context.task
+        if isinstance(agent_response, TaskAgentReturnStruct):
+            pathway_to_follow = agent_response.pathway
+            if agent_response.label_row:
+                agent_response.label_row.save(bundle=label_bundle)
+            if agent_response.label_row_priority:
+                assert (
+                    context.label_row is not None
+                ), f"Label row is not set for task {task} setting the priority requires either setting the `will_set_priority` to True on the stage decorator or depending on the label row."
+                context.label_row.set_priority(agent_response.label_row_priority, bundle=label_bundle)
+        else:
+            pathway_to_follow = agent_response
+        proceed_kwargs: dict[str, str] | None = None
+        if pathway_to_follow is None:
+            pass
+        elif next_stage_uuid := try_coerce_UUID(pathway_to_follow):
+            if next_stage_uuid not in [pathway.uuid for pathway in stage.pathways]:
+                raise PrintableError(
+                    f"No pathway with UUID: {next_stage_uuid} found. Accepted pathway UUIDs are: {[pathway.uuid for pathway in stage.pathways]}"
+                )
+            proceed_kwargs = {"pathway_uuid": str(next_stage_uuid)}
+        else:
+            if pathway_to_follow not in [str(pathway.name) for pathway in stage.pathways]:
+                raise PrintableError(
+                    f"No pathway with name: {pathway_to_follow} found. Accepted pathway names are: {[pathway.name for pathway in stage.pathways]}"
+                )
+            proceed_kwargs = {"pathway_name": str(pathway_to_follow)}
+        if proceed_kwargs is not None and task_bundle is not None:
+            task.proceed(**proceed_kwargs, bundle=task_bundle)
+        return proceed_kwargs
+
+    @staticmethod
+    def _attempt_task(
+        run: TaskRun,
+        runner_agent: RunnerAgent,
+        stage: AgentStage,
+        retry_policy: RetryPolicy,
+        task_bundle: Bundle | None,
+        label_bundle: Bundle,
+        bundle_lock: AbstractContextManager[Any],
+        pbar_update: Callable[[float | None], bool | None] | None = None,
+        task_timeout: float | None = None,
+    ) -> float | None:
+        """
+        Make one attempt at executing the agent on a task.
+
+        The agent itself is called without holding `bundle_lock`, such that multiple
+        tasks can be executed concurrently. Only the operations that register updates
+        on the shared bundles are guarded by the lock.
+
+        Dependencies are solved for every attempt, such that a retry doesn't share them with
+        an earlier attempt that timed out. An attempt that takes longer than `task_timeout` seconds
+        is abandoned and counts as failed. Its dependencies are cleaned up once it's done.
+        Once the task is done, i.e., it succeeded or won't be retried, `run.proceed_kwargs`
+        holds the keyword arguments for `task.proceed`, if any.
+
+        Returns:
+            The number of seconds to wait before retrying the task or None if it's done.
+        """
+        try:
+            with ExitStack() as stack:
+                dependencies = solve_dependencies(
+                    context=run.context, dependant=runner_agent.dependant, stack=stack, scopes=runner_agent.scopes
+                )
+                # Handed over to the call, which cleans up once the agent is done, even if that's after a timeout
+                attempt_stack = stack.pop_all()
+            agent_response = cast(
+                TaskAgentReturnType,
+                call_with_timeout(
+                    runner_agent.callable, dependencies.values, task_timeout, cleanup=attempt_stack.close
+                ),
+            )
+            with bundle_lock:
+                run.proceed_kwargs = SequentialRunner._handle_agent_response(
+                    run.context, agent_response, stage, task_bundle=task_bundle, label_bundle=label_bundle
+                )
+            if pbar_update is not None:
+                pbar_update(1.0)
+        except (KeyboardInterrupt, PrintableError):
+            raise
+        except Exception as err:
+            delay = retry_policy.next_delay(err, run.retries, time.monotonic() - run.started)
+            print(f"[attempt {run.retries+1}/{retry_policy.max_retries+1}] Agent failed with error: ")
+            traceback.print_exc()
+            if delay is not None:
+                run.retries += 1
+                return delay
+        return None
+
+    @staticmethod
+    def _execute_runs(
+        contexts: Iterable[Context],
+        runner_agent: RunnerAgent,
+        stage: AgentStage,
+        retry_policy: RetryPolicy,
+        *,
+        task_bundle: Bundle | None,
+        label_bundle: Bundle,
+        bundle_lock: AbstractContextManager[Any],
+        pbar_update: Callable[[float | None], bool | None] | None = None,
+        max_workers: int = 1,
+        task_timeout: float | None = None,
+        after_attempt: Callable[[], None] | None = None,
+    ) -> list[TaskRun]:
+        """
+        Execute the agent on every context, retrying failed tasks according to `retry_policy`.
+
+        A task that waits for its retry doesn't hold up the other tasks. Contexts are
+        consumed lazily, at most `max_workers` tasks are attempted at once and with
+        `max_workers <= 1`, the agent is called on the current thread.
+        `after_attempt` is called on the current thread after every attempt, e.g., to flush bundles.
+
+        Returns:
+            The task runs in the order in which they were done.
+        """
+        context_iter = iter(contexts)
+        exhausted = False
+        # Heap of (due time, tie breaker, run)
+        retry_queue: list[tuple[float, int, TaskRun]] = []
+        tie_breaker = itertools.count()
+        done_runs: list[TaskRun] = []
+        attempt = partial(
+            SequentialRunner._attempt_task,
+            runner_agent=runner_agent,
+            stage=stage,
+            retry_policy=retry_policy,
+            task_bundle=task_bundle,
+            label_bundle=label_bundle,
+            bundle_lock=bundle_lock,
+            pbar_update=pbar_update,
+            task_timeout=task_timeout,
+        )
+
+        def next_run() -> TaskRun | None:
+            """The next retry that is due or else a new task."""
+            nonlocal exhausted
+            if retry_queue and retry_queue[0][0] <= time.monotonic():
+                return heapq.heappop(retry_queue)[2]
+            if not exhausted:
+                context = next(context_iter, None)
+                if context is not None:
+                    return TaskRun(context)
+                exhausted = True
+            return None
+
+        def handle(run: TaskRun, delay: float | None) -> None:
+            if delay is None:
+                done_runs.append(run)
+            else:
+                heapq.heappush(retry_queue, (time.monotonic() + delay, next(tie_breaker), run))
+            if after_attempt is not None:
+                after_attempt()
+
+        if max_workers <= 1:
+            while not exhausted or retry_queue:
+                run = next_run()
+                if run is not None:
+                    handle(run, attempt(run))
+                elif retry_queue:
+                    time.sleep(max(0.0, retry_queue[0][0] - time.monotonic()))
+            return done_runs
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="encord-agents") as executor:
+            in_flight: dict[Future[float | None], TaskRun] = {}
+            try:
+                while True:
+                    while len(in_flight) < max_workers and (run := next_run()) is not None:
+                        in_flight[executor.submit(attempt, run)] = run
+                    if not in_flight and not retry_queue and exhausted:
+                        return done_runs
+                    # Wake up for the next retry if there's a free worker for it
+                    timeout = None
+                    if retry_queue and len(in_flight) < max_workers:
+                        timeout = max(0.0, retry_queue[0][0] - time.monotonic())
+                    if not in_flight:
+                        time.sleep(timeout or 0.0)
+                        continue
+                    finished, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        handle(in_flight.pop(future), future.result())
+            except BaseException:
+                # Don't start any more tasks. Tasks already running are awaited by the executor.
+                for future in in_flight:
+                    future.cancel()
+                raise
+
     @staticmethod
     def _execute_tasks(
         contexts: Iterable[Context],
         runner_agent: RunnerAgent,
         stage: AgentStage,
-        num_retries: int,
+        retry_policy: RetryPolicy,
         pbar_update: Callable[[float | None], bool | None] | None = None,
+        max_workers: int = 1,
+        label_bundle_size: int = MAX_LABEL_ROW_BATCH_SIZE,
+        flush_interval: float | None = None,
+        task_timeout: float | None = None,
     ) -> None:
         """
         INVARIANT: Tasks should always be for the stage that the runner_agent is associated too
+
+        The contexts are consumed lazily, so they can be streamed in. At most `max_workers`
+        contexts are held at once on top of what's pending in the bundles and the tasks
+        waiting to be retried.
+
+        If `max_workers > 1`, the agent is called concurrently for up to `max_workers` tasks
+        on a thread pool. Each task keeps its own `ExitStack` for dependency cleanup while
+        label and task updates are collected into the shared bundles.
+        Label row updates are saved in chunks of `label_bundle_size` label rows and every
+        `flush_interval` seconds, if set. Pending label row updates are always saved before
+        any tasks are proceeded.
         """
-        with Bundle() as task_bundle:
-            with Bundle(bundle_size=min(MAX_LABEL_ROW_BATCH_SIZE, len(list(contexts)))) as label_bundle:
-                for context in contexts:
-                    assert context.task
-                    with ExitStack() as stack:
-                        task = context.task
-                        dependencies = solve_dependencies(
-                            context=context, dependant=runner_agent.dependant, stack=stack
+        label_bundle = FlushingBundle(
+            bundle_size=label_bundle_size, max_operations=label_bundle_size, max_age=flush_interval
+        )
+        task_bundle = FlushingBundle(
+            max_operations=MAX_TASK_BUNDLE_SIZE, max_age=flush_interval, dependencies=[label_bundle]
+        )
+        bundle_lock = threading.Lock()
+
+        def flush_if_due() -> None:
+            with bundle_lock:
+                task_bundle.flush_if_due()
+                label_bundle.flush_if_due()
+
+        with task_bundle, label_bundle:
+            SequentialRunner._execute_runs(
+                SequentialRunner._prepare_batch_dependencies(contexts, runner_agent, label_bundle_size),
+                runner_agent,
+                stage,
+                retry_policy,
+                task_bundle=task_bundle,
+                label_bundle=label_bundle,
+                bundle_lock=bundle_lock,
+                pbar_update=pbar_update,
+                max_workers=max_workers,
+                task_timeout=task_timeout,
+                after_attempt=flush_if_due,
+            )
+
+    @staticmethod
+    def _prepare_batch_dependencies(
+        contexts: Iterable[Context], runner_agent: RunnerAgent, chunk_size: int
+    ) -> Iterable[Context]:
+        """
+        Solve the batch dependencies of the agent once per chunk of `chunk_size` contexts.
+
+        The contexts are still consumed lazily, a chunk at a time. Generator batch dependencies
+        are torn down with the batch scope. If solving them fails, they are solved per task instead,
+        such that the failure counts towards the retries of the individual tasks.
+        """
+        plan = runner_agent.dependant.plan
+        if plan is None or not plan.has_batch_steps:
+            return contexts
+
+        def prepare() -> Iterator[Context]:
+            for chunk in batch_iterator(contexts, chunk_size):
+                try:
+                    prepare_batch_dependencies(
+                        contexts=chunk,
+                        dependant=runner_agent.dependant,
+                        stack=runner_agent.scopes["batch"].stack,
+                        scopes=runner_agent.scopes,
+                    )
+                except Exception:
+                    print("Solving batch dependencies failed. Falling back to solving them per task. Error: ")
+                    traceback.print_exc()
+                yield from chunk
+
+        return prepare()
+
+    @staticmethod
+    def _call_batch_agent(
+        contexts: list[Context],
+        runner_agent: RunnerAgent,
+        stage: AgentStage,
+        retry_policy: RetryPolicy,
+        *,
+        task_bundle: Bundle | None,
+        label_bundle: Bundle,
+        task_timeout: float | None = None,
+    ) -> list[dict[str, str] | None]:
+        """
+        Call a batch agent on a batch of tasks, retrying the whole batch according to `retry_policy`.
+
+        The dependencies are solved per task and gathered into lists for every attempt.
+        `task_timeout` applies to the call on the whole batch.
+
+        Returns:
+            The keyword arguments for `task.proceed` for every context. None for tasks that shouldn't
+            proceed or if the agent failed on the batch. If `task_bundle` is None, the tasks are not
+            proceeded. It's left to the caller to do so.
+        """
+        started = time.monotonic()
+        for retry in itertools.count():
+            try:
+                with ExitStack() as stack:
+                    kwargs = solve_batch_dependencies(
+                        contexts=contexts, dependant=runner_agent.dependant, stack=stack, scopes=runner_agent.scopes
+                    )
+                    # Handed over to the call, which cleans up once the agent is done, even if that's after a timeout
+                    attempt_stack = stack.pop_all()
+                agent_responses = call_with_timeout(
+                    runner_agent.callable, kwargs, task_timeout, cleanup=attempt_stack.close
+                )
+                if not isinstance(agent_responses, (list, tuple)) or len(agent_responses) != len(contexts):
+                    raise PrintableError(
+                        f"Batch agent [blue]`{runner_agent.printable_name}`[/blue] should return a list with a pathway or `TaskAgentReturnStruct` per task. Got {type(agent_responses).__name__} for {len(contexts)} tasks."
+                    )
+                return [
+                    SequentialRunner._handle_agent_response(
+                        context, agent_response, stage, task_bundle=task_bundle, label_bundle=label_bundle
+                    )
+                    for context, agent_response in zip(contexts, agent_responses, strict=True)
+                ]
+            except (KeyboardInterrupt, PrintableError):
+                raise
+            except Exception as err:
+                delay = retry_policy.next_delay(err, retry, time.monotonic() - started)
+                print(f"[attempt {retry+1}/{retry_policy.max_retries+1}] Batch agent failed with error: ")
+                traceback.print_exc()
+                if delay is None:
+                    return [None] * len(contexts)
+            time.sleep(delay)
+        raise AssertionError("Unreachable")
+
+    @staticmethod
+    def _execute_batch_agent(
+        contexts: Iterable[Context],
+        runner_agent: RunnerAgent,
+        stage: AgentStage,
+        retry_policy: RetryPolicy,
+        pbar_update: Callable[[float | None], bool | None] | None = None,
+        label_bundle_size: int = MAX_LABEL_ROW_BATCH_SIZE,
+        flush_interval: float | None = None,
+        task_timeout: float | None = None,
+    ) -> None:
+        """
+        INVARIANT: Tasks should always be for the stage that the runner_agent is associated too
+
+        Execute a batch agent on the tasks in batches of at most `runner_agent.max_batch_size` tasks.
+        Without a max batch size, the agent receives all the contexts at once.
+        """
+        label_bundle = FlushingBundle(
+            bundle_size=label_bundle_size, max_operations=label_bundle_size, max_age=flush_interval
+        )
+        task_bundle = FlushingBundle(
+            max_operations=MAX_TASK_BUNDLE_SIZE, max_age=flush_interval, dependencies=[label_bundle]
+        )
+        batches: Iterable[list[Context]] = (
+            batch_iterator(contexts, runner_agent.max_batch_size) if runner_agent.max_batch_size else [list(contexts)]
+        )
+        with task_bundle, label_bundle:
+            for batch in batches:
+                if not batch:
+                    continue
+                SequentialRunner._call_batch_agent(
+                    batch,
+                    runner_agent,
+                    stage,
+                    retry_policy,
+                    task_bundle=task_bundle,
+                    label_bundle=label_bundle,
+                    task_timeout=task_timeout,
+                )
+                if pbar_update is not None:
+                    pbar_update(float(len(batch)))
+                task_bundle.flush_if_due()
+                label_bundle.flush_if_due()
+
+    @staticmethod
+    def _iter_batch_contexts(
+        task_batches: Iterable[list[AgentTask]],
+        assemble: Callable[[list[AgentTask]], Iterable[Context]],
+        prefetch_depth: int,
+    ) -> Generator[tuple[list[AgentTask], Iterable[Context]], None, None]:
+        """
+        Yield task batches along with their assembled contexts.
+
+        With `prefetch_depth > 0`, both the task listing and the context assembly happen on
+        a single background thread, keeping up to `prefetch_depth` batches ready ahead of the
+        one currently being executed. Batches are yielded in order.
+        """
+        if prefetch_depth < 1:
+            for task_batch in task_batches:
+                yield task_batch, assemble(task_batch)
+            return
+
+        batch_iter = iter(task_batches)
+
+        def fetch_next() -> tuple[list[AgentTask], Iterable[Context]] | None:
+            task_batch = next(batch_iter, None)
+            if task_batch is None:
+                return None
+            return task_batch, assemble(task_batch)
+
+        # A single worker ensures that the task iterator is only advanced from one thread and in order
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="encord-agents-prefetch") as executor:
+            pending: deque[Future[tuple[list[AgentTask], Iterable[Context]] | None]] = deque(
+                executor.submit(fetch_next) for _ in range(prefetch_depth + 1)
+            )
+            try:
+                while pending:
+                    fetched = pending.popleft().result()
+                    if fetched is None:
+                        break
+                    yield fetched
+                    pending.append(executor.submit(fetch_next))
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _run_stage(
+        self,
+        agent_index: int,
+        runner_agent: RunnerAgent,
+        stage: AgentStage,
+        tasks: Iterable[AgentTask],
+        *,
+        project: Project,
+        retry_policy: RetryPolicy,
+        task_batch_size: int,
+        max_tasks_per_stage: int | None,
+        max_workers: int,
+        prefetch_depth: int,
+        process_pool: ProcessPoolExecutor | None,
+        num_processes: int | None,
+        global_pbar: Progress,
+        batch_pbar: Progress,
+        stop_event: threading.Event | None = None,
+        batch_sizer: AdaptiveBatchSizer | None = None,
+        seen_task_uuids: SeenTasks | None = None,
+        flush_interval: float | None = None,
+        task_timeout: float | None = None,
+    ) -> int:
+        """
+        Execute the agent of one stage on the given task stream.
+
+        The stage adds its own rows to the progress bars, such that multiple stages can run at once.
+        If `stop_event` is set, the stage stops after its current batch.
+        If `batch_sizer` is given, it decides the size of every batch and label row bundle
+        and is fed with the measured durations of the assembly, the label bundles and the execution.
+        Without prefetching, the labels of the label rows are initialised lazily while the
+        batch executes, such that only a bundle's worth of label rows is held at once.
+        If `seen_task_uuids` is given, tasks in it are skipped and executed tasks are added to it.
+        `task_timeout` applies unless the agent has its own.
+
+        Returns:
+            The number of tasks that the agent was executed on.
+        """
+        include_args = runner_agent.label_row_metadata_include_args or LabelRowMetadataIncludeArgs()
+        init_args = runner_agent.label_row_initialise_labels_args or LabelRowInitialiseLabelsArgs()
+        if runner_agent.task_timeout is not None:
+            task_timeout = runner_agent.task_timeout
+
+        # Information to the formats will be updated in the loop below
+        global_task_format = "Executing agent [magenta]`{agent_name}`[/magenta] [cyan](total: {total})"
+        batch_task_format = "Executing batch [cyan]{batch_num}[/cyan] of [magenta]`{agent_name}`[/magenta]"
+
+        # The two tasks that will display the progress
+        global_task = global_pbar.add_task(
+            description=global_task_format.format(agent_name=runner_agent.printable_name, total=0)
+        )
+        batch_task = batch_pbar.add_task(
+            description=batch_task_format.format(batch_num="", agent_name=runner_agent.printable_name), total=0
+        )
+
+        total = 0
+        batch_size: int | Callable[[], int]
+        if batch_sizer is not None:
+            sizer = batch_sizer
+
+            def batch_size() -> int:
+                return min(sizer.batch_size, max_tasks_per_stage) if max_tasks_per_stage else sizer.batch_size
+
+        else:
+            batch_size = min(task_batch_size, max_tasks_per_stage) if max_tasks_per_stage else task_batch_size
+
+        def label_bundle_size() -> int:
+            return batch_sizer.bundle_size if batch_sizer else MAX_LABEL_ROW_BATCH_SIZE
+
+        def assemble(task_batch: list[AgentTask]) -> Iterable[Context]:
+            if process_pool is not None:
+                # Contexts are assembled by the worker processes
+                return []
+            start = time.perf_counter()
+            contexts: Iterable[Context]
+            if prefetch_depth > 0:
+                # Prefetching is all about having the label rows ready ahead of time
+                contexts = self._assemble_contexts(
+                    task_batch=task_batch,
+                    runner_agent=runner_agent,
+                    project=project,
+                    include_args=include_args,
+                    init_args=init_args,
+                    stage=stage,
+                    client=self.client,
+                )
+            else:
+                contexts = self._iter_contexts(
+                    task_batch=task_batch,
+                    runner_agent=runner_agent,
+                    project=project,
+                    include_args=include_args,
+                    init_args=init_args,
+                    stage=stage,
+                    client=self.client,
+                    chunk_size=label_bundle_size(),
+                    on_label_bundle=batch_sizer.record_label_bundle if batch_sizer is not None else None,
+                )
+            if batch_sizer is not None:
+                batch_sizer.record_assembly(len(task_batch), time.perf_counter() - start)
+            return contexts
+
+        def pbar_update(x: float | None) -> None:
+            batch_pbar.advance(batch_task, x or 1)
+
+        if seen_task_uuids is not None:
+            seen = seen_task_uuids
+            tasks = (task for task in tasks if task.uuid not in seen)
+
+        batches = self._iter_batch_contexts(batch_iterator(tasks, batch_size), assemble, prefetch_depth)
+        with closing(batches):
+            for batch_num, (task_batch, contexts) in enumerate(batches):
+                # Reset the batch progress bar to display the current batch number and total tasks
+                batch_pbar.reset(
+                    batch_task,
+                    total=len(task_batch),
+                    description=batch_task_format.format(batch_num=batch_num, agent_name=runner_agent.printable_name),
+                )
+                start = time.perf_counter()
+                try:
+                    if process_pool is not None and num_processes is not None:
+                        execute_tasks_in_processes(
+                            process_pool,
+                            task_batch,
+                            agent_index,
+                            stage,
+                            retry_policy.max_retries,
+                            num_processes=num_processes,
+                            max_workers=max_workers,
+                            pbar_update=pbar_update,
+                            task_timeout=task_timeout,
                         )
-                        for attempt in range(num_retries + 1):
-                            try:
-                                agent_response: TaskAgentReturnType = runner_agent.callable(**dependencies.values)
-                                if isinstance(agent_response, TaskAgentReturnStruct):
-                                    pathway_to_follow = agent_response.pathway
-                                    if agent_response.label_row:
-                                        agent_response.label_row.save(bundle=label_bundle)
-                                    if agent_response.label_row_priority:
-                                        assert (
-                                            context.label_row is not None
-                                        ), f"Label row is not set for task {task} setting the priority requires either setting the `will_set_priority` to True on the stage decorator or depending on the label row."
-                                        context.label_row.set_priority(
-                                            agent_response.label_row_priority, bundle=label_bundle
-                                        )
-                                else:
-                                    pathway_to_follow = agent_response
-                                if pathway_to_follow is None:
-                                    pass
-                                elif next_stage_uuid := try_coerce_UUID(pathway_to_follow):
-                                    if next_stage_uuid not in [pathway.uuid for pathway in stage.pathways]:
-                                        raise PrintableError(
-                                            f"No pathway with UUID: {next_stage_uuid} found. Accepted pathway UUIDs are: {[pathway.uuid for pathway in stage.pathways]}"
-                                        )
-                                    task.proceed(pathway_uuid=str(next_stage_uuid), bundle=task_bundle)
-                                else:
-                                    if pathway_to_follow not in [str(pathway.name) for pathway in stage.pathways]:
-                                        raise PrintableError(
-                                            f"No pathway with name: {pathway_to_follow} found. Accepted pathway names are: {[pathway.name for pathway in stage.pathways]}"
-                                        )
-                                    task.proceed(pathway_name=str(pathway_to_follow), bundle=task_bundle)
-                                if pbar_update is not None:
-                                    pbar_update(1.0)
-                                break
-
-                            except KeyboardInterrupt:
-                                raise
-                            except PrintableError:
-                                raise
-                            except Exception:
-                                print(f"[attempt {attempt+1}/{num_retries+1}] Agent failed with error: ")
-                                traceback.print_exc()
+                    elif runner_agent.batch:
+                        self._execute_batch_agent(
+                            contexts,
+                            runner_agent,
+                            stage,
+                            retry_policy,
+                            pbar_update=pbar_update,
+                            label_bundle_size=label_bundle_size(),
+                            flush_interval=flush_interval,
+                            task_timeout=task_timeout,
+                        )
+                    else:
+                        self._execute_tasks(
+                            contexts,
+                            runner_agent,
+                            stage,
+                            retry_policy,
+                            pbar_update=pbar_update,
+                            max_workers=max_workers,
+                            label_bundle_size=label_bundle_size(),
+                            flush_interval=flush_interval,
+                            task_timeout=task_timeout,
+                        )
+                finally:
+                    runner_agent.scopes["batch"].close()
+                if batch_sizer is not None:
+                    batch_sizer.record_execution(len(task_batch), time.perf_counter() - start)
+                if seen_task_uuids is not None:
+                    seen_task_uuids.update(task.uuid for task in task_batch)
+                total += len(task_batch)
+
+                global_pbar.update(
+                    global_task,
+                    advance=1,
+                    description=global_task_format.format(agent_name=runner_agent.printable_name, total=total),
+                )
+                if max_tasks_per_stage and total >= max_tasks_per_stage:
+                    break
+                if stop_event is not None and stop_event.is_set():
+                    break
+        return total
+
+    @staticmethod
+    def _split_worker_budget(queue_depths: list[int], budget: int) -> list[int]:
+        """
+        Split a budget of workers across stages proportionally to their queue depths.
+
+        Every stage gets at least one worker.
+        """
+        total_depth = sum(queue_depths)
+        if total_depth == 0:
+            return [max(1, budget // max(1, len(queue_depths)))] * len(queue_depths)
+        return [max(1, round(budget * depth / total_depth)) for depth in queue_depths]
 
     def _validate_agent_stages(
         self, valid_stages: list[AgentStage], agent_stages: dict[str | UUID, AgentStage]
@@ -322,8 +995,11 @@ def {fn_name}(...):
             ),
         ] = None,
         num_retries: Annotated[
-            int, Option(help="If an agent fails on a task, how many times should the runner retry it?")
-        ] = 3,
+            Optional[int],
+            Option(
+                help="If an agent fails on a task, how many times should the runner retry it? If `None`, uses the retry policy of the runner (3 retries by default)."
+            ),
+        ] = None,
         task_batch_size: Annotated[
             int, Option(help="Number of tasks for which labels are loaded into memory at once.")
         ] = 300,
@@ -336,6 +1012,78 @@ def {fn_name}(...):
                 help="Max number of tasks to try to process per stage on a given run. If `None`, will attempt all",
             ),
         ] = None,
+        max_workers: Annotated[
+            Optional[int],
+            Option(
+                help="Number of tasks within a batch for which the agent is executed concurrently. If `None`, uses the runner default (1 for the `Runner`).",
+            ),
+        ] = None,
+        prefetch_depth: Annotated[
+            int,
+            Option(
+                help="Number of task batches for which label rows and storage items are loaded in the background while the current batch executes. 0 disables prefetching.",
+            ),
+        ] = 0,
+        num_processes: Annotated[
+            Optional[int],
+            Option(
+                help="Number of worker processes to partition each task batch across. Useful for CPU-bound agents. If `None`, tasks are executed in the runner process.",
+            ),
+        ] = None,
+        parallel_stages: Annotated[
+            bool,
+            Option(
+                help="Execute the agents of different stages concurrently instead of emptying one stage queue after the other.",
+            ),
+        ] = False,
+        weight_by_queue_depth: Annotated[
+            bool,
+            Option(
+                help="With `parallel_stages`, split the total worker budget (`max_workers` per stage) proportionally to the number of tasks in each stage.",
+            ),
+        ] = False,
+        adaptive_batch_size: Annotated[
+            bool,
+            Option(
+                help="Tune the task batch size and label row bundle size at runtime, starting from `task_batch_size`.",
+            ),
+        ] = False,
+        min_task_batch_size: Annotated[
+            int, Option(help="Lower bound on the task batch size with `adaptive_batch_size`.")
+        ] = 10,
+        max_task_batch_size: Annotated[
+            int, Option(help="Upper bound on the task batch size with `adaptive_batch_size`.")
+        ] = 1000,
+        max_memory_mb: Annotated[
+            Optional[int],
+            Option(
+                help="Memory budget of the runner process in MB. With `adaptive_batch_size`, batches are shrunk to stay within it.",
+            ),
+        ] = None,
+        daemon: Annotated[
+            bool,
+            Option(
+                help="Run forever. Poll again right after new tasks were executed and back off exponentially while stages are empty.",
+            ),
+        ] = False,
+        min_poll_interval: Annotated[
+            float, Option(help="Initial number of seconds to wait before polling empty stages again in `daemon` mode.")
+        ] = 1.0,
+        max_poll_interval: Annotated[
+            float, Option(help="Max number of seconds to wait before polling empty stages again in `daemon` mode.")
+        ] = 60.0,
+        flush_interval: Annotated[
+            Optional[float],
+            Option(
+                help="Max number of seconds that label row updates and task pathways are held back before they're sent to Encord. If `None`, they're sent when a bundle is full or the batch is done.",
+            ),
+        ] = None,
+        task_timeout: Annotated[
+            Optional[float],
+            Option(
+                help="Max number of seconds that an agent may take for a single task before it's abandoned and retried. Stages can override it. If `None`, agents can take as long as they need.",
+            ),
+        ] = None,
     ) -> None:
         """
         Run your task agent `runner(...)`.
@@ -345,17 +1093,104 @@ def {fn_name}(...):
             To do so, please set the `refresh_every` parameter.
             When set, the runner re-fetches tasks with at least that amount of time in between polls. If you set the time to, e.g., 1 second, but it takes 60 seconds to empty the task queue, the runner polls again upon completion of the current task queue.
 
+            Alternatively, set `daemon=True` to poll again immediately whenever new tasks were executed
+            and to back off exponentially (from `min_poll_interval` up to `max_poll_interval` seconds) while
+            there are no new tasks.
+
         Args:
             refresh_every: Fetch task statuses from the Encord Project every `refresh_every` seconds.
                 If `None`, the runner exits once task queue is empty.
             num_retries: If an agent fails on a task, how many times should the runner retry it?
+                Overrides `max_retries` of the runner's `retry_policy`. If `None`, the retry policy
+                decides (3 retries by default). Retries are delayed with exponential backoff, while
+                the runner carries on with other tasks.
             task_batch_size: Number of tasks for which labels are loaded into memory at once.
             project_hash: The project hash if not defined at runner instantiation.
+            max_tasks_per_stage: Max number of tasks to try to process per stage on a given run.
+                If `None`, will attempt all.
+            max_workers: Number of tasks within a batch for which the agent is executed concurrently.
+                Agents are called on a thread pool, so this mostly benefits I/O-bound agents, e.g.,
+                agents that download assets or call model servers.
+                Your agent (and its dependencies) must be thread-safe when `max_workers > 1`.
+                If `None`, the runner default is used (1 for the `Runner`).
+            prefetch_depth: Number of task batches to load ahead of time. While the agent executes
+                batch N, label rows and storage items for batches N+1, ..., N+prefetch_depth are
+                fetched on a background thread. Memory use grows with the number of prefetched
+                batches. 0 disables prefetching.
+            num_processes: Number of worker processes to partition each task batch across.
+                This is intended for CPU-bound agents that are limited by the GIL.
+                Workers are forked from the runner process (so it's not available on Windows)
+                and each authenticates its own `EncordUserClient`. Every worker fetches the
+                label rows and storage items for its share of the batch, resolves dependencies
+                and executes the agent with up to `max_workers` threads. Label row updates are
+                saved by the workers while tasks are proceeded by the runner in one bundle.
+                Dependencies and their values never leave the worker, so they don't need to be
+                picklable. However, side effects on objects of the runner process, e.g., appending
+                to a global list, are not visible to the runner.
+                If `None`, tasks are executed in the runner process.
+            parallel_stages: Execute the agents of different stages concurrently. Each stage
+                gets its own task stream, progress bar row and `max_workers` threads, such that a
+                slow stage doesn't hold back the other stages.
+            weight_by_queue_depth: Only applies with `parallel_stages`. Lists all the tasks of
+                every stage up front and splits the total budget of `max_workers * <number of stages>`
+                threads across stages proportionally to their number of tasks.
+            adaptive_batch_size: Tune the task batch size (and the size of the label row bundles)
+                per stage at runtime instead of using a fixed `task_batch_size`. The runner measures
+                how long it takes to load label rows and storage items for a batch, how long the
+                agent takes per task and how much memory is used. Batches are grown while loading
+                dominates and shrunk when the time per task rises or `max_memory_mb` is exceeded.
+                Label row bundles are grown while larger bundles load faster per label row. `task_batch_size` is the
+                initial batch size. Measurements are only taken when tasks execute in the runner
+                process, i.e., without `num_processes`.
+            min_task_batch_size: Lower bound on the task batch size with `adaptive_batch_size`.
+            max_task_batch_size: Upper bound on the task batch size with `adaptive_batch_size`.
+            max_memory_mb: Memory budget of the runner process in MB used by `adaptive_batch_size`.
+                If `None`, batch sizes are only bounded by `max_task_batch_size`.
+            daemon: Run forever instead of using the fixed `refresh_every` schedule. After a poll
+                that yielded new tasks, the runner polls again right away. After a poll without new
+                tasks, it sleeps `min_poll_interval` seconds, doubling the sleep on every further
+                empty poll up to `max_poll_interval`. Tasks that were already executed are skipped
+                for `max_poll_interval` seconds, such that tasks which fail or are left in the
+                stage by the agent are not re-executed in a tight loop, but get another chance
+                even while new tasks keep arriving.
+            min_poll_interval: Initial sleep in seconds between polls of empty stages in `daemon` mode.
+            max_poll_interval: Max sleep in seconds between polls of empty stages in `daemon` mode.
+            flush_interval: Label row updates and task pathways are sent to Encord in bundles.
+                A bundle is sent when it's full or when the batch is done.
+                With `flush_interval`, pending updates are also sent once the oldest of them is
+                `flush_interval` seconds old, which helps to see progress on slow agents and
+                limits the work that is lost if the runner is stopped.
+            task_timeout: Max number of seconds that an agent may take for a single task.
+                An attempt that takes longer is abandoned and counts as a failed attempt, so it's
+                retried according to the retry policy. Every attempt gets dependencies of its own,
+                e.g., downloaded assets. Python can't stop threads, so a synchronous agent call that
+                hangs keeps running in the background, but its result is discarded. Its dependencies
+                are cleaned up once it's done. `async def` agents of the `AsyncRunner` are cancelled. A
+                `task_timeout` passed to `runner.stage(...)` takes precedence.
         Returns:
             None
         """
         # Verify args that don't depend on external service first
         max_tasks_per_stage = self._validate_max_tasks_per_stage(max_tasks_per_stage)
+        max_workers = self._validate_max_workers(max_workers) or self._default_max_workers
+        prefetch_depth = self._validate_prefetch_depth(prefetch_depth)
+        num_processes = self._validate_num_processes(num_processes)
+        if adaptive_batch_size:
+            self._validate_task_batch_size_bounds(min_task_batch_size, max_task_batch_size)
+        max_memory_mb = self._validate_max_memory_mb(max_memory_mb)
+        flush_interval = self._validate_flush_interval(flush_interval)
+        task_timeout = self._validate_task_timeout(task_timeout)
+        retry_policy = self.retry_policy
+        if num_retries is not None:
+            if num_retries < 0:
+                raise PrintableError("We require that `num_retries` >= 0")
+            retry_policy = retry_policy.with_max_retries(num_retries)
+        if daemon:
+            if refresh_every is not None:
+                raise PrintableError("Please use either `refresh_every` or `daemon`, not both.")
+            self._validate_poll_intervals(min_poll_interval, max_poll_interval)
+        if num_processes is not None and self._supports_async:
+            raise PrintableError(f"The `{type(self).__name__}` does not support `num_processes`.")
 
         # Verify Project
         if project_hash is not None:
@@ -388,6 +1223,26 @@ def {fn_name}(...):
         self._validate_agent_stages(valid_stages, agent_stages)
         if self.pre_execution_callback:
             self.pre_execution_callback(self)  # type: ignore  [arg-type]
+        process_pool = (
+            create_process_pool(self, project.project_hash, num_processes) if num_processes is not None else None
+        )
+        # Sizers outlive the polling cycles, such that measurements carry over
+        batch_sizers: dict[str | UUID, AdaptiveBatchSizer] = {}
+        if adaptive_batch_size:
+            batch_sizers = {
+                runner_agent.identity: AdaptiveBatchSizer(
+                    task_batch_size,
+                    min_task_batch_size,
+                    max_task_batch_size,
+                    initial_bundle_size=MAX_LABEL_ROW_BATCH_SIZE,
+                    max_label_row_bundle_size=MAX_LABEL_ROW_BUNDLE_SIZE,
+                    max_memory_bytes=max_memory_mb * 1024 * 1024 if max_memory_mb else None,
+                )
+                for runner_agent in self.agents
+            }
+        # Tasks executed within the last `max_poll_interval` seconds
+        seen_task_uuids = SeenTasks(ttl=max_poll_interval) if daemon else None
+        poll_interval = min_poll_interval
         try:
             # Run
             delta = timedelta(seconds=refresh_every) if refresh_every else None
@@ -402,7 +1257,8 @@ def {fn_name}(...):
                 elif next_execution is not None:
                     break
 
-                next_execution = datetime.now() + delta if delta else False
+                if not daemon:
+                    next_execution = datetime.now() + delta if delta else False
                 global_pbar = Progress(
                     SpinnerColumn(),
                     TextColumn("[progress.description]{task.description}"),
@@ -420,73 +1276,99 @@ def {fn_name}(...):
                     transient=True,
                 )
 
-                # Information to the formats will be updated in the loop below
-                global_task_format = "Executing agent [magenta]`{agent_name}`[/magenta] [cyan](total: {total})"
-                batch_task_format = "Executing batch [cyan]{batch_num}[/cyan]"
-
-                # The two tasks that will display the progress
-                global_task = global_pbar.add_task(description=global_task_format.format(agent_name="", total=0))
-                batch_task = batch_pbar.add_task(description=batch_task_format.format(batch_num=""), total=0)
-
                 # To display two progress bars side at once, we need to create a table
                 # and add the two progress bars to it
                 progress_table = Table.grid()
                 progress_table.add_row(global_pbar)
                 progress_table.add_row(batch_pbar)
 
-                for runner_agent in self.agents:
-                    include_args = runner_agent.label_row_metadata_include_args or LabelRowMetadataIncludeArgs()
-                    init_args = runner_agent.label_row_initialise_labels_args or LabelRowInitialiseLabelsArgs()
-                    stage = agent_stages[runner_agent.identity]
-
-                    # Set the progress bar description to display the agent name and total tasks completed
-                    global_pbar.update(
-                        global_task,
-                        description=global_task_format.format(agent_name=runner_agent.printable_name, total=0),
-                    )
-
-                    total = 0
-                    tasks = stage.get_tasks()
-                    batch_size = min(task_batch_size, max_tasks_per_stage) if max_tasks_per_stage else task_batch_size
-
-                    with Live(progress_table, refresh_per_second=1):
-                        for batch_num, task_batch in enumerate(batch_iterator(tasks, batch_size)):
-                            # Reset the batch progress bar to display the current batch number and total tasks
-                            batch_pbar.reset(
-                                batch_task,
-                                total=len(task_batch),
-                                description=batch_task_format.format(batch_num=batch_num),
-                            )
-                            contexts = self._assemble_contexts(
-                                task_batch=task_batch,
-                                runner_agent=runner_agent,
-                                project=project,
-                                include_args=include_args,
-                                init_args=init_args,
-                                stage=stage,
-                                client=self.client,
-                            )
-                            self._execute_tasks(
-                                contexts,
+                stage_runs = [
+                    (agent_index, runner_agent, agent_stages[runner_agent.identity])
+                    for agent_index, runner_agent in enumerate(self.agents)
+                ]
+                run_stage = partial(
+                    self._run_stage,
+                    project=project,
+                    retry_policy=retry_policy,
+                    task_batch_size=task_batch_size,
+                    max_tasks_per_stage=max_tasks_per_stage,
+                    prefetch_depth=prefetch_depth,
+                    process_pool=process_pool,
+                    num_processes=num_processes,
+                    global_pbar=global_pbar,
+                    batch_pbar=batch_pbar,
+                    seen_task_uuids=seen_task_uuids,
+                    flush_interval=flush_interval,
+                    task_timeout=task_timeout,
+                )
+                num_executed = 0
+                with Live(progress_table, refresh_per_second=1):
+                    if not parallel_stages or len(stage_runs) < 2:
+                        for agent_index, runner_agent, stage in stage_runs:
+                            num_executed += run_stage(
+                                agent_index,
                                 runner_agent,
                                 stage,
-                                num_retries,
-                                pbar_update=lambda x: batch_pbar.advance(batch_task, x or 1),
+                                stage.get_tasks(),
+                                max_workers=max_workers,
+                                batch_sizer=batch_sizers.get(runner_agent.identity),
                             )
-                            total += len(task_batch)
-
-                            global_pbar.update(
-                                global_task,
-                                advance=1,
-                                description=global_task_format.format(
-                                    agent_name=runner_agent.printable_name, total=total
-                                ),
+                    else:
+                        stage_tasks: list[Iterable[AgentTask]]
+                        if weight_by_queue_depth:
+                            listed_tasks = [
+                                [
+                                    task
+                                    for task in stage.get_tasks()
+                                    if seen_task_uuids is None or task.uuid not in seen_task_uuids
+                                ]
+                                for _, _, stage in stage_runs
+                            ]
+                            stage_tasks = list(listed_tasks)
+                            stage_workers = self._split_worker_budget(
+                                [len(tasks) for tasks in listed_tasks], max_workers * len(stage_runs)
                             )
-                            if max_tasks_per_stage and total >= max_tasks_per_stage:
-                                break
+                        else:
+                            stage_tasks = [stage.get_tasks() for _, _, stage in stage_runs]
+                            stage_workers = [max_workers] * len(stage_runs)
+
+                        stop_event = threading.Event()
+                        with ThreadPoolExecutor(
+                            max_workers=len(stage_runs), thread_name_prefix="encord-agents-stage"
+                        ) as executor:
+                            futures = [
+                                executor.submit(
+                                    run_stage,
+                                    agent_index,
+                                    runner_agent,
+                                    stage,
+                                    tasks,
+                                    max_workers=workers,
+                                    stop_event=stop_event,
+                                    batch_sizer=batch_sizers.get(runner_agent.identity),
+                                )
+                                for (agent_index, runner_agent, stage), tasks, workers in zip(
+                                    stage_runs, stage_tasks, stage_workers, strict=True
+                                )
+                            ]
+                            try:
+                                for future in as_completed(futures):
+                                    num_executed += future.result()
+                            except BaseException:
+                                # Let the other stages finish their current batch and stop
+                                stop_event.set()
+                                raise
+
+                global_pbar.stop()
+                batch_pbar.stop()
 
-                    global_pbar.stop()
-                    batch_pbar.stop()
+                if daemon and seen_task_uuids is not None:
+                    if num_executed:
+                        poll_interval = min_poll_interval
+                        continue
+                    print(f"No new tasks. Sleeping {poll_interval} secs until next poll.")
+                    time.sleep(poll_interval)
+                    poll_interval = min(poll_interval * 2, max_poll_interval)
         except (PrintableError, AssertionError) as err:
             if self.was_called_from_cli:
                 panel = Panel(err.args[0], width=None)
@@ -499,6 +1381,11 @@ def {fn_name}(...):
                     plain_text = Text.from_markup(err.args[0]).plain
                     err.args = (plain_text,)
                 raise
+        finally:
+            if process_pool is not None:
+                process_pool.shutdown(cancel_futures=True)
+            for runner_agent in self.agents:
+                runner_agent.scopes["stage"].close()
 
     def run(self) -> None:
         """
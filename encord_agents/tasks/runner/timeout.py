@@ -0,0 +1,242 @@
+import asyncio
+import threading
+import weakref
+from concurrent.futures import Future, wait
+from typing import Any, Awaitable, Callable, Coroutine, TypeVar, cast
+
+from encord_agents.exceptions import TaskTimeoutError
+
+T = TypeVar("T")
+
+
+def call_with_timeout(
+    func: Callable[..., T],
+    kwargs: dict[str, Any],
+    timeout: float | None,
+    *,
+    cleanup: Callable[[], None] | None = None,
+) -> T:
+    """
+    Call `func(**kwargs)` and wait at most `timeout` seconds for it to return.
+
+    Python can't stop a running thread. On timeout, the call is abandoned instead:
+    it keeps running on a daemon thread, but its result (or error) is discarded.
+
+    Args:
+        func: The function to call.
+        kwargs: The keyword arguments to call the function with.
+        timeout: Number of seconds to wait. If `None`, `func` is called directly on the current thread.
+        cleanup: Called once `func` returned or raised, e.g., to release the resources in `kwargs`.
+            If the call is abandoned, it's called on the abandoned thread once `func` is done,
+            such that the resources are not released while they're still in use.
+
+    Returns:
+        The return value of the function.
+
+    Raises:
+        TaskTimeoutError: If the function didn't return within `timeout` seconds.
+    """
+    if timeout is None:
+        try:
+            return func(**kwargs)
+        finally:
+            if cleanup is not None:
+                cleanup()
+
+    future: Future[T] = Future()
+    lock = threading.Lock()
+    finished = False
+    abandoned = False
+
+    def target() -> None:
+        nonlocal finished
+        if not future.set_running_or_notify_cancel():
+            return
+        result: T | None = None
+        error: BaseException | None = None
+        try:
+            result = func(**kwargs)
+        except BaseException as err:
+            error = err
+        with lock:
+            finished = True
+            clean_up_here = abandoned
+        if clean_up_here and cleanup is not None:
+            cleanup()
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(cast(T, result))
+
+    threading.Thread(target=target, name="encord-agents-task", daemon=True).start()
+    wait([future], timeout=timeout)
+    with lock:
+        # The call may have finished right after the wait timed out, then its result is on the way
+        abandoned = not finished
+    if abandoned:
+        raise TaskTimeoutError(f"Agent did not finish the task within {timeout} seconds")
+    if cleanup is not None:
+        cleanup()
+    return future.result()
+
+
+async def await_with_timeout(awaitable: Awaitable[T], timeout: float | None) -> T:
+    """
+    Await `awaitable` for at most `timeout` seconds and cancel it if it takes longer.
+
+    Args:
+        awaitable: The coroutine or future to await.
+        timeout: Number of seconds to wait. If `None`, waits indefinitely.
+
+    Returns:
+        The result of the awaitable.
+
+    Raises:
+        TaskTimeoutError: If the awaitable didn't finish within `timeout` seconds.
+    """
+    if timeout is None:
+        return await awaitable
+
+    future = asyncio.ensure_future(awaitable)
+    try:
+        done, _ = await asyncio.wait({future}, timeout=timeout)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    if not done:
+        future.cancel()
+        raise TaskTimeoutError(f"Agent did not finish the task within {timeout} seconds")
+    return future.result()
+
+
+# Per event loop, the cleanups of abandoned calls that are still to be done
+_abandoned_cleanups: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, set[asyncio.Future[None]]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+async def await_call_in_thread(
+    func: Callable[..., T],
+    kwargs: dict[str, Any],
+    timeout: float | None,
+    *,
+    cleanup: Callable[[], Awaitable[None]] | None = None,
+) -> T:
+    """
+    Call `func(**kwargs)` on a daemon thread and await it for at most `timeout` seconds.
+
+    Unlike `asyncio.to_thread`, the call doesn't run on the default executor of the event loop,
+    which `asyncio.run` waits for when it shuts down. Run the event loop with `run_event_loop`,
+    such that calls that were abandoned on timeout don't keep it from returning.
+
+    Args:
+        func: The function to call.
+        kwargs: The keyword arguments to call the function with.
+        timeout: Number of seconds to wait. If `None`, waits indefinitely.
+        cleanup: Awaited once `func` returned or raised, e.g., to release the resources in `kwargs`.
+            If the call is abandoned, it's awaited on the event loop once `func` is done,
+            such that the resources are not released while they're still in use.
+
+    Returns:
+        The return value of the function.
+
+    Raises:
+        TaskTimeoutError: If the function didn't return within `timeout` seconds.
+    """
+    loop = asyncio.get_running_loop()
+    future: asyncio.Future[T] = loop.create_future()
+    # Resolved once an abandoned call was cleaned up
+    cleaned_up: asyncio.Future[None] = loop.create_future()
+    lock = threading.Lock()
+    finished = False
+    abandoned = False
+
+    def settle(result: T | None, error: BaseException | None) -> None:
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(cast(T, result))
+
+    async def clean_up_abandoned() -> None:
+        try:
+            if cleanup is not None:
+                await cleanup()
+        finally:
+            cleaned_up.set_result(None)
+            _abandoned_cleanups[loop].discard(cleaned_up)
+
+    def target() -> None:
+        nonlocal finished
+        result: T | None = None
+        error: BaseException | None = None
+        try:
+            result = func(**kwargs)
+        except BaseException as err:
+            error = err
+        with lock:
+            finished = True
+            clean_up_here = abandoned
+        if clean_up_here:
+            loop.call_soon_threadsafe(lambda: loop.create_task(clean_up_abandoned()))
+        else:
+            loop.call_soon_threadsafe(settle, result, error)
+
+    def abandon() -> bool:
+        nonlocal abandoned
+        with lock:
+            # The call may have finished right after the wait ended, then its result is on the way
+            abandoned = not finished
+            if abandoned:
+                _abandoned_cleanups.setdefault(loop, set()).add(cleaned_up)
+        return abandoned
+
+    threading.Thread(target=target, name="encord-agents-task", daemon=True).start()
+    try:
+        await asyncio.wait({future}, timeout=timeout)
+    except BaseException:
+        # Cancelled, so the call is abandoned unless it's done already
+        if not abandon() and cleanup is not None:
+            await cleanup()
+        raise
+    if abandon():
+        raise TaskTimeoutError(f"Agent did not finish the task within {timeout} seconds")
+    try:
+        return await future
+    finally:
+        if cleanup is not None:
+            await cleanup()
+
+
+def _close_event_loop(loop: asyncio.AbstractEventLoop) -> None:
+    try:
+        while pending := _abandoned_cleanups.get(loop):
+            loop.run_until_complete(asyncio.wait(set(pending)))
+        tasks = asyncio.all_tasks(loop)
+        if tasks:
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.run_until_complete(loop.shutdown_default_executor())
+    finally:
+        loop.close()
+
+
+def run_event_loop(main: Coroutine[Any, Any, T]) -> T:
+    """
+    Run `main` on a new event loop, like `asyncio.run`.
+
+    Unlike `asyncio.run`, this returns as soon as `main` is done, even if calls of `await_call_in_thread`
+    were abandoned and are still running. The event loop then keeps running on a daemon thread until
+    they're done and cleaned up, such that their resources, e.g., async generators, stay usable until then.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(main)
+    finally:
+        if _abandoned_cleanups.get(loop):
+            threading.Thread(target=_close_event_loop, args=(loop,), name="encord-agents-loop", daemon=True).start()
+        else:
+            _close_event_loop(loop)
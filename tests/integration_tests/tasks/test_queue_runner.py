@@ -13,6 +13,7 @@ from encord.workflow.stages.final import FinalStage
 from encord_agents.exceptions import PrintableError
 from encord_agents.tasks import QueueRunner
 from encord_agents.tasks.models import TaskAgentReturnStruct, TaskCompletionResult
+from encord_agents.tasks.runner.codec import decode_result, encode_task_config, is_compact
 from tests.fixtures import (
     AGENT_STAGE_NAME,
     AGENT_TO_COMPLETE_PATHWAY_HASH,
@@ -82,6 +83,57 @@ def test_queue_runner_e2e(ephemeral_project_hash: str, mock_agent: MagicMock) ->
     assert mock_agent.call_count == N_items
 
 
+def test_queue_runner_batch_e2e(ephemeral_project_hash: str, mock_agent: MagicMock) -> None:
+    queue_runner = QueueRunner(project_hash=ephemeral_project_hash)
+
+    @queue_runner.stage(AGENT_STAGE_NAME)
+    def agent_func(agent_task: AgentTask, label_row: LabelRowV2) -> str:
+        mock_agent(agent_task)
+        return AGENT_TO_COMPLETE_PATHWAY_NAME
+
+    queue = [task.model_dump_json() for stage in queue_runner.get_agent_stages() for task in stage.get_tasks()]
+    assert queue_runner.project
+    N_items = len(queue_runner.project.list_label_rows_v2())
+    assert len(queue) == N_items
+    agent_stage = queue_runner.project.workflow.get_stage(name=AGENT_STAGE_NAME, type_=AgentStage)
+
+    results = [TaskCompletionResult.model_validate_json(r) for r in agent_func.batch(queue)]
+
+    assert [result.task_uuid for result in results] == [AgentTask.model_validate_json(spec).uuid for spec in queue]
+    for result in results:
+        assert result.success
+        assert result.pathway == UUID(AGENT_TO_COMPLETE_PATHWAY_HASH)
+        assert result.stage_uuid == agent_stage.uuid
+    assert len(list(agent_stage.get_tasks())) == 0
+    final_stage = queue_runner.project.workflow.get_stage(name=COMPLETE_STAGE_NAME, type_=FinalStage)
+    assert len(list(final_stage.get_tasks())) == N_items
+    assert mock_agent.call_count == N_items
+    assert agent_func.batch([]) == []
+
+
+def test_queue_runner_compact_task_specs(ephemeral_project_hash: str, mock_agent: MagicMock) -> None:
+    queue_runner = QueueRunner(project_hash=ephemeral_project_hash)
+
+    @queue_runner.stage(AGENT_STAGE_NAME)
+    def agent_func(agent_task: AgentTask) -> str:
+        mock_agent(agent_task)
+        return AGENT_TO_COMPLETE_PATHWAY_NAME
+
+    queue = [encode_task_config(task) for stage in queue_runner.get_agent_stages() for task in stage.get_tasks()]
+    assert queue_runner.project
+    N_items = len(queue_runner.project.list_label_rows_v2())
+    assert len(queue) == N_items
+
+    results = [agent_func(queue[0])] + agent_func.batch(queue[1:])
+
+    for result in results:
+        assert is_compact(result)
+        decoded = decode_result(result)
+        assert decoded.success
+        assert decoded.pathway == UUID(AGENT_TO_COMPLETE_PATHWAY_HASH)
+    assert mock_agent.call_count == N_items
+
+
 def test_queue_runner_passes_errors_appropriately(ephemeral_project_hash: str) -> None:
     queue_runner = QueueRunner(project_hash=ephemeral_project_hash)
 
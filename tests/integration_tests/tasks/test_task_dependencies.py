@@ -224,7 +224,7 @@ class TestDependencyResolution:
     def test_dep_asset(self) -> None:
         """
         We need to employ a context manager to ensure that the asset is cleaned up after the test.
-        This happens under the hood when we use `solve_generator` in `get_field_values`.
+        This happens under the hood when dependencies are solved.
         In turn, it happens when you use the gcp wrapper, the task runners, etc. that resolve dependencies.
         """
         with ExitStack() as stack:
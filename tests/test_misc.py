@@ -1,13 +1,41 @@
+import logging
 import os
+import re
+import threading
 from contextlib import nullcontext
+from datetime import datetime
+from functools import partial
+from http.server import BaseHTTPRequestHandler, SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Iterator
+from uuid import uuid4
 
 import pytest
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from encord.orm.storage import StorageItemType
 
 import encord_agents
 from encord_agents.cli.test import parse_editor_url
-from encord_agents.core.utils import get_user_client
+from encord_agents.core.asset_cache import AssetCache, CacheStats, set_asset_cache
+from encord_agents.core.download import DownloadManager, set_download_manager
+from encord_agents.core.utils import (
+    download_asset,
+    download_asset_bytes,
+    download_assets,
+    get_user_client,
+    open_video,
+)
+from encord_agents.core.video import (
+    VideoSampler,
+    iter_video,
+    iter_video_with_indices,
+    plan_frame_indices,
+    sampling_strategy,
+)
+from encord_agents.core.vision import decode_image
+from encord_agents.exceptions import IncompleteVideoError
 
 PRIVATE_KEY = Ed25519PrivateKey.generate()
 
@@ -95,3 +123,437 @@ def test_editor_url_regex_object_hash() -> None:
     )
     assert frame_data.object_hashes
     assert frame_data.object_hashes == ["KcXM2H8t"]
+
+
+FILE_CONTENT = os.urandom(4500)
+
+
+class _RangeRequestHandler(BaseHTTPRequestHandler):
+    requests: list[str | None] = []
+    support_ranges = True
+    fail_first = True
+
+    def do_GET(self) -> None:
+        cls = type(self)
+        cls.requests.append(self.headers.get("Range"))
+        if cls.fail_first:
+            cls.fail_first = False
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        match = re.fullmatch(r"bytes=(\d+)-(\d+)", self.headers.get("Range") or "")
+        if match and cls.support_ranges:
+            start, end = int(match.group(1)), min(int(match.group(2)), len(FILE_CONTENT) - 1)
+            body = FILE_CONTENT[start : end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(FILE_CONTENT)}")
+        else:
+            body = FILE_CONTENT
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+@pytest.fixture
+def file_server() -> Iterator[str]:
+    _RangeRequestHandler.requests = []
+    _RangeRequestHandler.fail_first = True
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _RangeRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/asset"
+    server.shutdown()
+
+
+@pytest.mark.parametrize("support_ranges", [True, False])
+def test_download_manager_ranges_and_retries(
+    file_server: str, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, support_ranges: bool
+) -> None:
+    monkeypatch.setattr(_RangeRequestHandler, "support_ranges", support_ranges)
+    manager = DownloadManager(range_size=1000, backoff_factor=0, chunk_size=100)
+
+    path = manager.download(file_server, tmp_path / "asset.bin")
+
+    assert path.read_bytes() == FILE_CONTENT
+    # One failed request, which is retried, and then one request per part
+    expected_requests = 1 + (5 if support_ranges else 1)
+    assert len(_RangeRequestHandler.requests) == expected_requests
+    assert _RangeRequestHandler.requests[0] == "bytes=0-999"
+
+    paths = manager.download_many([(file_server, tmp_path / f"asset_{i}.bin") for i in range(3)])
+    assert [p.read_bytes() for p in paths] == [FILE_CONTENT] * 3
+
+
+def test_asset_cache_hits_versions_and_eviction(file_server: str, tmp_path: Path) -> None:
+    set_download_manager(DownloadManager(range_size=None, backoff_factor=0))
+    cache = AssetCache(tmp_path / "cache", max_bytes=2 * len(FILE_CONTENT))
+    set_asset_cache(cache)
+
+    def storage_item(last_edited_at: datetime = datetime(2025, 1, 1)) -> SimpleNamespace:
+        return SimpleNamespace(
+            uuid=uuid4(),
+            name="asset.png",
+            item_type=StorageItemType.IMAGE,
+            mime_type="image/png",
+            file_size=len(FILE_CONTENT),
+            last_edited_at=last_edited_at,
+            get_signed_url=lambda: file_server,
+        )
+
+    try:
+        item = storage_item()
+        for _ in range(3):
+            with download_asset(item) as path:  # type: ignore[arg-type]
+                assert path.read_bytes() == FILE_CONTENT
+                assert path.name == f"{item.uuid}.png"
+            assert not path.exists()
+        # The first download is retried once, the other calls hit the cache
+        assert len(_RangeRequestHandler.requests) == 2
+        assert cache.stats == CacheStats(hits=2, misses=1, evictions=0)
+
+        # A new content version is downloaded again
+        item.last_edited_at = datetime(2025, 1, 2)
+        with download_asset(item) as path:  # type: ignore[arg-type]
+            assert path.read_bytes() == FILE_CONTENT
+        assert cache.stats.misses == 2
+
+        # Only two assets fit, so the least recently used one is evicted
+        newer = storage_item()
+        with download_asset(newer), download_asset(item):  # type: ignore[arg-type]
+            pass
+        assert cache.stats == CacheStats(hits=3, misses=3, evictions=1)
+        assert cache.size_bytes() == 2 * len(FILE_CONTENT)
+        # Evicted assets leave no lock file behind
+        assert {p.stem for p in cache.locks_dir.iterdir()} == {p.stem for p in cache.entries_dir.iterdir()}
+        with download_asset(item), download_asset(newer):  # type: ignore[arg-type]
+            pass
+        assert cache.stats.hits == 5
+
+        # Waiting for the download of one asset doesn't hold up others
+        def download_other() -> None:
+            with download_asset(storage_item()):  # type: ignore[arg-type]
+                pass
+
+        with cache.lock(item):  # type: ignore[arg-type]
+            thread = threading.Thread(target=download_other, daemon=True)
+            thread.start()
+            thread.join(timeout=10)
+            assert not thread.is_alive()
+
+        cache.clear()
+        assert cache.size_bytes() == 0 and not any(cache.locks_dir.iterdir())
+    finally:
+        set_asset_cache(None)
+        set_download_manager(None)
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_download_asset_bytes(file_server: str, tmp_path: Path, cached: bool) -> None:
+    set_download_manager(DownloadManager(backoff_factor=0))
+    cache = AssetCache(tmp_path / "cache") if cached else None
+    set_asset_cache(cache)
+    item = SimpleNamespace(
+        uuid=uuid4(),
+        name="asset.png",
+        item_type=StorageItemType.IMAGE,
+        mime_type="image/png",
+        file_size=len(FILE_CONTENT),
+        last_edited_at=datetime(2025, 1, 1),
+        get_signed_url=lambda: file_server,
+    )
+    try:
+        for _ in range(2):
+            assert download_asset_bytes(item) == FILE_CONTENT  # type: ignore[arg-type]
+        # One retried request, and another one without the cache
+        assert len(_RangeRequestHandler.requests) == (2 if cached else 3)
+        if cache is not None:
+            assert cache.stats == CacheStats(hits=1, misses=1, evictions=0)
+
+        item.item_type = StorageItemType.VIDEO
+        with pytest.raises(ValueError):
+            download_asset_bytes(item)  # type: ignore[arg-type]
+    finally:
+        set_asset_cache(None)
+        set_download_manager(None)
+
+
+def test_download_assets_in_order_and_cleaned_up(file_server: str, tmp_path: Path) -> None:
+    set_download_manager(DownloadManager(backoff_factor=0))
+    # Within the cache directory, the temporary directories of the downloads can be observed
+    cache = AssetCache(tmp_path / "cache")
+    set_asset_cache(cache)
+
+    def storage_item(name: str) -> SimpleNamespace:
+        return SimpleNamespace(
+            uuid=uuid4(),
+            name=name,
+            item_type=StorageItemType.IMAGE,
+            mime_type="image/png",
+            file_size=len(FILE_CONTENT),
+            last_edited_at=datetime(2025, 1, 1),
+            get_signed_url=lambda: file_server,
+        )
+
+    def fail() -> str:
+        raise RuntimeError("No url")
+
+    try:
+        items = [storage_item(f"asset_{i}.png") for i in range(4)]
+        with download_assets(items, max_workers=4) as paths:  # type: ignore[arg-type]
+            assert [path.stem for path in paths] == [str(item.uuid) for item in items]
+            assert all(path.read_bytes() == FILE_CONTENT for path in paths)
+        assert not any(cache.temp_dir.iterdir())
+
+        failing = storage_item("failing.png")
+        failing.get_signed_url = fail
+        with pytest.raises(RuntimeError, match="No url"):
+            with download_assets([*items, failing], max_workers=4):  # type: ignore[list-item]
+                pass
+        # The assets that were downloaded before the failure are cleaned up
+        assert not any(cache.temp_dir.iterdir())
+    finally:
+        set_asset_cache(None)
+        set_download_manager(None)
+
+
+def test_decode_image() -> None:
+    import cv2
+    import numpy as np
+
+    rgb = np.zeros((4, 6, 3), dtype=np.uint8)
+    rgb[..., 0] = 255
+    ok, encoded = cv2.imencode(".png", cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR))
+    assert ok
+
+    decoded = decode_image(bytearray(encoded.tobytes()))
+
+    assert decoded.shape == (4, 6, 3)
+    assert (decoded == rgb).all()
+
+
+@pytest.fixture
+def video_file(tmp_path: Path) -> Path:
+    import cv2
+    import numpy as np
+
+    path = tmp_path / "video.mp4"
+    writer = cv2.VideoWriter(path.as_posix(), cv2.VideoWriter.fourcc(*"mp4v"), 10, (64, 48))
+    for i in range(30):
+        # A moving square rather than a change of brightness, which the encoder would take for a cut
+        # and encode as a keyframe. Like this, there's a keyframe every 12 frames.
+        frame = np.full((48, 64, 3), 100, dtype=np.uint8)
+        frame[10:20, i : i + 10] = 255
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+@pytest.fixture
+def video_server(video_file: Path, tmp_path: Path) -> Iterator[str]:
+    class QuietHandler(SimpleHTTPRequestHandler):
+        def log_message(self, format: str, *args: object) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=tmp_path.as_posix()))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/video.mp4"
+    server.shutdown()
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_open_video_streams(video_server: str, stream: bool) -> None:
+    item = SimpleNamespace(
+        uuid=uuid4(),
+        name="video.mp4",
+        item_type=StorageItemType.VIDEO,
+        mime_type="video/mp4",
+        file_size=None,
+        last_edited_at=datetime(2025, 1, 1),
+        get_signed_url=lambda: video_server,
+    )
+    with open_video(item, stream=stream) as video:  # type: ignore[arg-type]
+        assert isinstance(video, str) == stream
+        assert [frame.frame for frame in iter_video(video)] == list(range(30))
+        assert [frame.frame for frame in iter_video_with_indices(video, [3, 20])] == [3, 20]
+
+
+def test_open_video_downloads_by_default_and_reuses_the_probe(
+    video_server: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    import cv2
+
+    item = SimpleNamespace(
+        uuid=uuid4(),
+        name="video.mp4",
+        item_type=StorageItemType.VIDEO,
+        mime_type="video/mp4",
+        file_size=None,
+        last_edited_at=datetime(2025, 1, 1),
+        get_signed_url=lambda: video_server,
+    )
+    with open_video(item) as video:  # type: ignore[arg-type]
+        assert isinstance(video, Path)
+
+    opened: list[object] = []
+    video_capture = cv2.VideoCapture
+
+    def counting_video_capture(*args: object) -> object:
+        opened.append(args[0])
+        return video_capture(*args)
+
+    monkeypatch.setattr(cv2, "VideoCapture", counting_video_capture)
+    with open_video(item, stream=True) as video:  # type: ignore[arg-type]
+        assert [frame.frame for frame in iter_video(video)] == list(range(30))
+    # The capture that probed the url decoded the frames
+    assert opened == [video_server]
+
+
+@pytest.fixture
+def cut_off_video_server(tmp_path: Path) -> Iterator[str]:
+    import cv2
+    import numpy as np
+
+    path = tmp_path / "noise.mp4"
+    writer = cv2.VideoWriter(path.as_posix(), cv2.VideoWriter.fourcc(*"mp4v"), 10, (64, 48))
+    rng = np.random.default_rng(0)
+    for _ in range(60):
+        # Noise doesn't compress, so the video is too large to be read with a single request
+        writer.write(rng.integers(0, 255, (48, 64, 3), dtype=np.uint8))
+    writer.release()
+    content = path.read_bytes()
+    cut = content.find(b"mdat") + 1000
+    num_requests = 0
+
+    class CutOffHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            nonlocal num_requests
+            num_requests += 1
+            match = re.fullmatch(r"bytes=(\d+)-\d*", self.headers.get("Range") or "")
+            start = int(match.group(1)) if match else 0
+            body = content[start:]
+            self.send_response(206 if match else 200)
+            if match:
+                self.send_header("Content-Range", f"bytes {start}-{len(content) - 1}/{len(content)}")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            # The connection drops while the frames are streamed, after the video was opened
+            self.wfile.write(body[: cut - start] if num_requests > 1 and start < cut else body)
+            self.close_connection = True
+
+        def log_message(self, format: str, *args: object) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CutOffHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/noise.mp4"
+    server.shutdown()
+
+
+def test_cut_off_stream_raises(cut_off_video_server: str) -> None:
+    item = SimpleNamespace(
+        uuid=uuid4(),
+        name="noise.mp4",
+        item_type=StorageItemType.VIDEO,
+        mime_type="video/mp4",
+        file_size=None,
+        last_edited_at=datetime(2025, 1, 1),
+        get_signed_url=lambda: cut_off_video_server,
+    )
+    frames: list[int] = []
+    with open_video(item, stream=True) as video:  # type: ignore[arg-type]
+        assert isinstance(video, str)
+        with pytest.raises(IncompleteVideoError):
+            for frame in iter_video(video):
+                frames.append(frame.frame)
+    assert len(frames) < 60
+
+
+@pytest.mark.parametrize(
+    "frame_indices, strategy",
+    [
+        ([0, 1, 2, 3], "sequential"),
+        ([2, 7, 12, 20], "sequential"),
+        ([0, 5, 20, 10], "mixed"),
+        ([25, 0, 29], "seek"),
+    ],
+)
+def test_iter_video_with_indices_strategies(video_file: Path, frame_indices: list[int], strategy: str) -> None:
+    assert sampling_strategy(frame_indices, max_grab_gap=10) == strategy
+
+    frames = list(iter_video_with_indices(video_file, frame_indices, max_grab_gap=10))
+    # Seeks for every frame
+    sought = list(iter_video_with_indices(video_file, frame_indices, max_grab_gap=-1))
+
+    assert [f.frame for f in frames] == [f.frame for f in sought] == frame_indices
+    for frame, expected in zip(frames, sought):
+        assert (frame.content == expected.content).all()
+    # Stops at the end of the video
+    assert [f.frame for f in iter_video_with_indices(video_file, [28, 29, 30, 31])] == [28, 29]
+
+
+def test_iter_video_with_indices_logs_strategy(video_file: Path, caplog: pytest.LogCaptureFixture) -> None:
+    frame_indices = [0, 5, 20, 10]
+    with caplog.at_level(logging.INFO, logger="encord_agents.core.video"):
+        frames = list(iter_video_with_indices(video_file, frame_indices, max_grab_gap=10))
+        # Iterators are treated the same as sequences
+        frames_from_iterator = list(iter_video_with_indices(video_file, iter(frame_indices), max_grab_gap=10))
+    assert [f.frame for f in frames] == [f.frame for f in frames_from_iterator] == frame_indices
+    assert [record.name for record in caplog.records] == ["encord_agents.core.video"] * 2
+    assert [record.getMessage() for record in caplog.records] == ["Sampling 4 frames with the mixed strategy"] * 2
+
+
+@pytest.mark.parametrize(
+    "kwargs, expected",
+    [
+        ({}, list(range(10))),
+        ({"rate": 1 / 3}, [0, 3, 6, 9]),
+        ({"rate": 0.4}, [0, 2, 5, 7]),
+        ({"fps": 5, "target_fps": 2}, [0, 2, 5, 7]),
+        ({"fps": 5, "target_fps": 100}, list(range(10))),
+        ({"fps": 5, "start": 0.5, "end": 1.5}, [3, 4, 5, 6, 7]),
+        ({"fps": 5, "start": 1, "end": 100, "rate": 0.5}, [5, 7, 9]),
+        ({"max_frames": 3}, [0, 4, 9]),
+        ({"max_frames": 0}, []),
+        # Clamped to the end of the video
+        ({"fps": 5, "start": 1.5, "end": 100}, [8, 9]),
+        ({"fps": 5, "start": 3}, []),
+        ({"fps": 5, "target_fps": 2, "start": 1, "end": 100}, [5, 7]),
+        ({"fps": 5, "start": 1.9, "max_frames": 5}, []),
+    ],
+)
+def test_plan_frame_indices(kwargs: dict[str, float], expected: list[int]) -> None:
+    assert plan_frame_indices(10, **kwargs).tolist() == expected  # type: ignore[arg-type]
+
+
+@pytest.mark.parametrize(
+    "kwargs", [{"rate": 0}, {"rate": 1.5}, {"target_fps": 2}, {"rate": 0.5, "target_fps": 2, "fps": 5}]
+)
+def test_plan_frame_indices_invalid(kwargs: dict[str, float]) -> None:
+    with pytest.raises(ValueError):
+        plan_frame_indices(10, **kwargs)  # type: ignore[arg-type]
+
+
+def test_video_sampler(video_file: Path) -> None:
+    sampler = VideoSampler(video_file)
+    assert sampler.frame_count == 30
+    assert sampler.fps == 10
+
+    assert [f.frame for f in sampler(1 / 5)] == [0, 5, 10, 15, 20, 25]
+    assert [f.frame for f in sampler([40, 2, 1, 2])] == [1, 2]
+    assert [f.frame for f in sampler(fps=2, start=1, end=2.5)] == [10, 15, 20]
+    assert [f.frame for f in sampler(max_frames=2)] == [0, 29]
+    assert [f.frame for f in sampler(keyframes_only=True)] == [0, 12, 24]
+    assert [f.frame for f in sampler(keyframes_only=True, max_frames=2)] == [0, 12]
+    assert [f.frame for f in sampler(keyframes_only=True, start=1, end=2.5)] == [12, 24]
+    # Sampling by time never goes past the end of the video
+    assert [f.frame for f in sampler(fps=2, start=2)] == [20, 25]
+    assert [f.frame for f in sampler(fps=100, start=2.5, end=10)] == [25, 26, 27, 28, 29]
+    with pytest.raises(ValueError):
+        sampler([1, 2], fps=2)
@@ -1,7 +1,51 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from contextlib import ExitStack
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Iterator, cast
+from unittest.mock import MagicMock, patch
+from uuid import UUID, uuid4
+
 import pytest
+from encord.exceptions import RateLimitExceededError
+from encord.http.bundle import Bundle
+from encord.orm.project import ProjectType
+from encord.orm.workflow import WorkflowStageType
+from encord.workflow.stages.agent import AgentPathway, AgentStage, AgentTask, AgentTaskStatus
+from pydantic import ValidationError
+from rich.progress import Progress
+from typing_extensions import Annotated
 
-from encord_agents.exceptions import PrintableError
-from encord_agents.tasks.runner import SequentialRunner
+from encord_agents.core.dependencies.models import BatchDepends, Context, Depends
+from encord_agents.core.dependencies.scopes import PROCESS_SCOPE
+from encord_agents.core.dependencies.utils import solve_dependencies
+from encord_agents.exceptions import PrintableError, TaskTimeoutError
+from encord_agents.tasks.models import AgentTaskConfig, TaskCompletionResult
+from encord_agents.tasks.runner import AsyncRunner, SequentialRunner, adaptive, process_pool
+from encord_agents.tasks.runner.adaptive import AdaptiveBatchSizer
+from encord_agents.tasks.runner.bundles import FlushingBundle
+from encord_agents.tasks.runner.codec import (
+    TRUNCATION_MARKER,
+    decode_result,
+    decode_task,
+    decode_task_config,
+    encode_result,
+    encode_task_config,
+    is_compact,
+    task_spec_json,
+)
+from encord_agents.tasks.runner.local_pool import run_local_pool
+from encord_agents.tasks.runner.producer import InMemorySink, QueueProducer, SQLiteSink
+from encord_agents.tasks.runner.queue_runner import QueueRunner, task_from_spec
+from encord_agents.tasks.runner.retry import RetryPolicy, is_transient_error
+from encord_agents.tasks.runner.runner_base import RunnerAgent
+from encord_agents.tasks.runner.sequential_runner import SeenTasks
+from encord_agents.tasks.runner.timeout import call_with_timeout
 
 
 def test_overrride_runner() -> None:
@@ -57,3 +101,1184 @@ def test_max_tasks_per_stage_validation() -> None:
     with pytest.raises(PrintableError):
         runner(max_tasks_per_stage=-1)
     # Actual behaviour checked in integration_tests/tasks/test_queue_runner via integration test
+
+
+NO_RETRIES = RetryPolicy(max_retries=0)
+
+
+def _mock_stage_and_contexts(n_tasks: int) -> tuple[MagicMock, list[Context]]:
+    stage = MagicMock(spec=AgentStage)
+    stage.uuid = uuid4()
+    stage.pathways = [AgentPathway(uuid=uuid4(), name="complete", destination_uuid=uuid4())]
+    contexts = [
+        Context(project=MagicMock(), label_row=None, task=MagicMock(spec=AgentTask, uuid=uuid4()), agent_stage=stage)
+        for _ in range(n_tasks)
+    ]
+    return stage, contexts
+
+
+def test_execute_tasks_concurrently() -> None:
+    n_tasks = 4
+    barrier = threading.Barrier(n_tasks, timeout=5)
+
+    def agent(task: AgentTask) -> str:
+        # Only passes if all tasks are in flight at the same time
+        barrier.wait()
+        return "complete"
+
+    stage, contexts = _mock_stage_and_contexts(n_tasks)
+    SequentialRunner._execute_tasks(
+        contexts, RunnerAgent(identity="Yep", callable=agent), stage, retry_policy=NO_RETRIES, max_workers=n_tasks
+    )
+    for context in contexts:
+        assert context.task
+        context.task.proceed.assert_called_once()  # type: ignore[attr-defined]
+        assert context.task.proceed.call_args.kwargs["pathway_name"] == "complete"  # type: ignore[attr-defined]
+
+
+def test_max_workers_validation() -> None:
+    runner = SequentialRunner()
+
+    with pytest.raises(PrintableError):
+        runner(max_workers=0)
+
+
+def test_sequential_runner_rejects_async_agents() -> None:
+    runner = SequentialRunner()
+
+    with pytest.raises(PrintableError):
+
+        @runner.stage(stage="Yep")
+        async def agent() -> str:
+            return "complete"
+
+
+def test_async_runner_executes_tasks_concurrently() -> None:
+    n_tasks = 4
+    in_flight: list[int] = []
+    torn_down: list[int] = []
+
+    async def dep_resource() -> AsyncIterator[int]:
+        yield len(in_flight)
+        torn_down.append(1)
+
+    async def agent(task: AgentTask, resource: Annotated[int, Depends(dep_resource)]) -> str:
+        in_flight.append(resource)
+        # Only finishes if all tasks are in flight at the same time
+        while len(in_flight) < n_tasks:
+            await asyncio.sleep(0.01)
+        return "complete"
+
+    runner = AsyncRunner()
+    runner.stage(stage="Yep")(agent)
+    stage, contexts = _mock_stage_and_contexts(n_tasks)
+    runner._execute_tasks(contexts, runner.agents[0], stage, retry_policy=NO_RETRIES, max_workers=n_tasks)
+
+    assert len(torn_down) == n_tasks
+    for context in contexts:
+        assert context.task
+        context.task.proceed.assert_called_once()  # type: ignore[attr-defined]
+
+
+@pytest.mark.parametrize("prefetch_depth", [0, 1, 3])
+def test_iter_batch_contexts_prefetches_in_order(prefetch_depth: int) -> None:
+    task_batches = [[cast(AgentTask, MagicMock(spec=AgentTask)) for _ in range(2)] for _ in range(5)]
+    assembled: list[int] = []
+
+    def assemble(task_batch: list[AgentTask]) -> list[Context]:
+        assembled.append(task_batches.index(task_batch))
+        return [Context(project=MagicMock(), label_row=None, task=task) for task in task_batch]
+
+    batches = SequentialRunner._iter_batch_contexts(task_batches, assemble, prefetch_depth)
+    task_batch, contexts = next(batches)
+    assert task_batch is task_batches[0]
+    if prefetch_depth:
+        # Next batches are loaded in the background while the current one is being processed
+        deadline = time.monotonic() + 5
+        while len(assembled) < prefetch_depth + 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(assembled) == prefetch_depth + 1
+    else:
+        assert assembled == [0]
+
+    remaining = list(batches)
+    assert [b for b, _ in remaining] == task_batches[1:]
+    assert assembled == list(range(len(task_batches)))
+    for task_batch, contexts in remaining:
+        assert [c.task for c in contexts] == task_batch
+
+
+def test_process_worker_executes_chunk_without_proceeding(monkeypatch: pytest.MonkeyPatch) -> None:
+    runner = SequentialRunner()
+
+    @runner.stage(stage="Yep")
+    def agent(task: AgentTask) -> str | None:
+        return "complete" if task.data_title == "move me" else None
+
+    stage, contexts = _mock_stage_and_contexts(3)
+    tasks = [context.task for context in contexts]
+    for task, title in zip(tasks, ["move me", "stay", "move me"]):
+        assert task
+        task.uuid = uuid4()
+        task.data_hash = uuid4()
+        task.data_title = title
+    stage.get_tasks.return_value = tasks
+    state = process_pool._ProcessWorkerState(runner=runner, client=MagicMock(), project=MagicMock())
+    state.stages[stage.uuid] = stage
+    monkeypatch.setattr(process_pool, "_worker_state", state)
+
+    outcomes = process_pool._execute_task_chunk(
+        0, stage.uuid, [(t.uuid, t.data_hash) for t in tasks if t], num_retries=0, max_workers=2
+    )
+
+    assert [task_uuid for task_uuid, _ in outcomes] == [t.uuid for t in tasks if t]
+    assert [kwargs for _, kwargs in outcomes] == [{"pathway_name": "complete"}, None, {"pathway_name": "complete"}]
+    for task in tasks:
+        # Proceeding is left to the runner process
+        task.proceed.assert_not_called()  # type: ignore[union-attr]
+
+
+@pytest.mark.parametrize(
+    "queue_depths, budget, expected",
+    [
+        pytest.param([30, 10], 8, [6, 2], id="Proportional"),
+        pytest.param([100, 0], 4, [4, 1], id="Every stage gets a worker"),
+        pytest.param([0, 0], 4, [2, 2], id="Empty queues"),
+    ],
+)
+def test_split_worker_budget(queue_depths: list[int], budget: int, expected: list[int]) -> None:
+    assert SequentialRunner._split_worker_budget(queue_depths, budget) == expected
+
+
+def test_run_stage_stops_when_signalled() -> None:
+    runner = SequentialRunner()
+    stop_event = threading.Event()
+
+    @runner.stage(stage="Yep")
+    def agent(task: AgentTask) -> str:
+        stop_event.set()
+        return "complete"
+
+    stage, contexts = _mock_stage_and_contexts(6)
+    runner._run_stage(
+        0,
+        runner.agents[0],
+        stage,
+        [context.task for context in contexts if context.task],
+        project=MagicMock(),
+        retry_policy=NO_RETRIES,
+        task_batch_size=2,
+        max_tasks_per_stage=None,
+        max_workers=1,
+        prefetch_depth=0,
+        process_pool=None,
+        num_processes=None,
+        global_pbar=Progress(),
+        batch_pbar=Progress(),
+        stop_event=stop_event,
+    )
+    # Only the first batch is executed
+    assert [context.task.proceed.called for context in contexts] == [True, True] + [False] * 4  # type: ignore[union-attr]
+
+
+def test_adaptive_batch_sizer_grows_while_fetching_dominates(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(adaptive, "get_memory_usage", lambda: None)
+    sizer = AdaptiveBatchSizer(10, 5, 40, initial_bundle_size=10, max_label_row_bundle_size=25)
+    sizer.record_assembly(10, 1.0)
+    sizer.record_execution(10, 1.0)
+    assert sizer.batch_size == 20
+
+    sizer.record_assembly(20, 1.0)
+    sizer.record_execution(20, 1.0)
+    assert sizer.batch_size == 40  # Capped by the upper bound
+    assert sizer.bundle_size == 10  # Only tuned from the label bundles
+
+    # Fetching is negligible compared to executing the agent
+    sizer = AdaptiveBatchSizer(10, 5, 40, initial_bundle_size=10, max_label_row_bundle_size=25)
+    sizer.record_assembly(10, 0.01)
+    sizer.record_execution(10, 10.0)
+    assert sizer.batch_size == 10
+
+    # Labels that are initialised lazily count as fetching, not executing
+    sizer = AdaptiveBatchSizer(10, 5, 40, initial_bundle_size=10, max_label_row_bundle_size=25)
+    sizer.record_assembly(10, 0.01)
+    sizer.record_label_bundle(10, 9.0)
+    sizer.record_execution(10, 10.0)
+    assert sizer.batch_size == 20
+
+
+def test_adaptive_batch_sizer_shrinks_when_latency_rises(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(adaptive, "get_memory_usage", lambda: None)
+    sizer = AdaptiveBatchSizer(10, 5, 40, initial_bundle_size=10, max_label_row_bundle_size=25)
+    sizer.record_assembly(10, 1.0)
+    sizer.record_execution(10, 1.0)
+    assert sizer.batch_size == 20
+
+    # The larger batch takes more than twice as long per task
+    sizer.record_assembly(20, 6.0)
+    sizer.record_execution(20, 4.0)
+    assert sizer.batch_size == 10
+
+
+def test_adaptive_batch_sizer_tunes_bundle_size(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(adaptive, "get_memory_usage", lambda: None)
+    sizer = AdaptiveBatchSizer(10, 5, 40, initial_bundle_size=10, max_label_row_bundle_size=25)
+    sizer.record_label_bundle(10, 1.0)
+    assert sizer.bundle_size == 20
+    # Partial bundles don't show whether larger ones pay off
+    sizer.record_label_bundle(5, 0.1)
+    assert sizer.bundle_size == 20
+    sizer.record_label_bundle(20, 0.5)
+    assert sizer.bundle_size == 25  # Capped by the upper bound
+    assert sizer.batch_size == 10  # Independent of the batch size
+
+    # Loading got slower per label row
+    sizer.record_label_bundle(25, 10.0)
+    assert sizer.bundle_size == 12
+
+
+def test_adaptive_batch_sizer_respects_memory_budget(monkeypatch: pytest.MonkeyPatch) -> None:
+    memory = [100]
+    monkeypatch.setattr(adaptive, "get_memory_usage", lambda: memory[0])
+    sizer = AdaptiveBatchSizer(
+        10, 2, 1000, initial_bundle_size=100, max_label_row_bundle_size=1000, max_memory_bytes=1000
+    )
+
+    # Every task takes 10 bytes, so at most 90 tasks fit on top of the baseline
+    memory[0] = 200
+    sizer.record_assembly(10, 1.0)
+    sizer.record_execution(10, 0.0)
+    assert sizer.batch_size == 20
+    for _ in range(5):
+        sizer.record_assembly(10, 1.0)
+        sizer.record_execution(10, 0.0)
+    assert sizer.batch_size == 90
+
+    # Over budget halves the batch size
+    memory[0] = 2000
+    sizer.record_assembly(90, 1.0)
+    sizer.record_execution(90, 0.0)
+    assert sizer.batch_size == 45
+    assert sizer.bundle_size == 50
+
+
+def test_run_stage_skips_seen_tasks() -> None:
+    runner = SequentialRunner()
+
+    @runner.stage(stage="Yep")
+    def agent(task: AgentTask) -> str:
+        return "complete"
+
+    stage, contexts = _mock_stage_and_contexts(4)
+    tasks = [context.task for context in contexts if context.task]
+    seen_task_uuids = SeenTasks(ttl=60)
+    seen_task_uuids.update([tasks[0].uuid])
+
+    def run() -> int:
+        return runner._run_stage(
+            0,
+            runner.agents[0],
+            stage,
+            tasks,
+            project=MagicMock(),
+            retry_policy=NO_RETRIES,
+            task_batch_size=2,
+            max_tasks_per_stage=None,
+            max_workers=1,
+            prefetch_depth=0,
+            process_pool=None,
+            num_processes=None,
+            global_pbar=Progress(),
+            batch_pbar=Progress(),
+            seen_task_uuids=seen_task_uuids,
+        )
+
+    assert run() == 3
+    assert [task.proceed.called for task in tasks] == [False, True, True, True]  # type: ignore[attr-defined]
+    assert all(task.uuid in seen_task_uuids for task in tasks)
+    # Nothing new the second time around
+    assert run() == 0
+
+
+def test_seen_tasks_expire_while_new_tasks_keep_arriving() -> None:
+    now = [0.0]
+    seen = SeenTasks(ttl=10, clock=lambda: now[0])
+    failing = uuid4()
+    seen.update([failing])
+    for _ in range(100):
+        # Every poll executes new tasks, so the runner never backs off
+        now[0] += 1
+        seen.update([uuid4(), uuid4()])
+        if failing not in seen:
+            break
+    else:
+        pytest.fail("The failing task was never admitted again")
+    assert now[0] == 10
+    # Only the tasks of the last `ttl` seconds are kept
+    now[0] += 1000
+    seen.update([uuid4()])
+    assert len(seen) == 1
+
+
+def test_flushing_bundle_flushes_dependencies_first() -> None:
+    executed: list[str] = []
+    label_bundle = FlushingBundle(max_operations=10)
+    task_bundle = FlushingBundle(max_operations=2, dependencies=[label_bundle])
+    label_bundle.execute = lambda: executed.append("labels")  # type: ignore[method-assign]
+    with patch.object(Bundle, "execute", lambda self: executed.append("tasks")):
+        for _ in range(2):
+            task_bundle.add(MagicMock(), None, MagicMock(), limit=100)
+            task_bundle.flush_if_due()
+    assert executed == ["labels", "tasks"]
+    assert not task_bundle.flush_if_due()
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_execute_tasks_consumes_contexts_lazily(max_workers: int) -> None:
+    n_tasks = 9
+    consumed = 0
+    max_ahead = 0
+    executed = 0
+    lock = threading.Lock()
+
+    def agent(task: AgentTask) -> str:
+        nonlocal executed
+        with lock:
+            executed += 1
+        return "complete"
+
+    stage, contexts = _mock_stage_and_contexts(n_tasks)
+
+    def stream() -> Iterator[Context]:
+        nonlocal consumed, max_ahead
+        for context in contexts:
+            with lock:
+                consumed += 1
+                max_ahead = max(max_ahead, consumed - executed)
+            yield context
+
+    SequentialRunner._execute_tasks(
+        stream(), RunnerAgent("stage", agent), stage, retry_policy=NO_RETRIES, max_workers=max_workers
+    )
+    assert all(context.task.proceed.called for context in contexts)  # type: ignore[union-attr]
+    assert max_ahead <= max_workers
+
+
+def test_call_with_timeout() -> None:
+    assert call_with_timeout(lambda x: x + 1, {"x": 1}, timeout=1) == 2
+    with pytest.raises(ZeroDivisionError):
+        call_with_timeout(lambda: 1 / 0, {}, timeout=1)
+    release = threading.Event()
+    with pytest.raises(TaskTimeoutError):
+        call_with_timeout(release.wait, {}, timeout=0.01)
+    release.set()
+
+
+def test_timed_out_attempt_is_retried_and_dependencies_cleaned_up() -> None:
+    release = threading.Event()
+    first_cleaned_up = threading.Event()
+    resources: list[list[str]] = []
+    cleaned_up: list[int] = []
+
+    def dep_resource() -> Iterator[list[str]]:
+        resource = [f"resource {len(resources)}"]
+        resources.append(resource)
+        yield resource
+        cleaned_up.append(resources.index(resource))
+        if resource is resources[0]:
+            first_cleaned_up.set()
+
+    def agent(resource: Annotated[list[str], Depends(dep_resource)]) -> str:
+        if resource is resources[0]:
+            release.wait()
+            # The resource must still be usable when the abandoned attempt finally gets to it
+            resource.append("used")
+        return "complete"
+
+    stage, contexts = _mock_stage_and_contexts(1)
+    SequentialRunner._execute_tasks(
+        contexts,
+        RunnerAgent("stage", agent),
+        stage,
+        retry_policy=RetryPolicy(max_retries=1, initial_delay=0),
+        task_timeout=0.05,
+    )
+    # The retry got dependencies of its own, the ones of the abandoned attempt are still alive
+    assert len(resources) == 2
+    assert cleaned_up == [1]
+    assert contexts[0].task.proceed.called  # type: ignore[union-attr]
+
+    release.set()
+    assert first_cleaned_up.wait(timeout=5)
+    assert resources[0] == ["resource 0", "used"]
+    assert sorted(cleaned_up) == [0, 1]
+
+
+def test_async_runner_abandons_timed_out_sync_agents_without_blocking() -> None:
+    release = threading.Event()
+    first_cleaned_up = threading.Event()
+    resources: list[list[str]] = []
+    cleaned_up: list[int] = []
+
+    async def dep_resource() -> AsyncIterator[list[str]]:
+        resource = [f"resource {len(resources)}"]
+        resources.append(resource)
+        yield resource
+        cleaned_up.append(resources.index(resource))
+        if resource is resources[0]:
+            first_cleaned_up.set()
+
+    def agent(resource: Annotated[list[str], Depends(dep_resource)]) -> str:
+        if resource is resources[0]:
+            release.wait()
+            resource.append("used")
+        return "complete"
+
+    stage, contexts = _mock_stage_and_contexts(1)
+    started = time.monotonic()
+    AsyncRunner._execute_tasks(
+        contexts,
+        RunnerAgent("stage", agent),
+        stage,
+        retry_policy=RetryPolicy(max_retries=1, initial_delay=0),
+        task_timeout=0.05,
+    )
+    # The hung call doesn't keep the event loop from shutting down
+    assert time.monotonic() - started < 2
+    assert len(resources) == 2
+    assert cleaned_up == [1]
+    assert contexts[0].task.proceed.called  # type: ignore[union-attr]
+
+    release.set()
+    # Cleaned up by the abandoned thread, after the event loop of the batch was closed
+    assert first_cleaned_up.wait(timeout=5)
+    assert resources[0] == ["resource 0", "used"]
+    assert sorted(cleaned_up) == [0, 1]
+
+
+def test_call_with_timeout_cleans_up_after_abandoned_call() -> None:
+    release = threading.Event()
+    cleaned_up = threading.Event()
+    with pytest.raises(TaskTimeoutError):
+        call_with_timeout(release.wait, {}, timeout=0.01, cleanup=cleaned_up.set)
+    assert not cleaned_up.is_set()
+    release.set()
+    assert cleaned_up.wait(timeout=5)
+
+    cleanups: list[int] = []
+    assert call_with_timeout(lambda: 1, {}, timeout=1, cleanup=lambda: cleanups.append(1)) == 1
+    with pytest.raises(ZeroDivisionError):
+        call_with_timeout(lambda: 1 / 0, {}, timeout=None, cleanup=lambda: cleanups.append(2))
+    assert cleanups == [1, 2]
+
+
+def test_async_runner_cancels_timed_out_agents() -> None:
+    runner = AsyncRunner()
+    cancelled = False
+
+    @runner.stage(stage="Yep", task_timeout=0.05)
+    async def agent(task: AgentTask) -> str:
+        nonlocal cancelled
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        return "complete"
+
+    stage, contexts = _mock_stage_and_contexts(2)
+    runner._execute_tasks(
+        contexts, runner.agents[0], stage, retry_policy=NO_RETRIES, task_timeout=runner.agents[0].task_timeout
+    )
+    assert cancelled
+    assert not any(context.task.proceed.called for context in contexts)  # type: ignore[union-attr]
+
+
+def test_retry_policy_backoff() -> None:
+    policy = RetryPolicy(max_retries=3, initial_delay=1.0, multiplier=2.0, max_delay=3.0, jitter=0.0)
+    assert [policy.next_delay(ValueError(), retry, elapsed=0) for retry in range(4)] == [1.0, 2.0, 3.0, None]
+    assert RetryPolicy(jitter=0.0, max_elapsed=2.5).next_delay(ValueError(), 1, elapsed=1.0) is None
+    assert 0.5 <= RetryPolicy(initial_delay=1.0, jitter=0.5).get_delay(0) <= 1.0
+    # Rate limits ask for a longer delay
+    assert RetryPolicy(jitter=0.0).get_delay(0, RateLimitExceededError(retry_after=10)) == 10
+
+    transient = RetryPolicy(retry_on=is_transient_error)
+    assert transient.next_delay(RateLimitExceededError(), 0, elapsed=0) is not None
+    assert transient.next_delay(ConnectionError(), 0, elapsed=0) is not None
+    assert transient.next_delay(ValueError(), 0, elapsed=0) is None
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_retries_do_not_block_other_tasks(max_workers: int) -> None:
+    order: list[str] = []
+    lock = threading.Lock()
+    failed = False
+
+    def agent(task: AgentTask) -> str:
+        nonlocal failed
+        with lock:
+            if task.data_title == "flaky" and not failed:
+                failed = True
+                order.append("flaky failed")
+                raise RuntimeError("Overloaded")
+            order.append(task.data_title)
+        return "complete"
+
+    stage, contexts = _mock_stage_and_contexts(4)
+    for i, context in enumerate(contexts):
+        assert context.task
+        context.task.data_title = "flaky" if i == 0 else f"task {i}"
+
+    SequentialRunner._execute_tasks(
+        contexts,
+        RunnerAgent("stage", agent),
+        stage,
+        retry_policy=RetryPolicy(max_retries=1, initial_delay=0.2, jitter=0.0),
+        max_workers=max_workers,
+    )
+    assert order[0] == "flaky failed"
+    assert order[-1] == "flaky"
+    assert sorted(order[1:-1]) == ["task 1", "task 2", "task 3"]
+    assert all(context.task.proceed.called for context in contexts)  # type: ignore[union-attr]
+
+
+def test_dependency_plan_is_compiled_once_and_flattened() -> None:
+    calls: list[str] = []
+    teardowns: list[str] = []
+
+    def dep_shared(task: AgentTask) -> str:
+        calls.append("shared")
+        return str(task.uuid)
+
+    def dep_gen(shared: Annotated[str, Depends(dep_shared)]) -> Iterator[str]:
+        calls.append("gen")
+        yield f"gen-{shared}"
+        teardowns.append("gen")
+
+    def dep_outer(
+        shared: Annotated[str, Depends(dep_shared)], gen: Annotated[str, Depends(dep_gen)]
+    ) -> tuple[str, str]:
+        calls.append("outer")
+        return shared, gen
+
+    def agent(
+        task: AgentTask,
+        outer: Annotated[tuple[str, str], Depends(dep_outer)],
+        shared: Annotated[str, Depends(dep_shared)],
+    ) -> None: ...
+
+    runner_agent = RunnerAgent(identity="stage", callable=agent)
+    plan = runner_agent.dependant.plan
+    assert plan is not None
+    assert [step.func for step in plan.steps] == [dep_shared, dep_gen, dep_outer]
+
+    _, [context] = _mock_stage_and_contexts(1)
+    task = context.task
+    assert task is not None
+    with ExitStack() as stack:
+        solved = solve_dependencies(context=context, dependant=runner_agent.dependant, stack=stack)
+        assert teardowns == []
+    assert teardowns == ["gen"]
+    assert calls == ["shared", "gen", "outer"]
+    assert solved.values["task"] is task
+    assert solved.values["shared"] == str(task.uuid)
+    assert solved.values["outer"] == (str(task.uuid), f"gen-{task.uuid}")
+    assert runner_agent.dependant.plan is plan
+
+
+def test_scoped_dependencies_are_shared_and_torn_down_at_scope_end() -> None:
+    calls: dict[str, int] = {"process": 0, "stage": 0, "batch": 0, "task": 0}
+    torn_down: list[str] = []
+
+    def make_dep(scope: str) -> Callable[[], Iterator[str]]:
+        def dep() -> Iterator[str]:
+            calls[scope] += 1
+            yield scope
+            torn_down.append(scope)
+
+        return dep
+
+    dep_process, dep_stage, dep_batch, dep_task = (make_dep(s) for s in ("process", "stage", "batch", "task"))
+
+    def agent(
+        process: Annotated[str, Depends(dep_process, scope="process")],
+        stage: Annotated[str, Depends(dep_stage, scope="stage")],
+        batch: Annotated[str, Depends(dep_batch, scope="batch")],
+        task: Annotated[str, Depends(dep_task)],
+    ) -> None: ...
+
+    runner_agent = RunnerAgent(identity="stage", callable=agent)
+    stage, contexts = _mock_stage_and_contexts(8)
+    try:
+        for batch in (contexts[:4], contexts[4:]):
+            SequentialRunner._execute_tasks(batch, runner_agent, stage, retry_policy=NO_RETRIES, max_workers=4)
+            runner_agent.scopes["batch"].close()
+        assert calls == {"process": 1, "stage": 1, "batch": 2, "task": 8}
+        assert torn_down.count("task") == 8
+        assert torn_down.count("batch") == 2
+        assert "stage" not in torn_down
+
+        runner_agent.scopes["stage"].close()
+        assert torn_down.count("stage") == 1
+        assert "process" not in torn_down
+    finally:
+        PROCESS_SCOPE.close()
+    assert torn_down.count("process") == 1
+
+
+def test_async_scoped_dependencies_are_solved_once_by_concurrent_tasks() -> None:
+    calls = 0
+    torn_down = 0
+
+    async def dep_batch() -> AsyncIterator[str]:
+        nonlocal calls, torn_down
+        calls += 1
+        # Every task of the batch asks for the dependency while it's being solved
+        await asyncio.sleep(0.05)
+        yield "batch"
+        torn_down += 1
+
+    async def agent(batch: Annotated[str, Depends(dep_batch, scope="batch")]) -> str:
+        return "complete"
+
+    stage, contexts = _mock_stage_and_contexts(4)
+    AsyncRunner._execute_tasks(contexts, RunnerAgent("stage", agent), stage, retry_policy=NO_RETRIES)
+
+    assert calls == 1 and torn_down == 1
+    assert all(context.task.proceed.called for context in contexts)  # type: ignore[union-attr]
+
+
+def test_invalid_dependency_scopes() -> None:
+    def dep_task_scoped() -> str:
+        return "task"
+
+    def dep_uses_task(task: AgentTask) -> str:
+        return str(task.uuid)
+
+    def dep_uses_shorter(value: Annotated[str, Depends(dep_task_scoped)]) -> str:
+        return value
+
+    async def dep_async_gen() -> AsyncIterator[str]:
+        yield "value"
+
+    def agent_task_field(value: Annotated[str, Depends(dep_uses_task, scope="stage")]) -> None: ...
+
+    def agent_shorter_scope(value: Annotated[str, Depends(dep_uses_shorter, scope="batch")]) -> None: ...
+
+    async def dep_async() -> str:
+        return "value"
+
+    def agent_async_gen(value: Annotated[str, Depends(dep_async_gen, scope="process")]) -> None: ...
+
+    def agent_async(value: Annotated[str, Depends(dep_async, scope="stage")]) -> None: ...
+
+    def agent_conflicting_scopes(
+        a: Annotated[str, Depends(dep_task_scoped)], b: Annotated[str, Depends(dep_task_scoped, scope="stage")]
+    ) -> None: ...
+
+    for agent in (agent_task_field, agent_shorter_scope, agent_async_gen, agent_async, agent_conflicting_scopes):
+        with pytest.raises(ValueError):
+            RunnerAgent(identity="stage", callable=agent)
+
+    with pytest.raises(ValueError):
+        Depends(dep_task_scoped, scope="forever")  # type: ignore[arg-type]
+
+
+def test_batch_agent_receives_lists() -> None:
+    calls: list[list[str]] = []
+
+    def dep_task_uuid(task: AgentTask) -> str:
+        return str(task.uuid)
+
+    def dep_shared() -> str:
+        return "shared"
+
+    def agent(
+        tasks: list[AgentTask],
+        stage: AgentStage,
+        task_uuids: Annotated[list[str], Depends(dep_task_uuid)],
+        shared: Annotated[str, Depends(dep_shared, scope="batch")],
+    ) -> list[str]:
+        assert shared == "shared"
+        assert isinstance(stage, MagicMock)
+        assert task_uuids == [str(task.uuid) for task in tasks]
+        calls.append(task_uuids)
+        return ["complete"] * len(tasks)
+
+    stage, contexts = _mock_stage_and_contexts(5)
+    runner_agent = RunnerAgent(identity="stage", callable=agent, batch=True, max_batch_size=2)
+    assert set(runner_agent.dependant.batch_params) == {"tasks", "task_uuids"}
+
+    SequentialRunner._execute_batch_agent(contexts, runner_agent, stage, retry_policy=NO_RETRIES)
+
+    assert [len(batch) for batch in calls] == [2, 2, 1]
+    for context in contexts:
+        assert context.task is not None
+        proceed = cast(MagicMock, context.task.proceed)
+        proceed.assert_called_once()
+        assert proceed.call_args.kwargs["pathway_name"] == "complete"
+
+
+def test_batch_agent_validation() -> None:
+    def agent_without_list(task: AgentTask) -> list[str]:
+        return []
+
+    with pytest.raises(ValueError):
+        RunnerAgent(identity="stage", callable=agent_without_list, batch=True)
+
+    def agent_wrong_length(tasks: list[AgentTask]) -> list[str]:
+        return ["complete"]
+
+    stage, contexts = _mock_stage_and_contexts(2)
+    with pytest.raises(PrintableError):
+        SequentialRunner._execute_batch_agent(
+            contexts, RunnerAgent(identity="stage", callable=agent_wrong_length, batch=True), stage, NO_RETRIES
+        )
+
+    runner = SequentialRunner()
+    with pytest.raises(PrintableError):
+
+        @runner.stage(stage="Yep", batch=True, max_batch_size=0)
+        def agent(tasks: list[AgentTask]) -> list[str]:
+            return []
+
+
+def test_batch_dependencies_are_solved_once_per_chunk() -> None:
+    batch_calls: list[int] = []
+    torn_down: list[int] = []
+    received: dict[str, str] = {}
+
+    def dep_prefix(task: AgentTask) -> str:
+        return "uuid-"
+
+    def dep_uuids(tasks: list[AgentTask], prefixes: Annotated[list[str], Depends(dep_prefix)]) -> Iterator[list[str]]:
+        batch_calls.append(len(tasks))
+        yield [prefix + str(task.uuid) for prefix, task in zip(prefixes, tasks)]
+        torn_down.append(len(tasks))
+
+    def agent(task: AgentTask, task_uuid: Annotated[str, BatchDepends(dep_uuids)]) -> str:
+        received[str(task.uuid)] = task_uuid
+        return "complete"
+
+    runner_agent = RunnerAgent(identity="stage", callable=agent)
+    stage, contexts = _mock_stage_and_contexts(5)
+    SequentialRunner._execute_tasks(
+        contexts, runner_agent, stage, retry_policy=NO_RETRIES, max_workers=2, label_bundle_size=2
+    )
+    assert batch_calls == [2, 2, 1]
+    assert received == {str(c.task.uuid): f"uuid-{c.task.uuid}" for c in contexts if c.task}
+    # Torn down with the batch scope
+    assert torn_down == []
+    runner_agent.scopes["batch"].close()
+    assert sorted(torn_down) == [1, 2, 2]
+
+    # Outside of a runner, it's a batch of one
+    _, [context] = _mock_stage_and_contexts(1)
+    with ExitStack() as stack:
+        solved = solve_dependencies(context=context, dependant=runner_agent.dependant, stack=stack)
+    assert context.task is not None
+    assert solved.values["task_uuid"] == f"uuid-{context.task.uuid}"
+    assert batch_calls[-1] == 1
+
+
+def test_batch_agent_with_batch_dependency() -> None:
+    batch_calls: list[int] = []
+
+    def dep_doubled(tasks: list[AgentTask]) -> list[str]:
+        batch_calls.append(len(tasks))
+        return [str(task.uuid) * 2 for task in tasks]
+
+    def agent(tasks: list[AgentTask], doubled: Annotated[list[str], BatchDepends(dep_doubled)]) -> list[None]:
+        assert doubled == [str(task.uuid) * 2 for task in tasks]
+        return [None] * len(tasks)
+
+    stage, contexts = _mock_stage_and_contexts(4)
+    runner_agent = RunnerAgent(identity="stage", callable=agent, batch=True)
+    SequentialRunner._execute_batch_agent(contexts, runner_agent, stage, retry_policy=NO_RETRIES)
+    assert batch_calls == [4]
+
+
+def _agent_task() -> AgentTask:
+    return AgentTask(
+        uuid=uuid4(),
+        created_at=datetime.now(),
+        updated_at=datetime.now(),
+        status=AgentTaskStatus.NEW,
+        data_hash=uuid4(),
+        data_title="title",
+        label_branch_name="main",
+        assignee=None,
+        last_actioned_by=None,
+    )
+
+
+def test_task_from_spec() -> None:
+    workflow_client = MagicMock()
+    stage = AgentStage(_workflow_client=workflow_client, uuid=uuid4(), title="Agent", pathways=[])
+    task = _agent_task()
+    workflow_client.get_tasks.return_value = [AgentTask.model_validate_json(task.model_dump_json())]
+    # How the installed version of encord sets up the tasks it lists
+    listed = next(iter(stage.get_tasks()))
+
+    rebuilt = task_from_spec(task.model_dump_json(), stage)
+
+    assert rebuilt.model_dump() == listed.model_dump()
+    assert rebuilt._stage_uuid == listed._stage_uuid == stage.uuid
+    assert rebuilt._workflow_client is listed._workflow_client is workflow_client
+    # Older versions of encord don't set up the issues of the tasks they list
+    if listed._task_issues is not None:
+        assert rebuilt._task_issues is not None
+        assert vars(rebuilt._task_issues).keys() == vars(listed._task_issues).keys()
+        assert (rebuilt._task_issues._project_uuid, rebuilt._task_issues._data_uuid) == (
+            listed._task_issues._project_uuid,
+            listed._task_issues._data_uuid,
+        )
+    rebuilt.proceed(pathway_name="complete")
+    assert workflow_client.action.call_args.args[0] == stage.uuid
+    # Specs with just the task config fields are rebuilt as well
+    config = task_from_spec(task_spec_json(encode_task_config(task)), stage)
+    assert (config.uuid, config.data_hash, config.data_title) == (task.uuid, task.data_hash, task.data_title)
+    config.proceed(pathway_name="complete")
+    assert workflow_client.action.call_args.args[1].task_uuid == task.uuid
+    with pytest.raises(ValidationError):
+        task_from_spec('{"uuid": "not a task"}', stage)
+    # Fails loudly if a later version of encord sets up tasks differently
+    with patch.dict(AgentTask.__private_attributes__):
+        del AgentTask.__private_attributes__["_task_issues"]
+        with pytest.raises(PrintableError, match="_task_issues"):
+            task_from_spec(task.model_dump_json(), stage)
+
+
+def _mock_queue_runner(tasks: list[AgentTask], **kwargs: Any) -> tuple[QueueRunner, AgentStage, MagicMock]:
+    workflow_client = MagicMock()
+    pathways = [AgentPathway(uuid=uuid4(), name="complete", destination_uuid=uuid4())]
+    stage = AgentStage(_workflow_client=workflow_client, uuid=uuid4(), title="Agent", pathways=pathways)
+    specs = {task.data_hash: task.model_dump_json() for task in tasks}
+    workflow_client.get_tasks.side_effect = lambda stage_uuid, params, type_: [
+        AgentTask.model_validate_json(specs[data_hash]) for data_hash in params.data_hashes if data_hash in specs
+    ]
+    project = MagicMock()
+    project.project_type = ProjectType.WORKFLOW
+    project.workflow.stages = [stage]
+    project.workflow.get_stage.return_value = stage
+    client = MagicMock()
+    client.get_project.return_value = project
+    with patch("encord_agents.tasks.runner.runner_base.get_user_client", return_value=client):
+        runner = QueueRunner(project_hash=uuid4(), **kwargs)
+    return runner, stage, workflow_client
+
+
+def _proceeded(workflow_client: MagicMock) -> dict[UUID, Bundle | None]:
+    return {call.args[1].task_uuid: call.kwargs["bundle"] for call in workflow_client.action.call_args_list}
+
+
+def test_queue_batch_reports_every_task_in_order(caplog: pytest.LogCaptureFixture) -> None:
+    tasks = [_agent_task() for _ in range(4)]
+    # Not in the stage anymore
+    gone = tasks.pop()
+    # Replaced by another task of the same data unit
+    replaced = tasks[0].model_copy(update={"uuid": uuid4()})
+    runner, stage, workflow_client = _mock_queue_runner(tasks)
+
+    @runner.stage("Agent")
+    def agent(task: AgentTask) -> str:
+        if task.uuid == tasks[1].uuid:
+            raise ValueError("Agent failed")
+        return "complete"
+
+    assert agent.batch([]) == []
+
+    specs = [
+        tasks[2].model_dump_json(),
+        task_spec_json(encode_task_config(gone)),
+        tasks[1].model_dump_json(),
+        tasks[0].model_dump_json(),
+        replaced.model_dump_json(),
+    ]
+    results = [TaskCompletionResult.model_validate_json(r) for r in agent.batch(specs)]
+
+    assert [r.task_uuid for r in results] == [tasks[2].uuid, gone.uuid, tasks[1].uuid, tasks[0].uuid, replaced.uuid]
+    assert [r.success for r in results] == [True, False, False, True, False]
+    assert results[1].error == results[4].error == "Failed to obtain task from Encord"
+    assert f"Task {gone.uuid} is no longer in stage" in caplog.text
+    assert results[2].error is not None and "Agent failed" in results[2].error
+    assert results[0].pathway == results[3].pathway == stage.pathways[0].uuid
+    # Proceeded in a bundle
+    proceeded = _proceeded(workflow_client)
+    assert set(proceeded) == {tasks[0].uuid, tasks[2].uuid}
+    assert all(bundle is not None for bundle in proceeded.values())
+    # The tasks of all specs are looked up at once
+    assert workflow_client.get_tasks.call_count == 1
+
+
+def test_queue_runner_rebuilds_tasks_without_verification() -> None:
+    task = _agent_task()
+    runner, stage, workflow_client = _mock_queue_runner([], verify_task_specs=False)
+    seen: list[AgentTask] = []
+
+    @runner.stage("Agent")
+    def agent(task: AgentTask) -> str:
+        seen.append(task)
+        return "complete"
+
+    config_spec = task_spec_json(encode_task_config(AgentTaskConfig.model_validate_json(task.model_dump_json())))
+    results = [TaskCompletionResult.model_validate_json(agent(spec)) for spec in [task.model_dump_json(), config_spec]]
+    results.append(decode_result(agent(encode_task_config(task))))
+
+    assert all(result.success and result.pathway == stage.pathways[0].uuid for result in results)
+    workflow_client.get_tasks.assert_not_called()
+    assert list(_proceeded(workflow_client)) == [task.uuid]
+    # Compact specs carry the whole task, like JSON specs
+    assert seen[2].model_dump() == seen[0].model_dump()
+
+
+def test_queue_batch_reports_own_outcome_when_bundle_fails() -> None:
+    tasks = [_agent_task() for _ in range(3)]
+    runner, stage, workflow_client = _mock_queue_runner(tasks)
+
+    def action(stage_uuid: UUID, action: Any, bundle: Bundle | None) -> None:
+        if bundle is None and action.task_uuid == tasks[1].uuid:
+            raise ValueError("Task left the stage")
+
+    workflow_client.action.side_effect = action
+
+    @runner.stage("Agent")
+    def agent(task: AgentTask) -> str:
+        return "complete"
+
+    with patch.object(FlushingBundle, "execute", side_effect=ConnectionError("Bundle failed")):
+        results = [
+            TaskCompletionResult.model_validate_json(r) for r in agent.batch([t.model_dump_json() for t in tasks])
+        ]
+
+    assert [r.success for r in results] == [True, False, True]
+    assert results[1].error is not None and "Task left the stage" in results[1].error
+    # Proceeded one by one after the bundle failed
+    unbundled = [
+        call.args[1].task_uuid for call in workflow_client.action.call_args_list if call.kwargs["bundle"] is None
+    ]
+    assert unbundled == [task.uuid for task in tasks]
+
+
+def _mock_producer_runner(n_tasks: int) -> tuple[MagicMock, MagicMock]:
+    stage = MagicMock(spec=AgentStage)
+    stage.uuid = uuid4()
+    tasks = [_agent_task() for _ in range(n_tasks)]
+    stage.get_tasks.side_effect = lambda: iter(tasks)
+    runner = MagicMock()
+    runner.get_agent_stages.side_effect = lambda: iter([stage])
+    return runner, stage
+
+
+def test_producer_deduplicates_and_respects_max_outstanding() -> None:
+    runner, stage = _mock_producer_runner(5)
+    tasks = list(stage.get_tasks())
+    sink = InMemorySink()
+    producer = QueueProducer(runner, sink, max_outstanding=3)
+
+    assert producer.produce() == 3
+    # Tasks in flight are not queued again, and there is no room for more
+    assert producer.produce() == 0
+    assert producer.outstanding == 3
+
+    queued = [sink.get(timeout=0) for _ in range(3)]
+    assert sink.get(timeout=0) is None
+    assert [q.task_uuid for q in queued if q is not None] == [t.uuid for t in tasks[:3]]
+    assert all(q is not None and q.stage_uuid == stage.uuid for q in queued)
+
+    result = TaskCompletionResult(task_uuid=tasks[0].uuid, stage_uuid=stage.uuid, success=True)
+    producer.mark_done(result.model_dump_json())
+    stage.get_tasks.side_effect = lambda: iter(tasks[1:])
+    assert producer.produce() == 1
+    queued_task = sink.get(timeout=0)
+    assert queued_task is not None and queued_task.task_uuid == tasks[3].uuid
+
+
+def test_producer_releases_tasks_that_left_the_stage_or_expired() -> None:
+    runner, stage = _mock_producer_runner(2)
+    tasks = list(stage.get_tasks())
+    producer = QueueProducer(runner, InMemorySink(), in_flight_ttl=60)
+
+    assert producer.produce() == 2
+    # The first task was completed by a worker, so it's not listed anymore
+    stage.get_tasks.side_effect = lambda: iter(tasks[1:])
+    assert producer.produce() == 0
+    assert producer.outstanding == 1
+
+    with patch("encord_agents.tasks.runner.producer.time.monotonic", return_value=time.monotonic() + 61):
+        assert producer.outstanding == 0
+        assert producer.produce() == 1
+
+
+def test_producer_forgets_done_tasks_that_left_the_stage_or_expired() -> None:
+    runner, stage = _mock_producer_runner(3)
+    tasks = list(stage.get_tasks())
+    producer = QueueProducer(runner, InMemorySink(), requeue_done=False, done_ttl=60)
+
+    assert producer.produce() == 3
+    for task in tasks:
+        producer.mark_done(task.uuid)
+    # Done tasks that are still in the stage, e.g., because the agent failed on them, are not queued again
+    assert producer.produce() == 0
+    stage.get_tasks.side_effect = lambda: iter(tasks[1:])
+    assert producer.produce() == 0
+    assert tasks[0].uuid not in producer._done and len(producer._done) == 2
+
+    with patch("encord_agents.tasks.runner.producer.time.monotonic", return_value=time.monotonic() + 61):
+        assert producer.produce() == 2
+
+
+def test_sqlite_sink(tmp_path: Path) -> None:
+    runner, stage = _mock_producer_runner(3)
+    sink = SQLiteSink(tmp_path / "queue.db")
+    producer = QueueProducer(runner, sink, in_flight_ttl=60)
+
+    assert producer.produce() == 3
+    assert len(sink) == 3
+    # A task that is still queued is not queued twice, also after it expired in the producer
+    with patch("encord_agents.tasks.runner.producer.time.monotonic", return_value=time.monotonic() + 61):
+        assert producer.produce() == 3
+    assert len(SQLiteSink(tmp_path / "queue.db")) == 3
+
+    first = sink.get()
+    assert first is not None and first.stage_uuid == stage.uuid
+    assert AgentTask.model_validate_json(first.task_spec).uuid == first.task_uuid
+    assert sink.get() is not None and sink.get() is not None
+    assert sink.get() is None
+
+    # Every connection is closed again
+    connections: list[sqlite3.Connection] = []
+    connect = sink._connect
+
+    def tracked_connect() -> sqlite3.Connection:
+        connections.append(connect())
+        return connections[-1]
+
+    with patch.object(sink, "_connect", tracked_connect):
+        sink.put(first)
+        assert len(sink) == 1
+        sink.get()
+    assert len(connections) == 3
+    for connection in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            connection.execute("SELECT 1")
+
+
+def test_producer_validation() -> None:
+    runner, _ = _mock_producer_runner(0)
+    with pytest.raises(ValueError):
+        QueueProducer(runner, InMemorySink(), max_outstanding=0)
+    with pytest.raises(ValueError):
+        QueueProducer(runner, InMemorySink(), in_flight_ttl=0)
+    with pytest.raises(ValueError):
+        QueueProducer(runner, InMemorySink(), done_ttl=0)
+
+
+def test_run_local_pool_aggregates_results_and_restarts_crashed_workers(tmp_path: Path) -> None:
+    runner, stage = _mock_producer_runner(6)
+    tasks = list(stage.get_tasks())
+    pathway = uuid4()
+    crashed = tmp_path / "crashed"
+
+    def wrapper(json_str: str) -> str:
+        task = AgentTask.model_validate_json(json_str)
+        if task.uuid == tasks[2].uuid and not crashed.exists():
+            crashed.touch()
+            os._exit(3)
+        success = task.uuid != tasks[4].uuid
+        return TaskCompletionResult(
+            task_uuid=task.uuid,
+            stage_uuid=stage.uuid,
+            success=success,
+            pathway=pathway if success else None,
+            error=None if success else "failed",
+        ).model_dump_json()
+
+    runner.create_producer.side_effect = partial(QueueProducer, runner)
+    runner._wrappers = {stage.uuid: wrapper}
+    runner.agents = []
+
+    # The tasks stay in the stage, but every task is executed once
+    summary = run_local_pool(runner, 2, max_outstanding=3, poll_interval=0.1, run_forever=False)
+
+    assert summary.succeeded == 4 and summary.total == 6
+    assert summary.pathways == {pathway: 4}
+    assert {result.task_uuid for result in summary.failed} == {tasks[2].uuid, tasks[4].uuid}
+    crash_result = next(result for result in summary.failed if result.task_uuid == tasks[2].uuid)
+    assert crash_result.error is not None and "exit code 3" in crash_result.error
+    assert summary.worker_restarts == 1
+
+
+def test_compact_task_config_round_trip() -> None:
+    task = _agent_task()
+    task.data_title = "bildë.jpg"
+    task.assignee = "annotator@encord.com"
+
+    message = encode_task_config(task)
+
+    assert is_compact(message) and not is_compact(task.model_dump_json())
+    assert len(message) < len(task.model_dump_json()) / 2
+    # All fields are kept, like in the JSON spec
+    assert decode_task(message) == AgentTask.model_validate_json(task.model_dump_json())
+    assert task_spec_json(message) == AgentTask.model_validate_json(task.model_dump_json()).model_dump_json()
+    config = decode_task_config(message)
+    assert config == AgentTaskConfig.model_validate_json(task.model_dump_json())
+    # Task configs keep just their fields
+    config_message = encode_task_config(config)
+    assert decode_task(config_message) == config
+    assert AgentTaskConfig.model_validate_json(task_spec_json(config_message)) == config
+    assert task_spec_json(task.model_dump_json().encode()) == task.model_dump_json()
+    with pytest.raises(ValueError):
+        decode_task_config(message[:-1])
+    with pytest.raises(ValueError):
+        decode_task_config(encode_result(TaskCompletionResult(task_uuid=task.uuid, success=True)))
+
+
+@pytest.mark.parametrize(
+    "result",
+    [
+        TaskCompletionResult(task_uuid=uuid4(), stage_uuid=uuid4(), success=True, pathway=uuid4()),
+        TaskCompletionResult(task_uuid=uuid4(), success=True),
+        TaskCompletionResult(task_uuid=uuid4(), stage_uuid=uuid4(), success=False, error="Traceback: ✗"),
+    ],
+)
+def test_compact_result_round_trip(result: TaskCompletionResult) -> None:
+    message = encode_result(result)
+
+    assert decode_result(message) == result
+    # JSON is detected as well
+    assert decode_result(result.model_dump_json()) == result
+
+
+def test_compact_result_truncates_errors() -> None:
+    error = "Traceback (most recent call last):\n" + "  frame\n" * 1000 + "ValueError: the actual error"
+    result = TaskCompletionResult(task_uuid=uuid4(), success=False, error=error)
+    stored: dict[str, str] = {}
+
+    def store_error(task_uuid: UUID, full_error: str) -> str:
+        stored[str(task_uuid)] = full_error
+        return f"s3://errors/{task_uuid}"
+
+    decoded = decode_result(encode_result(result, max_error_bytes=100, store_error=store_error))
+
+    assert decoded.error is not None
+    assert decoded.error.startswith(TRUNCATION_MARKER)
+    assert "ValueError: the actual error" in decoded.error
+    assert decoded.error.endswith(f"Full error: s3://errors/{result.task_uuid}")
+    assert stored == {str(result.task_uuid): error}
+    # Short errors are kept and not stored
+    short = TaskCompletionResult(task_uuid=uuid4(), success=False, error="short")
+    assert decode_result(encode_result(short, max_error_bytes=100, store_error=store_error)) == short
+    assert len(stored) == 1
+
+
+def test_producer_queues_compact_task_specs(tmp_path: Path) -> None:
+    runner, stage = _mock_producer_runner(2)
+    tasks = list(stage.get_tasks())
+    sink = SQLiteSink(tmp_path / "queue.db")
+
+    assert QueueProducer(runner, sink, compact=True).produce() == 2
+
+    queued_task = sink.get()
+    assert queued_task is not None and is_compact(queued_task.task_spec)
+    assert decode_task_config(queued_task.task_spec).task_uuid == tasks[0].uuid